@@ -0,0 +1,43 @@
+import glob
+import os
+import sys
+import timeit
+
+sys.path.insert(0, "src")
+
+from eculib import honda
+from rom import checksum
+
+images = []
+for f in sorted(glob.glob(os.path.join("bins", "*", "*.bin"))):
+    with open(f, "rb") as fbin:
+        images.append(bytearray(fbin.read()))
+nbyts = sum(len(b) for b in images)
+
+
+def bench(name, fn, number=5):
+    t = min(timeit.repeat(fn, number=number, repeat=3)) / number
+    print("%-44s %10.4fms" % (name, t * 1000))
+    return t
+
+
+for a, b in zip(images, images):
+    assert honda.checksum8bitHonda(a) == checksum.checksum8bitHonda(b)
+    assert honda.checksum8bit(a) == checksum.checksum8bit(b)
+
+print("%d images, %.1fMB" % (len(images), nbyts / 1e6))
+t0 = bench("eculib checksum8bitHonda", lambda: [honda.checksum8bitHonda(b) for b in images])
+t1 = bench("rom.checksum checksum8bitHonda", lambda: [checksum.checksum8bitHonda(b) for b in images])
+print("speedup: %.1fx" % (t0 / t1))
+t0 = bench("eculib do_validation (fix)",
+           lambda: [honda.do_validation(bytearray(b), len(b), len(b) - 8) for b in images], number=1)
+t1 = bench("rom.checksum do_validation (fix)",
+           lambda: [checksum.do_validation(bytearray(b), len(b), len(b) - 8) for b in images], number=1)
+print("speedup: %.1fx" % (t0 / t1))
+
+rom = bytearray(images[0])
+prefix = checksum.PrefixSums(rom)
+bench("rom.checksum PrefixSums range checksum", lambda: prefix.checksum(0x4000, len(rom) - 8), number=1000)
+running = checksum.RunningChecksum(rom, len(rom) - 8)
+bench("rom.checksum RunningChecksum 7 byte patch",
+      lambda: (running.patch(0x100, b"ABCDEFG"), running.fix()), number=1000)
@@ -0,0 +1,10 @@
+import os
+import sys
+
+sys.path.insert(0, "src")
+
+from rom.catalog import CATALOG_FILE, BinCatalog, build_catalog
+
+catalog = BinCatalog(build_catalog("bins"))
+catalog.save(os.path.join("bins", CATALOG_FILE))
+print("%d images catalogued" % len(catalog))
@@ -0,0 +1,39 @@
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, "src")
+
+from rom.pack import CHUNK_RAW, PACK_FILE, PackStore, build_pack
+
+path = os.path.join("bins", PACK_FILE)
+nimages, nchunks = build_pack("bins", path)
+rawsize = sum(os.path.getsize(f) for f in glob.glob(os.path.join("bins", "*", "*")))
+print("%d images, %d unique chunks, %.1fMB -> %.1fMB" % (nimages, nchunks, rawsize / 1e6,
+                                                         os.path.getsize(path) / 1e6))
+
+with PackStore(path) as pack:
+    nraw = sum(1 for chunk in pack.chunks if chunk[3] == CHUNK_RAW)
+    print("%d zlib chunks, %d raw chunks" % (nchunks - nraw, nraw))
+    t = time.time()
+    for name in pack.names():
+        with open(os.path.join("bins", *name.split("/")), "rb") as fbin:
+            assert fbin.read() == pack.read_image(name), name
+    print("verified in %.3fs" % (time.time() - t))
+    traw = []
+    tpack = []
+    for name in pack.names():
+        t = time.perf_counter()
+        with open(os.path.join("bins", *name.split("/")), "rb") as fbin:
+            fbin.read()
+        traw.append(time.perf_counter() - t)
+        pack.cache.clear()
+        t = time.perf_counter()
+        pack.read_image(name)
+        tpack.append(time.perf_counter() - t)
+    print("per image read: raw files mean %.0fus max %.0fus, pack mean %.0fus max %.0fus" % (
+        1e6 * sum(traw) / len(traw), 1e6 * max(traw), 1e6 * sum(tpack) / len(tpack), 1e6 * max(tpack)))
+    slowest = max(range(len(tpack)), key=lambda i: tpack[i])
+    print("slowest from pack: %s (%.0fus, %.0fus raw)" % (pack.names()[slowest], 1e6 * tpack[slowest],
+                                                         1e6 * traw[slowest]))
@@ -0,0 +1,29 @@
+import argparse
+import sys
+import time
+
+sys.path.insert(0, "src")
+
+from datalog.store import SessionStore
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('store', help="session store (.sqlite)")
+    parser.add_argument('logs', nargs='*', help="datalog frame logs (.hdl) to import as new sessions")
+    parser.add_argument('--seek', type=float, nargs=2, metavar=("SESSION", "MINUTE"),
+                        help="print the frame count of one minute of a session")
+    args = parser.parse_args()
+
+    store = SessionStore(args.store)
+    for log in args.logs:
+        t0 = time.time()
+        session = store.import_framelog(log)
+        print("%s: session %d in %.2fs" % (log, session, time.time() - t0))
+    if args.seek:
+        t0 = time.time()
+        frames = store.seek(int(args.seek[0]), args.seek[1] * 60)
+        print("%d frames at minute %g in %.4fs" % (len(frames), args.seek[1], time.time() - t0))
+    for s in store.sessions():
+        print("%(id)d: %(frames)d frames, ecm id %(ecmid)s, pn %(pn)s, adapter %(adapter)s" % s)
+    store.close()
@@ -0,0 +1,29 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, "src")
+
+from datalog.bulk import write_columns, write_csv
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('log', help="recorded datalog frame log (.hdl)")
+    parser.add_argument('outdir', help="directory to write the decoded tables to")
+    parser.add_argument('--format', choices=["csv", "npy"], default="csv",
+                        help="one csv per table or one npy per channel")
+    parser.add_argument('--chunk', type=int, default=1 << 16, help="frames decoded at a time")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.outdir):
+        os.makedirs(args.outdir)
+    t0 = time.time()
+    if args.format == "csv":
+        written = {t: c for t, (_, c) in write_csv(args.log, args.outdir, args.chunk).items()}
+    else:
+        written = write_columns(args.log, args.outdir, args.chunk)
+    for t, c in sorted(written.items()):
+        print("table 0x%02x: %d frames" % (t, c))
+    print("%d frames decoded in %.2fs" % (sum(written.values()), time.time() - t0))
@@ -0,0 +1,32 @@
+import os
+import sys
+import tarfile
+
+sys.path.insert(0, "src")
+
+from rom.catalog import CATALOG_FILE, BinCatalog
+from rom.htf import read_htf, write_htf
+
+if len(sys.argv) < 4:
+    print("usage: %s tune.htf base-pn out.htf [--full]" % sys.argv[0])
+    sys.exit(1)
+
+catalog = BinCatalog.load(os.path.join("bins", CATALOG_FILE))
+entry = catalog.lookup_pn(sys.argv[2])
+if entry is None:
+    print("%s is not in the bins catalog" % sys.argv[2])
+    sys.exit(1)
+base = catalog.read(entry)
+try:
+    htf = read_htf(sys.argv[1], catalog)
+except (tarfile.ReadError, ValueError) as e:
+    print("%s: %s" % (sys.argv[1], e))
+    sys.exit(1)
+if htf is None:
+    print("%s is not a HondaECU tune file" % sys.argv[1])
+    sys.exit(1)
+binmod, metainfo = htf
+metainfo.pop("base", None)
+name = os.path.splitext(os.path.basename(sys.argv[3]))[0]
+write_htf(sys.argv[3], name, binmod, metainfo, base, entry, full="--full" in sys.argv[4:])
+print("%s: %d -> %d bytes" % (sys.argv[3], os.path.getsize(sys.argv[1]), os.path.getsize(sys.argv[3])))
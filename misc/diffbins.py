@@ -0,0 +1,39 @@
+import glob
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, "src")
+
+from ecmids import ECM_IDs
+from rom.catalog import pn_ecmid, pn_from_path
+from rom.diff import ROMDiff, ecm_regions, xdf_regions
+from xdf.loader import load_xdf
+from xdf.tables import ROMTables
+
+npairs = 0
+t0 = time.time()
+for model in sorted(glob.glob(os.path.join("bins", "*", ""))):
+    images = {}
+    for f in sorted(glob.glob(os.path.join(model, "*.bin"))):
+        with open(f, "rb") as fbin:
+            images[pn_from_path(f)] = fbin.read()
+    xdfs = glob.glob(os.path.join("xdfs", os.path.basename(os.path.dirname(model)), "*.xdf"))
+    xdfdef = load_xdf(xdfs[0]) if len(xdfs) > 0 else None
+    for (pa, a), (pb, b) in itertools.combinations(images.items(), 2):
+        regions = []
+        ecmid = pn_ecmid(pa, a)
+        if ecmid is not None:
+            regions += ecm_regions(ECM_IDs[ecmid])
+        if xdfdef is not None and len(a) == len(b):
+            try:
+                regions += xdf_regions(xdfdef, ROMTables(xdfdef, a))
+            except (TypeError, ValueError):
+                pass
+        s = ROMDiff(a, b, regions, merge_gap=4).summary()
+        npairs += 1
+        top = sorted(s["regions"].items(), key=lambda r: -r[1])[:3]
+        print("%-20s %-20s %5d ranges %8d bytes %8d unmapped  %s" % (pa, pb, s["ranges"], s["changed"], s["unmapped"],
+              ", ".join("%s (%d)" % r for r in top)))
+print("%d pairs in %.2fs" % (npairs, time.time() - t0))
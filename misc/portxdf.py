@@ -0,0 +1,39 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, "src")
+
+from rom.catalog import CATALOG_FILE, BinCatalog
+from xdf.loader import load_xdf
+from xdf.port import GramIndex, port_xdf, write_draft
+
+if len(sys.argv) < 4:
+    print("usage: %s source.xdf source-pn outdir [min-coverage]" % sys.argv[0])
+    sys.exit(1)
+
+catalog = BinCatalog.load(os.path.join("bins", CATALOG_FILE))
+source = catalog.lookup_pn(sys.argv[2])
+if source is None:
+    print("%s is not in the bins catalog" % sys.argv[2])
+    sys.exit(1)
+mincoverage = float(sys.argv[4]) if len(sys.argv) > 4 else .5
+xdfdef = load_xdf(sys.argv[1])
+with open(catalog.path(source), "rb") as fbin:
+    sbyts = fbin.read()
+if not os.path.exists(sys.argv[3]):
+    os.makedirs(sys.argv[3])
+
+t0 = time.time()
+for entry in catalog.images:
+    if entry is source or entry["size"] != source["size"]:
+        continue
+    with open(catalog.path(entry), "rb") as fbin:
+        found, total = port_xdf(xdfdef, sbyts, None, GramIndex(fbin.read()))
+    coverage = len(found) / total if total > 0 else 0
+    draft = None
+    if coverage >= mincoverage:
+        draft = os.path.join(sys.argv[3], "%s.xdf" % entry["pn"])
+        write_draft(sys.argv[1], draft, found, entry["pn"])
+    print("%-20s %3d/%3d %s" % (entry["pn"], len(found), total, draft or "-"))
+print("%.2fs" % (time.time() - t0))
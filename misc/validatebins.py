@@ -0,0 +1,34 @@
+import argparse
+import sys
+import time
+
+sys.path.insert(0, "src")
+
+from rom.report import find_images, validate_library, write_csv, write_json
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('dirs', nargs='*', default=["bins"], help="directories to scan for .bin images")
+    parser.add_argument('--json', help="write the report as json")
+    parser.add_argument('--csv', help="write the report as csv")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per cpu)")
+    args = parser.parse_args()
+
+    t0 = time.time()
+    report = validate_library(find_images(args.dirs), args.workers)
+    if args.json:
+        write_json(report, args.json)
+    if args.csv:
+        write_csv(report, args.csv)
+    bad = [r for r in report if r["error"] or not r["checksum_valid"] or r["size_ok"] is False
+           or r["ecmid_match"] is False]
+    for r in bad:
+        print("%-50s %s" % (r["file"], r["error"] or "checksum %s, size %s, ecm id %s" % (
+            "ok" if r["checksum_valid"] else "bad", r["size_ok"], r["ecmid_match"])))
+    # the ECM id, checksum address and map id all come from ecmids, which has no entry for these part numbers
+    unknown = sorted(set(r["pn"] for r in report if r["ecmid"] is None))
+    if len(unknown) > 0:
+        print("%d part numbers not in ECM_IDs: %s" % (len(unknown), ", ".join(unknown)))
+    print("%d images, %d with problems, %d duplicated, %.2fs" % (
+        len(report), len(bad), sum(1 for r in report if r["duplicates"]), time.time() - t0))
@@ -1,5 +1,6 @@
 import sys
 import argparse
+import multiprocessing
 
 from wx import App
 
@@ -8,6 +9,9 @@ from controlpanel import HondaECUControlPanel
 
 if __name__ == '__main__':
 
+    # the bin folder validation runs in a process pool, which frozen builds have to bootstrap
+    multiprocessing.freeze_support()
+
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('--noredirect', action='store_true', help="don't redirect stdout/stderr to gui")
     parser.add_argument('-V', '--version', action='store_true', help="show version information")
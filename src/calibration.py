@@ -0,0 +1,235 @@
+import math
+import time
+
+import numpy as np
+
+BURST = 200
+# share of requests allowed to fail after all their attempts
+TARGET_ERRORS = 0.001
+MARGIN = 1.5
+MIN_TIMEOUT = 0.02
+MAX_RETRIES = 5
+# the measurement burst waits this long so the whole latency tail is seen, not cut off by the current timeout
+PROBE_TIMEOUT = 1.0
+# a burst is abandoned after this many requests in a row fail outright
+MAX_FAILURES = 3
+# the verify burst is retried with a looser timeout at most this many times
+VERIFY_ROUNDS = 10
+KLINE_TRIES = 20
+# the chosen K-line value has to pass this many times more checks than the sweep ran
+KLINE_VERIFY = 5
+KLINE_WAITS = [0.0005, 0.001, 0.002, 0.005]
+KLINE_TIMEOUTS = [0.02, 0.05, 0.1, 0.2]
+
+
+def adapter_section(serial):
+    return "adapter %s" % serial
+
+
+def settings_section(config, serial):
+    # a calibrated adapter has its own section, anything it doesn't set falls back to DEFAULT
+    section = adapter_section(serial) if serial else None
+    return section if section is not None and config.has_section(section) else "DEFAULT"
+
+
+class Burst(object):
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.latencies = []
+        self.requests = 0
+        self.errors = 0
+        self.attempts = 0
+        self.failedattempts = 0
+        self.elapsed = 0.0
+
+    def add(self, ok, latency):
+        self.requests += 1
+        # a request that took longer than the timeout needed at least one more attempt inside the adapter
+        failed = int(latency // self.timeout) if ok else max(1, int(latency // self.timeout))
+        self.failedattempts += failed
+        self.attempts += failed + (1 if ok else 0)
+        if ok:
+            if failed == 0:
+                self.latencies.append(latency)
+        else:
+            self.errors += 1
+
+    def rate(self):
+        return self.requests / self.elapsed if self.elapsed > 0 else 0.0
+
+    def error_rate(self):
+        return self.errors / self.requests if self.requests > 0 else 1.0
+
+    def attempt_error_rate(self):
+        # smoothed so a clean burst still leaves some room for the failures it was too short to see
+        return (self.failedattempts + 1) / (self.attempts + 2)
+
+    def quantile(self, q):
+        return float(np.quantile(self.latencies, q)) if len(self.latencies) > 0 else float("nan")
+
+    def summary(self):
+        return {"rate": self.rate(), "errors": self.error_rate(), "p50": self.quantile(.5), "p99": self.quantile(.99)}
+
+
+def run_burst(request, n, timeout, progress=None, running=None):
+    burst = Burst(timeout)
+    failures = 0
+    start = time.perf_counter()
+    for i in range(n):
+        if running is not None and not running():
+            break
+        t = time.perf_counter()
+        ok = bool(request())
+        burst.add(ok, time.perf_counter() - t)
+        failures = 0 if ok else failures + 1
+        if failures >= MAX_FAILURES:
+            break
+        if progress is not None and i % 10 == 0:
+            progress(i / n)
+    burst.elapsed = time.perf_counter() - start
+    return burst
+
+
+def choose_timeout(burst, target=TARGET_ERRORS, margin=MARGIN, ceiling=PROBE_TIMEOUT):
+    if len(burst.latencies) == 0:
+        return ceiling
+    return min(max(burst.quantile(1 - target) * margin, MIN_TIMEOUT), ceiling)
+
+
+def choose_retries(p, target=TARGET_ERRORS):
+    # attempts needed for p ** attempts to stay under the target
+    if p <= 0:
+        return 1
+    if p >= 1:
+        return MAX_RETRIES
+    return min(max(int(math.ceil(math.log(target) / math.log(p))), 1), MAX_RETRIES)
+
+
+def time_kline(kline, n=KLINE_TRIES):
+    start = time.perf_counter()
+    ok = all([kline() for _ in range(n)])
+    return ok, (time.perf_counter() - start) / n
+
+
+def sweep_kline(dev, attr, candidates, n=KLINE_TRIES):
+    # one candidate above the smallest value at which every K-line check passes, confirmed on a longer run
+    for i, value in enumerate(candidates):
+        setattr(dev, attr, value)
+        if time_kline(dev.kline, n)[0]:
+            break
+    else:
+        return None
+    for value in candidates[min(i + 1, len(candidates) - 1):]:
+        setattr(dev, attr, value)
+        if time_kline(dev.kline, n * KLINE_VERIFY)[0]:
+            return value
+    return None
+
+
+class Calibration(object):
+
+    def __init__(self, dev, request, burst=BURST, target=TARGET_ERRORS, progress=None, running=None):
+        self.dev = dev
+        self.request = request
+        self.burst = burst
+        self.target = target
+        self.progress = progress
+        # checked between requests, so shutting the worker down ends a calibration early
+        self.running = running
+        self.original = {"timeout": dev.timeout, "retries": dev.retries, "kline_wait": dev.kline_wait,
+                         "kline_timeout": dev.kline_timeout}
+
+    def report(self, step, fraction=0.0):
+        if self.progress is not None:
+            self.progress(step, fraction)
+
+    def apply(self, settings):
+        for k, v in settings.items():
+            setattr(self.dev, k, v)
+
+    def measure(self, step, timeout):
+        self.dev.timeout = timeout
+        return run_burst(self.request, self.burst, timeout, lambda f: self.report(step, f), self.running)
+
+    def cancelled(self):
+        return self.running is not None and not self.running()
+
+    def run(self):
+        try:
+            result = self.calibrate()
+        finally:
+            self.apply(self.original)
+        if result["ok"]:
+            self.apply(result["settings"])
+        return result
+
+    def calibrate(self):
+        result = {"ok": False, "reason": None, "original": dict(self.original), "settings": dict(self.original)}
+        ok, klinetime = time_kline(self.dev.kline)
+        if not ok:
+            result["reason"] = "no K-line activity, is the ECU on?"
+            return result
+        result["before"] = self.measure("baseline", self.dev.timeout).summary()
+        if self.cancelled():
+            result["reason"] = "cancelled"
+            return result
+        result["before"]["kline"] = klinetime
+        probe = self.measure("latency", max(PROBE_TIMEOUT, self.dev.timeout))
+        if probe.errors > 0 and len(probe.latencies) == 0:
+            result["reason"] = "the ECU did not answer ECM id reads"
+            return result
+        timeout = choose_timeout(probe, self.target)
+        settings = {"timeout": round(timeout, 3), "retries": choose_retries(probe.attempt_error_rate(), self.target)}
+        self.report("kline")
+        wait = sweep_kline(self.dev, "kline_wait", [w for w in KLINE_WAITS if w <= self.original["kline_wait"]] or
+                           [self.original["kline_wait"]])
+        settings["kline_wait"] = wait if wait is not None else self.original["kline_wait"]
+        self.dev.kline_wait = settings["kline_wait"]
+        ktimeout = sweep_kline(self.dev, "kline_timeout", [t for t in KLINE_TIMEOUTS
+                                                           if t <= self.original["kline_timeout"]] or
+                               [self.original["kline_timeout"]])
+        settings["kline_timeout"] = ktimeout if ktimeout is not None else self.original["kline_timeout"]
+        # confirm the tight settings on a fresh burst, loosening the timeout until they hold the error target
+        ceiling = max(PROBE_TIMEOUT, self.original["timeout"])
+        for _ in range(VERIFY_ROUNDS):
+            if self.cancelled():
+                result["reason"] = "cancelled"
+                return result
+            self.apply(settings)
+            verify = self.measure("verify", settings["timeout"])
+            if verify.error_rate() <= self.target:
+                break
+            if settings["timeout"] >= ceiling:
+                break
+            settings["timeout"] = min(round(settings["timeout"] * MARGIN, 3), ceiling)
+        if self.cancelled():
+            result["reason"] = "cancelled"
+            return result
+        if verify.error_rate() > self.target:
+            result["reason"] = "%.1f%% of requests still failed at a %.3fs timeout" % (
+                100 * verify.error_rate(), settings["timeout"])
+            return result
+        result["after"] = verify.summary()
+        result["after"]["kline"] = time_kline(self.dev.kline)[1]
+        result["settings"] = settings
+        result["ok"] = True
+        return result
+
+
+def format_report(result):
+    if not result["ok"]:
+        return "Calibration failed: %s\nSettings left unchanged." % result["reason"]
+    before, after, old, new = result["before"], result["after"], result["original"], result["settings"]
+    lines = ["Timeout: %.3fs -> %.3fs" % (old["timeout"], new["timeout"]),
+             "Retries: %d -> %d" % (old["retries"], new["retries"]),
+             "Kline wait: %.4fs -> %.4fs" % (old["kline_wait"], new["kline_wait"]),
+             "Kline timeout: %.3fs -> %.3fs" % (old["kline_timeout"], new["kline_timeout"]),
+             "",
+             "ECM id reads: %.1f/s -> %.1f/s (%+.0f%%)" % (before["rate"], after["rate"],
+                                                           100 * (after["rate"] / before["rate"] - 1)
+                                                           if before["rate"] > 0 else 0),
+             "Latency p50 / p99: %.1f / %.1f ms" % (1000 * after["p50"], 1000 * after["p99"]),
+             "Failed requests: %.2f%% -> %.2f%%" % (100 * before["errors"], 100 * after["errors"]),
+             "Kline check: %.1f ms -> %.1f ms" % (1000 * before["kline"], 1000 * after["kline"])]
+    return "\n".join(lines)
@@ -1,8 +1,10 @@
 import configparser
+import logging
 import time
 import string
 import os
 import sys
+import threading
 import platform
 import EnhancedStatusBar
 import usb.util
@@ -10,15 +12,30 @@ import wx
 import wx.lib.agw.labelbook as lb
 import wx.lib.buttons as buttons
 from appdirs import AppDirs
+from calibration import BURST, adapter_section, format_report, settings_section
+from datalog.bulk import iter_decoded
+from datalog.decoders import DECODERS_FILE, load_specs
+from datalog.framelog import FRAMELOG_EXT, read_header
+from datalog.heatmap import build_heatmaps, chunked_heatmaps, find_xdf
+from datalog.store import STORE_EXT
+from datalog.trigger import format_conditions, parse_conditions
+from debuglog import DEBUG_HZ, FILE_LEVELS, MAX_LINES, TRIM_SLACK, DebugFile, DebugRing, debuglog_path, format_lines
 from ecmids import ECM_IDs
-from eculib.honda import ECUSTATE, checksum8bitHonda
+from eculib.honda import ECUSTATE
 from frames.data import HondaECUDatalogPanel
 from frames.eeprom import HondaECUEEPROMPanel
 from frames.error import HondaECUErrorPanel
 from frames.flash import HondaECUFlashPanel
+from frames.heatmap import HeatmapFrame
 from pydispatch import dispatcher
+from rom.catalog import CATALOG_FILE, BinCatalog
+from rom.fingerprint import FingerprintIndex
 from threads.kline import KlineWorker
+from threads.replay import ReplayWorker
 from threads.usb import USBMonitor
+from threads.validation import ValidationWorker, folder_report, heatmap_report, image_report, nearest_report
+from xdf.loader import load_xdf
+from xdf.tables import ROMTables
 
 from version import __VERSION__
 
@@ -175,32 +192,26 @@ class SettingsDialog(wx.Dialog):
         self.retriesl = wx.StaticText(panel, label="Retries:", style=wx.ALIGN_RIGHT)
         self.retries = wx.TextCtrl(panel)
         self.retriesu = wx.StaticText(panel, label="attempts", style=wx.ALIGN_LEFT)
-        self.retries.SetValue(self.parent.config["DEFAULT"]["retries"])
 
         self.timeoutl = wx.StaticText(panel, label="Timeout:", style=wx.ALIGN_RIGHT)
         self.timeout = wx.TextCtrl(panel)
         self.timeoutu = wx.StaticText(panel, label="seconds", style=wx.ALIGN_LEFT)
-        self.timeout.SetValue(self.parent.config["DEFAULT"]["timeout"])
 
         self.klinemethods = ["loopback_ping"]
         self.klinedetectl = wx.StaticText(panel, label="Kline Detection:", style=wx.ALIGN_RIGHT)
         self.klinedetect = wx.ComboBox(panel, value="loopback_ping", choices=self.klinemethods, style=wx.CB_READONLY)
-        self.klinedetect.SetValue(self.parent.config["DEFAULT"]["klinemethod"])
 
         self.kltimeoutl = wx.StaticText(panel, label="Kline Timeout:", style=wx.ALIGN_RIGHT)
         self.kltimeout = wx.TextCtrl(panel)
         self.kltimeoutu = wx.StaticText(panel, label="seconds", style=wx.ALIGN_LEFT)
-        self.kltimeout.SetValue(self.parent.config["DEFAULT"]["kline_timeout"])
 
         self.klwaitl = wx.StaticText(panel, label="Timeout:", style=wx.ALIGN_RIGHT)
         self.klwait = wx.TextCtrl(panel)
         self.klwaitu = wx.StaticText(panel, label="seconds", style=wx.ALIGN_LEFT)
-        self.klwait.SetValue(self.parent.config["DEFAULT"]["kline_wait"])
 
         self.kltestbytesl = wx.StaticText(panel, label="Kline # Test Bytes:", style=wx.ALIGN_RIGHT)
         self.kltestbytes = wx.TextCtrl(panel)
         self.kltestbytesu = wx.StaticText(panel, label="", style=wx.ALIGN_LEFT)
-        self.kltestbytes.SetValue(self.parent.config["DEFAULT"]["kline_testbytes"])
 
         self.cancel = wx.Button(panel, label="Cancel")
         self.ok = wx.Button(panel, label="Ok")
@@ -239,16 +250,29 @@ class SettingsDialog(wx.Dialog):
         self.cancel.Bind(wx.EVT_BUTTON, self.on_cancel)
         self.ok.Bind(wx.EVT_BUTTON, self.on_ok)
 
+        self.load("DEFAULT")
         self.Center()
         self.Layout()
 
+    def load(self, section):
+        # edits go to the active adapter's calibrated settings when it has them
+        self.section = section
+        settings = self.parent.config[section]
+        self.retries.SetValue(settings["retries"])
+        self.timeout.SetValue(settings["timeout"])
+        self.klinedetect.SetValue(settings["klinemethod"])
+        self.kltimeout.SetValue(settings["kline_timeout"])
+        self.klwait.SetValue(settings["kline_wait"])
+        self.kltestbytes.SetValue(settings["kline_testbytes"])
+
     def on_ok(self, _event):
-        self.parent.config["DEFAULT"]["retries"] = self.retries.GetValue()
-        self.parent.config["DEFAULT"]["timeout"] = self.timeout.GetValue()
-        self.parent.config["DEFAULT"]["klinemethod"] = self.klinedetect.GetValue()
-        self.parent.config["DEFAULT"]["kline_timeout"] = self.kltimeout.GetValue()
-        self.parent.config["DEFAULT"]["kline_wait"] = self.klwait.GetValue()
-        self.parent.config["DEFAULT"]["kline_testbytes"] = self.kltestbytes.GetValue()
+        settings = self.parent.config[self.section]
+        settings["retries"] = self.retries.GetValue()
+        settings["timeout"] = self.timeout.GetValue()
+        settings["klinemethod"] = self.klinedetect.GetValue()
+        settings["kline_timeout"] = self.kltimeout.GetValue()
+        settings["kline_wait"] = self.klwait.GetValue()
+        settings["kline_testbytes"] = self.kltestbytes.GetValue()
         dispatcher.send(signal="settings", sender=self, config=self.parent.config)
         self.Hide()
 
@@ -296,6 +320,7 @@ class HondaECUAppButton(buttons.ThemedGenBitmapTextButton):
 class HondaECULogPanel(wx.Frame):
 
     def __init__(self, parent):
+        self.parent = parent
         self.auto = True
         wx.Frame.__init__(self, parent, title="HondaECU :: Debug Log", size=(640, 480))
         self.SetMinSize((640, 480))
@@ -315,6 +340,12 @@ class HondaECULogPanel(wx.Frame):
         self.menubar.Append(viewmenu, '&View')
         self.autoscrollItem = viewmenu.AppendCheckItem(wx.ID_ANY, 'Auto scroll log')
         self.autoscrollItem.Check()
+        levelmenu = wx.Menu()
+        self.levelitems = {}
+        for level in FILE_LEVELS:
+            self.levelitems[level] = levelmenu.AppendRadioItem(wx.ID_ANY, level.capitalize())
+            self.Bind(wx.EVT_MENU, self.OnFileLevel, self.levelitems[level])
+        viewmenu.AppendSubMenu(levelmenu, 'Log to file')
         self.logText = wx.TextCtrl(self, style=wx.TE_MULTILINE | wx.TE_READONLY | wx.HSCROLL | wx.TE_RICH)
         sizer = wx.BoxSizer(wx.VERTICAL)
         sizer.Add(self.logText, 1, wx.EXPAND | wx.ALL, 5)
@@ -324,6 +355,15 @@ class HondaECULogPanel(wx.Frame):
         # sizer.Fit(self)
         self.Center()
         self.starttime = time.time()
+        self.maxlines = int(self.parent.config["DEFAULT"]["debuglog_lines"])
+        self.lines = 0
+        self.ring = DebugRing()
+        level = self.parent.config["DEFAULT"]["debuglog_level"].upper()
+        self.levelitems.get(level, self.levelitems["OFF"]).Check()
+        self.debugfile = DebugFile(debuglog_path(self.parent.prefsdir), level)
+        self.flushtimer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.OnFlush, self.flushtimer)
+        self.flushtimer.Start(1000 // DEBUG_HZ)
         wx.CallAfter(dispatcher.connect, self.ECUDebugHandler, signal="ecu.debug", sender=dispatcher.Any)
 
     def OnSave(self, _event):
@@ -341,12 +381,38 @@ class HondaECULogPanel(wx.Frame):
     def OnClose(self, _event):
         self.Hide()
 
-    def ECUDebugHandler(self, msg):
-        msg = "[%.4f] %s\n" % (time.time() - self.starttime, msg)
+    def OnFileLevel(self, event):
+        for level, item in self.levelitems.items():
+            if item.GetId() == event.GetId():
+                self.parent.config["DEFAULT"]["debuglog_level"] = level
+                self.debugfile.set_level(level)
+
+    def OnFlush(self, _event):
+        items, dropped = self.ring.drain()
+        if len(items) == 0 and dropped == 0:
+            return
+        text = format_lines(items, self.starttime)
+        if dropped > 0:
+            text = "[... %d messages dropped ...]\n" % dropped + text
+        # one append per flush instead of one queued event per message
         if self.autoscrollItem.IsChecked():
-            wx.CallAfter(self.logText.AppendText, msg)
+            self.logText.AppendText(text)
         else:
-            wx.CallAfter(self.logText.WriteText, msg)
+            self.logText.WriteText(text)
+        self.lines += text.count("\n")
+        if self.lines > self.maxlines + TRIM_SLACK:
+            excess = self.lines - self.maxlines
+            self.logText.Remove(0, self.logText.XYToPosition(0, excess))
+            self.lines -= excess
+
+    def ECUDebugHandler(self, msg, level=logging.DEBUG):
+        # runs on whichever thread sent the message, so it only records it; OnFlush does the display
+        self.ring.push(time.time(), level, msg)
+        self.debugfile.log(level, msg)
+
+    def shutdown(self):
+        self.flushtimer.Stop()
+        self.debugfile.close()
 
 
 class HondaECUControlPanel(wx.Frame):
@@ -381,8 +447,15 @@ class HondaECUControlPanel(wx.Frame):
             self.config['DEFAULT']['kline_wait'] = "0.002"
         if "kline_testbytes" not in self.config['DEFAULT']:
             self.config['DEFAULT']['kline_testbytes'] = "1"
+        if "debuglog_lines" not in self.config['DEFAULT']:
+            self.config['DEFAULT']['debuglog_lines'] = str(MAX_LINES)
+        if "debuglog_level" not in self.config['DEFAULT']:
+            self.config['DEFAULT']['debuglog_level'] = "OFF"
+        if "capture_triggers" not in self.config['DEFAULT']:
+            self.config['DEFAULT']['capture_triggers'] = "Engine speed > 9000; TPS sensor ~ 30; ECT sensor > 105; dtc"
         with open(self.configfile, 'w') as configfile:
             self.config.write(configfile)
+        load_specs(os.path.join(self.prefsdir, DECODERS_FILE))
         self.nobins = nobins
         self.restrictions = restrictions
         self.force_restrictions = force_restrictions
@@ -396,6 +469,14 @@ class HondaECUControlPanel(wx.Frame):
             self.basepath = sys._MEIPASS
         else:
             self.basepath = os.path.dirname(os.path.realpath(__file__))
+        # release builds bundle bins/ and xdfs/ next to the images, a checkout has them beside src/
+        self.datapath = self.basepath if getattr(sys, 'frozen', False) else os.path.join(self.basepath, os.pardir)
+        self.catalog = BinCatalog.load(os.path.join(self.datapath, "bins", CATALOG_FILE))
+        self.fingerprints = None
+        self.fingerprintlock = threading.Lock()
+        self.recording = False
+        self.capturing = False
+        self.replayworker = None
 
         self.version_full = version_full
         self.version_short = self.version_full.split("-")[0]
@@ -439,6 +520,23 @@ class HondaECUControlPanel(wx.Frame):
         self.Bind(wx.EVT_MENU, self.OnSettings, settingsitem)
         filemenu.Append(settingsitem)
         filemenu.AppendSeparator()
+        self.recorditem = wx.MenuItem(filemenu, wx.ID_ANY, 'Record datalog...')
+        self.Bind(wx.EVT_MENU, self.OnRecord, self.recorditem)
+        filemenu.Append(self.recorditem)
+        self.captureitem = wx.MenuItem(filemenu, wx.ID_ANY, 'Triggered capture...')
+        self.Bind(wx.EVT_MENU, self.OnCapture, self.captureitem)
+        filemenu.Append(self.captureitem)
+        replayitem = wx.MenuItem(filemenu, wx.ID_ANY, 'Replay datalog...')
+        self.Bind(wx.EVT_MENU, self.OnReplay, replayitem)
+        filemenu.Append(replayitem)
+        self.stopreplayitem = wx.MenuItem(filemenu, wx.ID_ANY, 'Stop replay')
+        self.Bind(wx.EVT_MENU, self.OnStopReplay, self.stopreplayitem)
+        filemenu.Append(self.stopreplayitem)
+        self.stopreplayitem.Enable(False)
+        heatmapitem = wx.MenuItem(filemenu, wx.ID_ANY, 'Heatmap from datalog...')
+        self.Bind(wx.EVT_MENU, self.OnHeatmap, heatmapitem)
+        filemenu.Append(heatmapitem)
+        filemenu.AppendSeparator()
         quititem = wx.MenuItem(filemenu, wx.ID_EXIT, '&Quit\tCtrl+Q')
         self.Bind(wx.EVT_MENU, self.OnClose, quititem)
         filemenu.Append(quititem)
@@ -454,9 +552,15 @@ class HondaECUControlPanel(wx.Frame):
         checksumitem = wx.MenuItem(helpmenu, wx.ID_ANY, 'Validate bin checksum')
         self.Bind(wx.EVT_MENU, self.OnBinChecksum, checksumitem)
         helpmenu.Append(checksumitem)
+        folderitem = wx.MenuItem(helpmenu, wx.ID_ANY, 'Validate bin folder')
+        self.Bind(wx.EVT_MENU, self.OnBinFolder, folderitem)
+        helpmenu.Append(folderitem)
         statsitem = wx.MenuItem(helpmenu, wx.ID_ANY, 'Adapter stats')
         self.Bind(wx.EVT_MENU, self.OnStats, statsitem)
         helpmenu.Append(statsitem)
+        calibrateitem = wx.MenuItem(helpmenu, wx.ID_ANY, 'Calibrate adapter timing')
+        self.Bind(wx.EVT_MENU, self.OnCalibrate, calibrateitem)
+        helpmenu.Append(calibrateitem)
 
         self.statusicons = [
             wx.Image(os.path.join(self.basepath, "images/bullet_black.png"), wx.BITMAP_TYPE_ANY).ConvertToBitmap(),
@@ -544,13 +648,20 @@ class HondaECUControlPanel(wx.Frame):
         self.Bind(wx.EVT_CLOSE, self.OnClose)
 
         self.debuglog = HondaECULogPanel(self)
+        if len(self.catalog) == 0:
+            wx.CallAfter(dispatcher.send, signal="ecu.debug", sender=self,
+                         msg="bin catalog %s is missing or empty, library lookups are disabled" %
+                             os.path.join(self.datapath, "bins", CATALOG_FILE), level=logging.WARNING)
 
         dispatcher.connect(self.USBMonitorHandler, signal="USBMonitor", sender=dispatcher.Any)
         dispatcher.connect(self.kline_worker_handler, signal="KlineWorker", sender=dispatcher.Any)
         dispatcher.connect(self.ecu_stats_handler, signal="ecu.stats", sender=dispatcher.Any)
+        dispatcher.connect(self.ValidationHandler, signal="ValidationWorker", sender=dispatcher.Any)
+        dispatcher.connect(self.ReplayHandler, signal="ReplayWorker", sender=dispatcher.Any)
 
         self.usbmonitor = USBMonitor(self)
         self.klineworker = KlineWorker(self)
+        self.validationworker = ValidationWorker(self)
 
         self.Layout()
         self.Center()
@@ -558,6 +669,7 @@ class HondaECUControlPanel(wx.Frame):
 
         self.usbmonitor.start()
         self.klineworker.start()
+        self.validationworker.start()
 
         self.settings = SettingsDialog(self)
         self.passwordd = PasswordDialog(self)
@@ -622,10 +734,20 @@ class HondaECUControlPanel(wx.Frame):
                 if value >= 0:
                     self.dtccountl.SetLabel("   DTC Count: %d" % value)
             self.statusbar.OnSize(None)
+        elif info == "record":
+            self.recording = value[0] is not None
+            self.recorditem.SetItemLabel("Stop recording" if self.recording else "Record datalog...")
+        elif info == "capture":
+            self.capturing = value is not None
+            self.captureitem.SetItemLabel("Stop triggered capture" if self.capturing else "Triggered capture...")
         elif info == "data":
             if info not in self.ecuinfo:
                 self.ecuinfo[info] = {}
             self.ecuinfo[info][value[0]] = value[1:]
+        elif info == "calibrate.progress":
+            self.SetTitle("HondaECU %s - calibrating: %s %d%%" % (self.version_full, value[0], 100 * value[1]))
+        elif info == "calibrate.result":
+            self.calibrated(value)
 
     def OnStats(self, _event):
         wx.MessageDialog(None, str(self.stats), "", wx.CENTRE | wx.STAY_ON_TOP).ShowModal()
@@ -634,49 +756,244 @@ class HondaECUControlPanel(wx.Frame):
         self.passwordd._Show()
 
     def OnSettings(self, _event):
+        self.settings.load(settings_section(self.config, self.active_serial()))
         self.settings.Show()
 
+    def active_serial(self):
+        if self.active_ftdi_device is None:
+            return None
+        cfg = self.ftdi_devices[self.active_ftdi_device]
+        try:
+            return usb.util.get_string(cfg, cfg.iSerialNumber)
+        except (ValueError, NotImplementedError, usb.core.USBError):
+            return None
+
+    def OnCalibrate(self, _event):
+        if self.ecuinfo.get("state") != ECUSTATE.OK:
+            wx.MessageDialog(None, "Calibration needs a connected ECU that is on and not being flashed", "",
+                             wx.CENTRE | wx.STAY_ON_TOP).ShowModal()
+            return
+        if wx.MessageDialog(None, "Send %d ECM id reads in bursts to measure this adapter's latency and pick the "
+                                  "tightest timeout, retries and K-line timing for it?" % (3 * BURST), "",
+                            wx.YES_NO | wx.CENTRE | wx.STAY_ON_TOP).ShowModal() != wx.ID_YES:
+            return
+        dispatcher.send(signal="calibrate", sender=self, burst=BURST)
+
+    def calibrated(self, result):
+        self.SetTitle("HondaECU %s" % self.version_full)
+        if result["ok"]:
+            section = adapter_section(result["serial"]) if result["serial"] else "DEFAULT"
+            if not self.config.has_section(section) and section != "DEFAULT":
+                self.config.add_section(section)
+            for k, v in result["settings"].items():
+                self.config[section][k] = str(v)
+            with open(self.configfile, 'w') as configfile:
+                self.config.write(configfile)
+            dispatcher.send(signal="settings", sender=self, config=self.config)
+        wx.MessageDialog(None, format_report(result), "Adapter calibration", wx.CENTRE | wx.STAY_ON_TOP).ShowModal()
+
     def OnClose(self, _event):
         with open(self.configfile, 'w') as configfile:
             self.config.write(configfile)
         self.run = False
+        if self.replayworker is not None:
+            self.replayworker.join()
         self.usbmonitor.join()
         self.klineworker.join()
+        self.validationworker.join()
+        self.catalog.close()
+        self.debuglog.shutdown()
         for w in wx.GetTopLevelWindows():
             w.Destroy()
 
+    def OnRecord(self, _event):
+        if self.recording:
+            dispatcher.send(signal="record", sender=self, path=None)
+            return
+        wildcard = "Datalog (*%s)|*%s|Session store (*%s)|*%s" % (FRAMELOG_EXT, FRAMELOG_EXT, STORE_EXT, STORE_EXT)
+        with wx.FileDialog(self, "Record datalog to", wildcard=wildcard,
+                           style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT) as fileDialog:
+            if fileDialog.ShowModal() == wx.ID_CANCEL:
+                return
+            dispatcher.send(signal="record", sender=self, path=fileDialog.GetPath())
+
+    def OnCapture(self, _event):
+        if self.capturing:
+            dispatcher.send(signal="capture", sender=self, outdir=None, conditions=None)
+            return
+        with wx.TextEntryDialog(self, "Start a capture when any of these happen (; separated, ~ is a jump between "
+                                      "samples, dtc is a new trouble code):", "Triggered capture",
+                                self.config["DEFAULT"]["capture_triggers"]) as textDialog:
+            if textDialog.ShowModal() == wx.ID_CANCEL:
+                return
+            try:
+                conditions = parse_conditions(textDialog.GetValue())
+            except ValueError as e:
+                wx.MessageDialog(None, str(e), "", wx.CENTRE | wx.STAY_ON_TOP).ShowModal()
+                return
+        with wx.DirDialog(self, "Write captures to", style=wx.DD_DIR_MUST_EXIST) as dirDialog:
+            if dirDialog.ShowModal() == wx.ID_CANCEL:
+                return
+            outdir = dirDialog.GetPath()
+        self.config["DEFAULT"]["capture_triggers"] = format_conditions(conditions)
+        dispatcher.send(signal="capture", sender=self, outdir=outdir, conditions=conditions)
+
+    def OnReplay(self, _event):
+        with wx.FileDialog(self, "Replay datalog", wildcard="Datalog (*%s)|*%s" % (FRAMELOG_EXT, FRAMELOG_EXT),
+                           style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST) as fileDialog:
+            if fileDialog.ShowModal() == wx.ID_CANCEL:
+                return
+            pathname = fileDialog.GetPath()
+        speeds = [["1x", 1], ["2x", 2], ["5x", 5], ["10x", 10], ["As fast as possible", 0]]
+        with wx.SingleChoiceDialog(self, "Replay speed", "Replay datalog", [s[0] for s in speeds]) as speedDialog:
+            if speedDialog.ShowModal() == wx.ID_CANCEL:
+                return
+            speed = speeds[speedDialog.GetSelection()][1]
+        self.OnStopReplay(None)
+        self.replayworker = ReplayWorker(self, pathname, speed)
+        self.stopreplayitem.Enable(True)
+        self.replayworker.start()
+
+    def OnStopReplay(self, _event):
+        if self.replayworker is not None:
+            dispatcher.send(signal="replay", sender=self, action="stop")
+            self.replayworker.join()
+            self.replayworker = None
+        self.stopreplayitem.Enable(False)
+        self.SetTitle("HondaECU %s" % self.version_full)
+
+    def ReplayHandler(self, sender, info, value):
+        if sender is not self.replayworker:
+            return
+        if info == "progress":
+            self.SetTitle("HondaECU %s - replay %d%% (%.0f samples/s)" % (
+                self.version_full, 100 * value[0] / max(value[1], 1), value[2]))
+        elif info == "done":
+            self.stopreplayitem.Enable(False)
+            self.SetTitle("HondaECU %s" % self.version_full)
+            wx.MessageDialog(None, "Replayed %d samples in %.1fs: %.0f samples/s sustained" % value, "",
+                             wx.CENTRE | wx.STAY_ON_TOP).ShowModal()
+        elif info == "error":
+            self.stopreplayitem.Enable(False)
+            wx.MessageDialog(None, "Replay failed: %s" % value, "", wx.CENTRE | wx.STAY_ON_TOP).ShowModal()
+
+    def load_heatmaps(self, ecmid):
+        # cell grids come from the XDF axes and the stock ROM breakpoints for the ECU's part number
+        if ecmid is None or ecmid not in ECM_IDs:
+            raise ValueError("unknown ECM id")
+        pn = ECM_IDs[ecmid]["pn"]
+        xdfpath = find_xdf(os.path.join(self.datapath, "xdfs"), pn)
+        if xdfpath is None:
+            raise ValueError("no XDF definition for %s" % pn)
+        entry = self.catalog.lookup_ecmid(ecmid) or self.catalog.lookup_pn(pn)
+        if entry is None:
+            raise ValueError("no stock bin for %s" % pn)
+        xdfdef = load_xdf(xdfpath, self.prefsdir)
+        heatmaps = build_heatmaps(xdfdef, ROMTables(xdfdef, bytearray(self.catalog.read(entry))), ecmid=ecmid)
+        if len(heatmaps) == 0:
+            raise ValueError("no fuel or ignition maps with logged axes in %s" % os.path.basename(xdfpath))
+        return heatmaps
+
+    def OnHeatmap(self, _event):
+        with wx.FileDialog(self, "Heatmap from datalog", wildcard="Datalog (*%s)|*%s" % (FRAMELOG_EXT, FRAMELOG_EXT),
+                           style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST) as fileDialog:
+            if fileDialog.ShowModal() == wx.ID_CANCEL:
+                return
+            pathname = fileDialog.GetPath()
+        heatmap_report(self, pathname).start()
+
+    def log_heatmaps(self, path, cancelled=None):
+        # runs on a report worker, the log is decoded and binned a chunk at a time
+        ecmid = read_header(path)["ecmid"]
+        return chunked_heatmaps(self.load_heatmaps(ecmid), iter_decoded(path, ecmid=ecmid), cancelled)
+
+    def HeatmapReport(self, path, heatmaps, error):
+        if heatmaps is None:
+            if error is not None:
+                wx.MessageDialog(None, "Heatmap failed: %s" % error, "", wx.CENTRE | wx.STAY_ON_TOP).ShowModal()
+            return
+        HeatmapFrame(self, os.path.basename(path), heatmaps).Show()
+
     def OnDetectMap(self, _event):
         with wx.FileDialog(self, "Open ECU dump file", wildcard="ECU dump (*.bin)|*.bin",
                            style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST) as fileDialog:
             if fileDialog.ShowModal() == wx.ID_CANCEL:
                 return
             pathname = fileDialog.GetPath()
-            ecupn = os.path.splitext(os.path.split(pathname)[-1])[0]
-            for i in ECM_IDs.values():
-                if ecupn == i["pn"] and "keihinaddr" in i:
-                    fbin = open(pathname, "rb")
-                    nbyts = os.path.getsize(pathname)
-                    byts = bytearray(fbin.read(nbyts))
-                    fbin.close()
-                    idadr = int(i["keihinaddr"], 16)
-                    wx.MessageDialog(None, "Map ID: " + byts[idadr:(idadr + 7)].decode("ascii"), "",
-                                     wx.CENTRE | wx.STAY_ON_TOP).ShowModal()
-                    return
-            wx.MessageDialog(None, "Map ID: unknown", "", wx.CENTRE | wx.STAY_ON_TOP).ShowModal()
+        mapid = self.catalog.map_id(pathname)
+        if mapid is not None:
+            wx.MessageDialog(None, "Map ID: %s" % mapid, "", wx.CENTRE | wx.STAY_ON_TOP).ShowModal()
+            return
+        # the first lookup builds the fingerprint index over the whole library, so it runs off the GUI thread
+        nearest_report(self.fingerprint_index, pathname).start()
+
+    def fingerprint_index(self):
+        with self.fingerprintlock:
+            if self.fingerprints is None:
+                self.fingerprints = FingerprintIndex.build(self.catalog)
+            return self.fingerprints
+
+    def NearestReport(self, nearest):
+        msg = "Map ID: unknown"
+        if nearest is not None and len(nearest) > 0:
+            msg += "\n\nClosest known ROMs:\n" + "\n".join(
+                "%s (%s): %.0f%%" % (e["pn"], e["mapid"] or "-", s * 100) for e, s in nearest)
+        wx.MessageDialog(None, msg, "", wx.CENTRE | wx.STAY_ON_TOP).ShowModal()
 
     def OnBinChecksum(self, _event):
         with wx.FileDialog(self, "Open ECU dump file", wildcard="ECU dump (*.bin)|*.bin",
                            style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST) as fileDialog:
             if fileDialog.ShowModal() == wx.ID_CANCEL:
                 return
-            pathname = fileDialog.GetPath()
-            fbin = open(pathname, "rb")
-            nbyts = os.path.getsize(pathname)
-            byts = bytearray(fbin.read(nbyts))
-            fbin.close()
-            wx.MessageDialog(None, "Checksum: %s" % ("good" if checksum8bitHonda(byts) == 0 else "bad"), "",
-                             wx.CENTRE | wx.STAY_ON_TOP).ShowModal()
+            image_report(fileDialog.GetPath()).start()
+
+    def OnBinFolder(self, _event):
+        with wx.DirDialog(self, "Validate all ECU dumps in", style=wx.DD_DIR_MUST_EXIST) as dirDialog:
+            if dirDialog.ShowModal() == wx.ID_CANCEL:
+                return
+            folder_report(self, dirDialog.GetPath()).start()
+
+    def ValidationHandler(self, key, job, result, error=None):
+        if key == "heatmap":
+            self.HeatmapReport(job[1], result, error)
+            return
+        if key == "image":
+            self.ImageReport(result)
+            return
+        if key == "nearest":
+            self.NearestReport(result)
             return
+        if key != "folder":
+            return
+        if result is None:
+            wx.MessageDialog(None, "Validation of %s failed" % job[1], "", wx.CENTRE | wx.STAY_ON_TOP).ShowModal()
+            return
+        report, base = result
+        bad = sum(1 for r in report if r["error"] or not r["checksum_valid"] or r["size_ok"] is False
+                  or r["ecmid_match"] is False)
+        dups = sum(1 for r in report if r["duplicates"])
+        wx.MessageDialog(None, "%d images, %d with problems, %d duplicated\n\nReport: %s.json, %s.csv" % (
+            len(report), bad, dups, base, base), "", wx.CENTRE | wx.STAY_ON_TOP).ShowModal()
+
+    def ImageReport(self, r):
+        if r is None:
+            msg = "Error: the image could not be read"
+        elif r["error"] is not None:
+            msg = "Error: %s" % r["error"]
+        else:
+            msg = "Checksum: %s" % ("good" if r["checksum_valid"] else "bad")
+            if r["checksum"] is not None and not r["checksum_valid"]:
+                msg += " (0x%s at %s fixes it)" % (r["checksum_fix"][2:], r["checksum"])
+            if r["size_ok"] is False:
+                msg += "\nSize: %d bytes is too small for %s" % (r["size"], r["pn"])
+            if r["ecmid_match"] is not None:
+                msg += "\nECM ID: %s %s" % ("matches" if r["ecmid_match"] else "does not match", r["pn"])
+            if r["mapid"] is not None:
+                msg += "\nMap ID: %s" % r["mapid"]
+            entry = self.catalog.lookup_hash(r["sha256"])
+            if entry is not None:
+                msg += "\nLibrary: identical to %s" % entry["file"]
+        wx.MessageDialog(None, msg, "", wx.CENTRE | wx.STAY_ON_TOP).ShowModal()
 
     def OnDebug(self, _event):
         self.debuglog.Show()
@@ -0,0 +1,133 @@
+import numpy as np
+
+CAPACITY = 1 << 16
+HISTORY = 1 << 19
+FACTOR = 8
+LEVELS = 5
+
+# (label, decoded field, tables the field is taken from)
+CHANNELS = [
+    ["RPM", "Engine speed", [0x10, 0x11, 0x13, 0x17]],
+    ["TPS", "TPS sensor", [0x10, 0x11, 0x13, 0x17]],
+    ["MAP", "MAP sensor", [0x10, 0x11, 0x13, 0x17]],
+    ["ECT", "ECT sensor", [0x10, 0x11, 0x13, 0x17]],
+    ["Injector", "Injector duration", [0x10, 0x11, 0x13, 0x17]],
+    ["Advance", "Ignition advance", [0x10, 0x11, 0x13, 0x17]],
+    ["O2", "O2 sensor", [0x20]],
+]
+
+
+class Ring(object):
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.t = np.zeros(capacity, dtype=np.float64)
+        self.lo = np.zeros(capacity, dtype=np.float64)
+        self.hi = np.zeros(capacity, dtype=np.float64)
+        self.n = 0
+
+    def push(self, t, lo, hi):
+        i = self.n % self.capacity
+        self.t[i] = t
+        self.lo[i] = lo
+        self.hi[i] = hi
+        self.n += 1
+
+    def covers(self, t0):
+        # until the ring wraps it still holds everything since the start
+        return self.n <= self.capacity or self.t[self.n % self.capacity] <= t0
+
+    def window(self, t0, t1):
+        # the ring is two sorted runs, older [head:] and newer [:head], so each is searched without unrolling it
+        head = self.n % self.capacity
+        runs = [(head, self.capacity), (0, head)] if self.n > self.capacity else [(0, self.n)]
+        parts = []
+        for a, b in runs:
+            lo, hi = np.searchsorted(self.t[a:b], [t0, t1], side="left")
+            if hi > lo:
+                parts.append(slice(a + lo, a + hi))
+        if len(parts) == 0:
+            return self.t[:0], self.lo[:0], self.hi[:0]
+        if len(parts) == 1:
+            s = parts[0]
+            return self.t[s], self.lo[s], self.hi[s]
+        return tuple(np.concatenate([arr[s] for s in parts]) for arr in (self.t, self.lo, self.hi))
+
+
+class ChannelBuffer(object):
+
+    def __init__(self, capacity=CAPACITY, history=HISTORY, factor=FACTOR, levels=LEVELS):
+        self.factor = factor
+        # level k holds the min/max of factor**k samples; raw samples are kept for a while, the coarse levels
+        # reach back the whole history
+        self.levels = [Ring(capacity)] + [Ring(max(history // factor ** k, 16)) for k in range(1, levels)]
+        self.pending = [None] * levels
+        self.last = None
+
+    def append(self, t, v):
+        self.last = v
+        self.levels[0].push(t, v, v)
+        lo, hi = v, v
+        for k in range(1, len(self.levels)):
+            p = self.pending[k]
+            if p is None:
+                p = self.pending[k] = [t, lo, hi, 0]
+            else:
+                p[1] = min(p[1], lo)
+                p[2] = max(p[2], hi)
+            p[3] += 1
+            if p[3] < self.factor:
+                break
+            self.levels[k].push(p[0], p[1], p[2])
+            self.pending[k] = None
+            lo, hi = p[1], p[2]
+
+    def decimate(self, t0, t1, width):
+        # the finest level that still fits in a few buckets per pixel, reduced to one min/max per column
+        for ring in self.levels:
+            if not ring.covers(t0) and ring is not self.levels[-1]:
+                continue
+            t, lo, hi = ring.window(t0, t1)
+            if len(t) <= 4 * width:
+                break
+        return minmax_columns(t, lo, hi, t0, t1, width)
+
+
+def minmax_columns(t, lo, hi, t0, t1, width):
+    if len(t) == 0 or t1 <= t0 or width <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+    cols = np.clip(((t - t0) * (width / (t1 - t0))).astype(np.int64), 0, width - 1)
+    starts = np.flatnonzero(np.r_[True, cols[1:] != cols[:-1]])
+    return cols[starts], np.minimum.reduceat(lo, starts), np.maximum.reduceat(hi, starts)
+
+
+class ChartModel(object):
+
+    def __init__(self, channels=CHANNELS):
+        self.channels = channels
+        self.buffers = [ChannelBuffer() for _ in channels]
+        self.routes = {}
+        self.version = 0
+        self.latest = None
+
+    def route(self, decoder):
+        # which decoded columns feed which channel, worked out once per decoder
+        if decoder not in self.routes:
+            self.routes[decoder] = [(c, decoder.index[field]) for c, (_, field, tables) in enumerate(self.channels)
+                                if decoder.table in tables and field in decoder.index]
+        return self.routes[decoder]
+
+    def add(self, decoder, decoded, t):
+        route = self.route(decoder)
+        for c, i in route:
+            # a short 0xd0 response leaves out its trailing fields
+            if i < len(decoded):
+                self.buffers[c].append(t, float(decoded[i]))
+        if len(route) > 0:
+            self.latest = t
+            self.version += 1
+
+    def clear(self):
+        self.buffers = [ChannelBuffer() for _ in self.channels]
+        self.version += 1
+        self.latest = None
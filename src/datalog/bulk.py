@@ -0,0 +1,101 @@
+import csv
+import os
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from .decoders import get_decoder
+from .framelog import DATA_OFFSET, open_frames, read_header
+
+CHUNK = 1 << 16
+
+
+def decode_frames(frames, ecmid=None):
+    # {table: {"time": array, field: array, ...}}, every table group decoded in one vectorised pass
+    columns = {}
+    tables = frames["table"]
+    for t in np.unique(tables).tolist():
+        decoder = get_decoder(t, ecmid)
+        if decoder is None:
+            continue
+        group = frames[tables == t]
+        group = group[group["length"] >= DATA_OFFSET + decoder.size]
+        if len(group) == 0:
+            continue
+        columns[t] = {"time": np.asarray(group["time"], dtype=np.float64)}
+        columns[t].update(decoder.decode_many(group["data"][:, DATA_OFFSET:], group["length"] - DATA_OFFSET))
+    return columns
+
+
+def iter_decoded(path, chunk=CHUNK, ecmid=None):
+    # memory stays bounded by the chunk size however long the log is
+    if ecmid is None:
+        ecmid = read_header(path)["ecmid"]
+    frames = open_frames(path)
+    for start in range(0, len(frames), chunk):
+        yield decode_frames(frames[start:(start + chunk)], ecmid)
+
+
+def decode_log(path, ecmid=None):
+    merged = {}
+    for columns in iter_decoded(path, ecmid=ecmid):
+        for t, cols in columns.items():
+            for name, arr in cols.items():
+                merged.setdefault(t, {}).setdefault(name, []).append(arr)
+    return {t: {name: np.concatenate(arrs) for name, arrs in cols.items()} for t, cols in merged.items()}
+
+
+def table_name(t):
+    return "table_0x%02x" % t
+
+
+def write_csv(path, outdir, chunk=CHUNK, ecmid=None):
+    # one CSV per table, appended chunk by chunk
+    written = {}
+    writers = {}
+    files = []
+    try:
+        for columns in iter_decoded(path, chunk, ecmid):
+            for t, cols in columns.items():
+                if t not in writers:
+                    outpath = os.path.join(outdir, table_name(t) + ".csv")
+                    fcsv = open(outpath, "w", newline="")
+                    files.append(fcsv)
+                    writers[t] = csv.writer(fcsv)
+                    writers[t].writerow(list(cols.keys()))
+                    written[t] = [outpath, 0]
+                writers[t].writerows(np.column_stack(list(cols.values())).tolist())
+                written[t][1] += len(cols["time"])
+    finally:
+        for fcsv in files:
+            fcsv.close()
+    return written
+
+
+def write_columns(path, outdir, chunk=CHUNK, ecmid=None):
+    # one .npy per table and channel, sized up front from a cheap count of the table column
+    if ecmid is None:
+        ecmid = read_header(path)["ecmid"]
+    frames = open_frames(path)
+    counts = {}
+    for start in range(0, len(frames), chunk):
+        part = frames[start:(start + chunk)]
+        for t in np.unique(part["table"]).tolist():
+            decoder = get_decoder(t, ecmid)
+            if decoder is not None:
+                ok = (part["table"] == t) & (part["length"] >= DATA_OFFSET + decoder.size)
+                counts[t] = counts.get(t, 0) + int(ok.sum())
+    outputs = {}
+    filled = dict.fromkeys(counts, 0)
+    for columns in iter_decoded(path, chunk, ecmid):
+        for t, cols in columns.items():
+            for name, arr in cols.items():
+                key = (t, name)
+                if key not in outputs:
+                    outpath = os.path.join(outdir, "%s_%s.npy" % (table_name(t), name.replace(" ", "_")))
+                    outputs[key] = open_memmap(outpath, mode="w+", dtype=arr.dtype, shape=(counts[t],))
+                outputs[key][filled[t]:(filled[t] + len(arr))] = arr
+            filled[t] += len(cols["time"])
+    for out in outputs.values():
+        out.flush()
+    return {t: c for t, c in counts.items() if c > 0}
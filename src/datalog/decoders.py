@@ -0,0 +1,183 @@
+import functools
+import json
+import os
+import struct
+
+import numpy as np
+
+DECODERS_FILE = "decoders.json"
+
+VOLTS = 5 / 0xff
+
+# each field is [name, struct type, scale, offset, decimal places] and decodes to raw * scale + offset
+ENGINE = [
+    ["Engine speed", "H", 1, 0, 0],
+    ["TPS voltage", "B", VOLTS, 0, 2],
+    ["TPS sensor", "B", 1 / 1.6, 0, 2],
+    ["ECT voltage", "B", VOLTS, 0, 2],
+    ["ECT sensor", "B", 1, -40, 0],
+    ["IAT voltage", "B", VOLTS, 0, 2],
+    ["IAT sensor", "B", 1, -40, 0],
+    ["MAP voltage", "B", VOLTS, 0, 2],
+    ["MAP sensor", "B", 10, 0, 0],
+]
+BATTERY = [
+    ["Battery voltage", "B", 0.1, 0, 2],
+    ["Vehicle speed", "B", 1, 0, 0],
+]
+INJECTION = [
+    ["Injector duration", "H", 265.5 / 0xffff, 0, 2],
+    ["Ignition advance", "B", 127.5 / 0xff, -64, 2],
+]
+INJECTION_SHORT = [
+    ["Injector duration", "B", 265.5 / 0xffff, 0, 2],
+    ["Ignition advance", "B", 127.5 / 0xff, -64, 2],
+]
+O2 = [
+    ["O2 sensor", "B", VOLTS, 0, 2],
+    ["STFT", "B", 2 / 0xff, 0, 4],
+    ["O2 heater", "B", VOLTS, 0, 2],
+]
+
+DECODER_SPECS = {
+    0x10: ENGINE + [["Unknown 9", "B", 1, 0, 0], ["Unknown 10", "B", 1, 0, 0]] + BATTERY + INJECTION,
+    0x11: ENGINE + [["Unknown 9", "B", 1, 0, 0], ["Unknown 10", "B", 1, 0, 0]] + BATTERY + INJECTION + [
+        ["IACV pulse count", "B", 1, 0, 0],
+        ["IACV command", "H", 8 / 0xffff, 0, 4],
+    ],
+    0x13: ENGINE + BATTERY + INJECTION_SHORT,
+    0x17: ENGINE + BATTERY + INJECTION_SHORT + [
+        ["Unknown 15", "H", 1, 0, 0],
+        ["Unknown 16", "B", 1, 0, 0],
+        ["Unknown 17", "B", 1, 0, 0],
+        ["Unknown 18", "B", 1, 0, 0],
+    ],
+    0x20: O2,
+    0x21: O2,
+    0xd0: [["Unknown %d" % i, "B", 1, 0, 0] for i in range(5)] + [
+        ["EGCV current", "B", VOLTS, 0, 3],
+        ["EGCV target", "B", VOLTS, 0, 3],
+        ["EGCV load", "b", 1, 0, 0],
+        ["HESD current", "B", VOLTS, 0, 3],
+        ["HESD target", "B", VOLTS, 0, 3],
+        ["HESD load", "B", 1, 0, 0],
+    ],
+}
+
+# per ECM ID replacements for the specs above, keyed like ECM_IDs
+ECM_DECODER_SPECS = {}
+# tables whose responses may stop after this many fields, the HESD fields of 0xd0 are not sent by every ECU
+REQUIRED_FIELDS = {
+    0xd0: 8,
+}
+
+
+class TableDecoder(object):
+
+    def __init__(self, table, fields, required=None):
+        self.table = table
+        self.fields = fields
+        self.names = [f[0] for f in fields]
+        self.index = {n: i for i, n in enumerate(self.names)}
+        self.struct = struct.Struct(">" + "".join(f[1] for f in fields))
+        # a payload may end after any field past the required ones, each shorter prefix gets its own struct
+        self.required = len(fields) if required is None else min(required, len(fields))
+        self.prefixes = [struct.Struct(">" + "".join(f[1] for f in fields[:k]))
+                         for k in range(self.required, len(fields) + 1)]
+        self.ends = [struct.calcsize(">" + "".join(f[1] for f in fields[:(i + 1)])) for i in range(len(fields))]
+        self.size = self.prefixes[0].size
+        self.dtype = np.dtype([(f[0], ">" + f[1].replace("B", "u1").replace("b", "i1").replace("H", "u2"))
+                               for f in fields])
+        self.scale = np.array([f[2] for f in fields], dtype=np.float64)
+        self.offset = np.array([f[3] for f in fields], dtype=np.float64)
+        self.digits = [f[4] for f in fields]
+        self.rounding = 10.0 ** np.array(self.digits, dtype=np.float64)
+        # a single sample is only ~17 fields, where plain Python beats the per-call overhead of numpy: fields
+        # with an integer scale and offset stay ints, only the fractional ones are rounded (to an int for 0 digits)
+        self.linear = tuple((i, int(f[2]), int(f[3])) for i, f in enumerate(fields)
+                            if f[4] == 0 and f[2] == int(f[2]) and f[3] == int(f[3]) and (f[2] != 1 or f[3] != 0))
+        self.rounded = tuple((i, float(f[2]), float(f[3]), f[4] or None) for i, f in enumerate(fields)
+                             if f[4] != 0 or f[2] != int(f[2]) or f[3] != int(f[3]))
+
+    def unpack(self, payload):
+        # trailing bytes beyond the spec are ignored, a short payload unpacks the fields it holds
+        if len(payload) >= self.struct.size:
+            return self.struct.unpack_from(payload)
+        for s in reversed(self.prefixes):
+            if len(payload) >= s.size:
+                return s.unpack_from(payload)
+        raise struct.error("table 0x%02x needs at least %d bytes" % (self.table, self.size))
+
+    def scaled(self, raw):
+        return np.asarray(raw, dtype=np.float64) * self.scale + self.offset
+
+    def decode(self, payload):
+        if len(payload) < self.struct.size:
+            return self.decode_short(payload)
+        values = list(self.struct.unpack_from(payload))
+        for i, s, o in self.linear:
+            values[i] = values[i] * s + o
+        for i, s, o, d in self.rounded:
+            values[i] = round(values[i] * s + o, d)
+        return values
+
+    def decode_short(self, payload):
+        values = list(self.unpack(payload))
+        n = len(values)
+        for i, s, o in self.linear:
+            if i < n:
+                values[i] = values[i] * s + o
+        for i, s, o, d in self.rounded:
+            if i < n:
+                values[i] = round(values[i] * s + o, d)
+        return values
+
+    def decode_many(self, payloads, lengths=None):
+        # payloads is an (n, >= size) uint8 array, one frame per row, decoded column by column in one pass;
+        # with the payload lengths given, optional fields past the end of a short payload come out as NaN
+        width = self.struct.size
+        if payloads.shape[1] < width:
+            payloads = np.pad(payloads, ((0, 0), (0, width - payloads.shape[1])))
+        rows = np.ascontiguousarray(payloads[:, :width]).view(self.dtype).reshape(-1)
+        columns = {}
+        for i, name in enumerate(self.names):
+            scaled = rows[name].astype(np.float64) * self.scale[i] + self.offset[i]
+            columns[name] = np.round(scaled * self.rounding[i]) / self.rounding[i]
+            if lengths is not None and i >= self.required:
+                columns[name][np.asarray(lengths) < self.ends[i]] = np.nan
+        return columns
+
+    def values(self, payload):
+        return dict(zip(self.names, self.decode(payload)))
+
+    def format(self, decoded):
+        # decode() already rounded every field to its digits, ints included
+        return dict(zip(self.names, map(str, decoded)))
+
+    def labels(self, payload):
+        return self.format(self.decode(payload))
+
+
+def load_specs(path):
+    # {"tables": {"0x10": [fields]}, "ecmids": {"0102130501": {"0x10": [fields]}}}
+    if not os.path.isfile(path):
+        return
+    with open(path, "r") as fspec:
+        specs = json.load(fspec)
+    for t, fields in specs.get("tables", {}).items():
+        DECODER_SPECS[int(t, 0)] = fields
+    for ecmid, tables in specs.get("ecmids", {}).items():
+        ECM_DECODER_SPECS.setdefault(bytes.fromhex(ecmid), {}).update({int(t, 0): f for t, f in tables.items()})
+    get_decoder.cache_clear()
+
+
+@functools.lru_cache(maxsize=None)
+def get_decoder(table, ecmid=None):
+    fields = None
+    if ecmid is not None and ecmid in ECM_DECODER_SPECS:
+        fields = ECM_DECODER_SPECS[ecmid].get(table)
+    if fields is None:
+        fields = DECODER_SPECS.get(table)
+    if fields is None:
+        return None
+    return TableDecoder(table, fields, REQUIRED_FIELDS.get(table))
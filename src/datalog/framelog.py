@@ -0,0 +1,92 @@
+import os
+import time
+
+import numpy as np
+
+FRAMELOG_EXT = ".hdl"
+MAGIC = b"HDLG"
+VERSION = 1
+# the table data starts after the response header, as in KlineWorker's value[2][2:]
+DATA_OFFSET = 2
+FRAME_DATA = 54
+
+HEADER_DTYPE = np.dtype([("magic", "S4"), ("version", "<u4"), ("ecmid", "u1", (5,)), ("created", "<u4"),
+                         ("pad", "V3")])
+# fixed size records let a whole log be mapped as one array instead of being parsed frame by frame
+FRAME_DTYPE = np.dtype([("time", "<f8"), ("table", "u1"), ("length", "u1"), ("data", "u1", (FRAME_DATA,))])
+
+
+class FrameLogWriter(object):
+
+    def __init__(self, path, ecmid=b"", batch=256):
+        self.path = path
+        self.batch = np.zeros(batch, dtype=FRAME_DTYPE)
+        self.n = 0
+        self.count = 0
+        self.f = open(path, "wb")
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header["magic"] = MAGIC
+        header["version"] = VERSION
+        if ecmid:
+            header["ecmid"][0] = np.frombuffer(bytes(ecmid)[:5].ljust(5, b"\x00"), dtype=np.uint8)
+        header["created"] = int(time.time())
+        self.f.write(header.tobytes())
+
+    def write(self, t, table, message):
+        message = bytes(message)[:FRAME_DATA]
+        rec = self.batch[self.n]
+        rec["time"] = t
+        rec["table"] = table
+        rec["length"] = len(message)
+        rec["data"][:len(message)] = np.frombuffer(message, dtype=np.uint8)
+        rec["data"][len(message):] = 0
+        self.n += 1
+        self.count += 1
+        if self.n == len(self.batch):
+            self.flush()
+
+    def write_frames(self, frames):
+        self.flush()
+        self.f.write(np.ascontiguousarray(frames, dtype=FRAME_DTYPE).tobytes())
+        self.count += len(frames)
+
+    def flush(self):
+        if self.n > 0:
+            self.f.write(self.batch[:self.n].tobytes())
+            self.n = 0
+        self.f.flush()
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+
+def pack_frames(items):
+    # (time, table, message) tuples to FRAME_DTYPE records
+    frames = np.zeros(len(items), dtype=FRAME_DTYPE)
+    for i, (t, table, message) in enumerate(items):
+        message = bytes(message)[:FRAME_DATA]
+        frames[i]["time"] = t
+        frames[i]["table"] = table
+        frames[i]["length"] = len(message)
+        frames[i]["data"][:len(message)] = np.frombuffer(message, dtype=np.uint8)
+    return frames
+
+
+def read_header(path):
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) == 0 or header["magic"][0] != MAGIC:
+        raise ValueError("%s is not a datalog frame log" % path)
+    if header["version"][0] > VERSION:
+        raise ValueError("%s was written by a newer version (%d)" % (path, header["version"][0]))
+    ecmid = bytes(header["ecmid"][0])
+    return {"ecmid": ecmid if any(ecmid) else None, "created": int(header["created"][0])}
+
+
+def open_frames(path):
+    read_header(path)
+    # a log cut short mid-record still maps, the partial record at the end is ignored
+    count = (os.path.getsize(path) - HEADER_DTYPE.itemsize) // FRAME_DTYPE.itemsize
+    if count <= 0:
+        return np.zeros(0, dtype=FRAME_DTYPE)
+    return np.memmap(path, dtype=FRAME_DTYPE, mode="r", offset=HEADER_DTYPE.itemsize, shape=(count,))
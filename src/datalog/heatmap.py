@@ -0,0 +1,240 @@
+import bisect
+import glob
+import os
+
+import numpy as np
+
+from xdf.equations import compile_equation
+from .decoders import get_decoder
+
+MAIN_TABLES = [0x10, 0x11, 0x13, 0x17]
+O2_TABLE = 0x20
+MAP_KEYWORDS = ["Fuel", "Ignition"]
+# breakpoint titles or units naming the datalog channel that indexes an axis
+AXIS_CHANNELS = [["RPM", "Engine speed"], ["TPS", "TPS sensor"], ["MAP", "MAP sensor"]]
+# a gap longer than this in the log is not counted as time spent in a cell
+MAX_DWELL = 0.5
+
+
+def find_xdf(xdfdir, pn):
+    paths = glob.glob(os.path.join(xdfdir, "*", "%s.xdf" % pn))
+    return paths[0] if len(paths) > 0 else None
+
+
+def axis_channel(xdfdef, table, axisid):
+    axis = table["axes"][axisid]
+    names = [axis["units"] or ""]
+    if axis["link"] is not None and axis["link"] in xdfdef.by_id:
+        names.append(xdfdef.by_id[axis["link"]]["title"])
+    for keyword, field in AXIS_CHANNELS:
+        if any(keyword in n.upper() for n in names):
+            return field
+    return None
+
+
+def is_identity(equation):
+    return (equation or "X").replace(" ", "").upper() == "X"
+
+
+def field_equation(xdfdef, table, axisid, field, ecmid=None):
+    # an XDF that leaves a breakpoint axis as plain X holds raw ECU counts, which the datalog decoder has scaled,
+    # so the sample is taken back to counts; a scaled axis is assumed to be in the decoder's units already
+    axis = table["axes"][axisid]
+    equations = [axis["equation"]]
+    if axis["link"] is not None and axis["link"] in xdfdef.by_id:
+        equations.append(xdfdef.by_id[axis["link"]]["axes"]["z"]["equation"])
+    if not all(is_identity(e) for e in equations):
+        return "X"
+    for t in MAIN_TABLES:
+        decoder = get_decoder(t, ecmid)
+        if decoder is not None and field in decoder.index:
+            _, _, scale, offset, _ = decoder.fields[decoder.index[field]]
+            if scale == 1 and offset == 0:
+                return "X"
+            return "(X-(%r))/%r" % (offset, scale) if offset != 0 else "X/%r" % scale
+    return "X"
+
+
+def nearest_cells(breaks, values):
+    # the cell whose breakpoint is closest; breakpoints may run either way
+    breaks = np.asarray(breaks, dtype=np.float64)
+    flip = len(breaks) > 1 and breaks[0] > breaks[-1]
+    b = breaks[::-1] if flip else breaks
+    i = np.searchsorted(b, values)
+    lo = np.clip(i - 1, 0, len(b) - 1)
+    hi = np.clip(i, 0, len(b) - 1)
+    i = np.where(np.abs(values - b[lo]) <= np.abs(b[hi] - values), lo, hi)
+    return len(b) - 1 - i if flip else i
+
+
+def nearest_cell(ascending, flip, value):
+    i = bisect.bisect_left(ascending, value)
+    lo = max(i - 1, 0)
+    hi = min(i, len(ascending) - 1)
+    i = lo if abs(value - ascending[lo]) <= abs(ascending[hi] - value) else hi
+    return len(ascending) - 1 - i if flip else i
+
+
+class CellHeatmap(object):
+
+    def __init__(self, title, xbreaks, ybreaks, xfield, yfield, xequation="X", yequation="X"):
+        self.title = title
+        self.xbreaks = np.asarray(xbreaks, dtype=np.float64)
+        self.ybreaks = np.asarray(ybreaks, dtype=np.float64)
+        self.xfield = xfield
+        self.yfield = yfield
+        # datalog units to breakpoint units, when the XDF scales its axis differently from the decoder
+        self.xconvert = compile_equation(xequation)
+        self.yconvert = compile_equation(yequation)
+        self.identity = is_identity(xequation) and is_identity(yequation)
+        self.xflip = self.xbreaks[0] > self.xbreaks[-1]
+        self.yflip = self.ybreaks[0] > self.ybreaks[-1]
+        self.xsorted = sorted(self.xbreaks.tolist())
+        self.ysorted = sorted(self.ybreaks.tolist())
+        self.shape = (len(self.ybreaks), len(self.xbreaks))
+        self.size = self.shape[0] * self.shape[1]
+        self.clear()
+
+    def clear(self):
+        self.hits = np.zeros(self.shape, dtype=np.int64)
+        self.dwell = np.zeros(self.shape, dtype=np.float64)
+        self.o2sum = np.zeros(self.shape, dtype=np.float64)
+        self.o2count = np.zeros(self.shape, dtype=np.int64)
+        self.stftsum = np.zeros(self.shape, dtype=np.float64)
+        self.stftcount = np.zeros(self.shape, dtype=np.int64)
+
+    def cells(self, x, y):
+        cols = nearest_cells(self.xbreaks, self.xconvert(np.asarray(x, dtype=np.float64)))
+        rows = nearest_cells(self.ybreaks, self.yconvert(np.asarray(y, dtype=np.float64)))
+        return rows * self.shape[1] + cols
+
+    def accumulate(self, counts, flat, weights=None):
+        counts += np.bincount(flat, weights=weights, minlength=self.size).reshape(self.shape).astype(counts.dtype)
+
+    def add(self, x, y, dwell, o2=None, stft=None):
+        # arrays of samples, counted into the preallocated maps with one bincount each
+        flat = self.cells(np.atleast_1d(x), np.atleast_1d(y))
+        self.accumulate(self.hits, flat)
+        self.accumulate(self.dwell, flat, np.broadcast_to(dwell, flat.shape).astype(np.float64))
+        for values, total, count in [(o2, self.o2sum, self.o2count), (stft, self.stftsum, self.stftcount)]:
+            if values is None:
+                continue
+            values = np.broadcast_to(np.asarray(values, dtype=np.float64), flat.shape)
+            ok = np.isfinite(values)
+            self.accumulate(total, flat[ok], values[ok])
+            self.accumulate(count, flat[ok])
+
+    def add_one(self, x, y, dwell, o2=float("nan"), stft=float("nan")):
+        # a single live sample touches one cell, so it is looked up in plain Python without numpy call overhead
+        if not self.identity:
+            x, y = float(self.xconvert(x)), float(self.yconvert(y))
+        i = nearest_cell(self.ysorted, self.yflip, y) * self.shape[1] + nearest_cell(self.xsorted, self.xflip, x)
+        self.hits.flat[i] += 1
+        self.dwell.flat[i] += dwell
+        if o2 == o2:
+            self.o2sum.flat[i] += o2
+            self.o2count.flat[i] += 1
+        if stft == stft:
+            self.stftsum.flat[i] += stft
+            self.stftcount.flat[i] += 1
+
+    def mean_o2(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.o2count > 0, self.o2sum / self.o2count, np.nan)
+
+    def mean_stft(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.stftcount > 0, self.stftsum / self.stftcount, np.nan)
+
+
+def build_heatmaps(xdfdef, romtables, equations=None, ecmid=None):
+    # one heatmap per fuel and ignition map whose two axes are indexed by two different logged channels;
+    # equations overrides the datalog to breakpoint unit conversion per field
+    equations = equations or {}
+    heatmaps = []
+    for table in xdfdef.tables:
+        if not any(k in table["title"] for k in MAP_KEYWORDS):
+            continue
+        if "x" not in table["axes"] or "y" not in table["axes"] or table["axes"].get("z", {}).get("data") is None:
+            continue
+        xfield = axis_channel(xdfdef, table, "x")
+        yfield = axis_channel(xdfdef, table, "y")
+        if xfield is None or yfield is None or xfield == yfield:
+            continue
+        xbreaks = romtables.axis_values(table["id"], "x")
+        ybreaks = romtables.axis_values(table["id"], "y")
+        if len(xbreaks) < 2 or len(ybreaks) < 2:
+            continue
+        xequation = equations.get(xfield) or field_equation(xdfdef, table, "x", xfield, ecmid)
+        yequation = equations.get(yfield) or field_equation(xdfdef, table, "y", yfield, ecmid)
+        heatmaps.append(CellHeatmap(table["title"], xbreaks, ybreaks, xfield, yfield, xequation, yequation))
+    return heatmaps
+
+
+class LiveHeatmaps(object):
+
+    def __init__(self, heatmaps):
+        self.heatmaps = heatmaps
+        self.last = None
+        self.o2 = float("nan")
+        self.stft = float("nan")
+        self.version = 0
+
+    def sample(self, decoder, decoded, t):
+        # O2 arrives in its own table, the latest reading is credited to the cells the engine is in
+        if decoder.table == O2_TABLE:
+            self.o2 = float(decoded[decoder.index["O2 sensor"]])
+            self.stft = float(decoded[decoder.index["STFT"]])
+            return
+        if decoder.table not in MAIN_TABLES:
+            return
+        dwell = 0.0 if self.last is None else min(t - self.last, MAX_DWELL)
+        self.last = t
+        for h in self.heatmaps:
+            if h.xfield in decoder.index and h.yfield in decoder.index:
+                h.add_one(decoded[decoder.index[h.xfield]], decoded[decoder.index[h.yfield]], dwell, self.o2,
+                          self.stft)
+        self.version += 1
+
+    def clear(self):
+        for h in self.heatmaps:
+            h.clear()
+        self.last = None
+        self.version += 1
+
+
+def bulk_heatmaps(heatmaps, columns):
+    # columns as returned by datalog.bulk.decode_log
+    return chunked_heatmaps(heatmaps, [columns])
+
+
+def chunked_heatmaps(heatmaps, chunks, cancelled=None):
+    # chunks as yielded by datalog.bulk.iter_decoded; the last engine time and O2 reading carry over between chunks
+    last = None
+    o2last = stftlast = np.nan
+    for columns in chunks:
+        if cancelled is not None and cancelled():
+            return None
+        main = [t for t in MAIN_TABLES if t in columns]
+        if len(main) == 0:
+            continue
+        engine = columns[main[0]]
+        times = engine["time"]
+        if len(times) == 0:
+            continue
+        dwell = np.minimum(np.diff(times, prepend=times[0] if last is None else last), MAX_DWELL)
+        last = times[-1]
+        o2 = np.full(len(times), o2last)
+        stft = np.full(len(times), stftlast)
+        if O2_TABLE in columns and len(columns[O2_TABLE]["time"]) > 0:
+            # the O2 reading most recently received before each engine sample
+            i = np.searchsorted(columns[O2_TABLE]["time"], times, side="right") - 1
+            valid = i >= 0
+            o2 = np.where(valid, columns[O2_TABLE]["O2 sensor"][np.maximum(i, 0)], o2last)
+            stft = np.where(valid, columns[O2_TABLE]["STFT"][np.maximum(i, 0)], stftlast)
+            o2last = columns[O2_TABLE]["O2 sensor"][-1]
+            stftlast = columns[O2_TABLE]["STFT"][-1]
+        for h in heatmaps:
+            if h.xfield in engine and h.yfield in engine:
+                h.add(engine[h.xfield], engine[h.yfield], dwell, o2, stft)
+    return heatmaps
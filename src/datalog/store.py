@@ -0,0 +1,197 @@
+import queue
+import sqlite3
+import time
+from threading import Thread
+
+import numpy as np
+
+from ecmids import ECM_IDs
+from .decoders import get_decoder
+from .framelog import DATA_OFFSET, open_frames, pack_frames, read_header
+
+STORE_EXT = ".sqlite"
+BATCH = 512
+FLUSH_INTERVAL = 0.5
+# frames waiting for the writer; beyond this the recorder drops frames rather than grow without bound
+QUEUE_FRAMES = 1 << 15
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY, started REAL, ended REAL, ecmid TEXT, pn TEXT, model TEXT, adapter TEXT,
+    frames INTEGER DEFAULT 0);
+CREATE TABLE IF NOT EXISTS channels (id INTEGER PRIMARY KEY, tbl INTEGER, name TEXT, UNIQUE (tbl, name));
+CREATE TABLE IF NOT EXISTS frames (session INTEGER, time REAL, tbl INTEGER, data BLOB);
+CREATE TABLE IF NOT EXISTS samples (session INTEGER, channel INTEGER, time REAL, value REAL);
+CREATE INDEX IF NOT EXISTS frames_time ON frames (session, time);
+CREATE INDEX IF NOT EXISTS samples_time ON samples (session, channel, time);
+"""
+
+
+def connect(path):
+    db = sqlite3.connect(path, check_same_thread=False)
+    # readers never wait on the writer and a commit only syncs the log, not the whole database
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+def session_metadata(ecmid, adapter=None):
+    ecmid = bytes(ecmid) if ecmid else None
+    info = ECM_IDs.get(ecmid, {}) if ecmid else {}
+    return {"ecmid": ecmid.hex() if ecmid else None, "pn": info.get("pn"), "model": info.get("model"),
+            "adapter": adapter}
+
+
+class SessionStore(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.db = connect(path)
+        self.channelids = {(tbl, name): cid for cid, tbl, name in self.db.execute("SELECT id, tbl, name FROM channels")}
+
+    def close(self):
+        self.db.close()
+
+    def new_session(self, metadata, started=None):
+        cur = self.db.execute("INSERT INTO sessions (started, ecmid, pn, model, adapter) VALUES (?, ?, ?, ?, ?)", (
+            started if started is not None else time.time(), metadata.get("ecmid"), metadata.get("pn"),
+            metadata.get("model"), metadata.get("adapter")))
+        self.db.commit()
+        return cur.lastrowid
+
+    def channel_id(self, tbl, name):
+        key = (tbl, name)
+        if key not in self.channelids:
+            self.db.execute("INSERT OR IGNORE INTO channels (tbl, name) VALUES (?, ?)", key)
+            self.channelids[key] = self.db.execute("SELECT id FROM channels WHERE tbl = ? AND name = ?",
+                                                   key).fetchone()[0]
+        return self.channelids[key]
+
+    def insert(self, session, frames, ecmid=None):
+        # frames is a FRAME_DTYPE array; raw frames and every decoded channel go in as one transaction
+        if len(frames) == 0:
+            return
+        rows = [(session, float(f["time"]), int(f["table"]), bytes(f["data"][:f["length"]])) for f in frames]
+        samples = []
+        tables = frames["table"]
+        for t in np.unique(tables).tolist():
+            decoder = get_decoder(t, ecmid)
+            if decoder is None:
+                continue
+            group = frames[tables == t]
+            group = group[group["length"] >= DATA_OFFSET + decoder.size]
+            if len(group) == 0:
+                continue
+            times = group["time"].tolist()
+            for name, values in decoder.decode_many(group["data"][:, DATA_OFFSET:],
+                                                      group["length"] - DATA_OFFSET).items():
+                cid = self.channel_id(t, name)
+                # fields a short response did not carry are NaN and are left out
+                samples.extend((session, cid, tm, v) for tm, v in zip(times, values.tolist()) if v == v)
+        with self.db:
+            self.db.executemany("INSERT INTO frames (session, time, tbl, data) VALUES (?, ?, ?, ?)", rows)
+            self.db.executemany("INSERT INTO samples (session, channel, time, value) VALUES (?, ?, ?, ?)", samples)
+            self.db.execute("UPDATE sessions SET frames = frames + ?, ended = max(coalesce(ended, 0), ?) WHERE id = ?",
+                            (len(rows), rows[-1][1], session))
+
+    def sessions(self):
+        cur = self.db.execute("SELECT id, started, ended, ecmid, pn, model, adapter, frames FROM sessions ORDER BY id")
+        return [dict(zip([c[0] for c in cur.description], r)) for r in cur.fetchall()]
+
+    def channels(self, session):
+        return self.db.execute("SELECT tbl, name FROM channels c WHERE EXISTS (SELECT 1 FROM samples s "
+                               "WHERE s.session = ? AND s.channel = c.id) ORDER BY tbl, id", (session,)).fetchall()
+
+    def frames(self, session, t0, t1):
+        return self.db.execute("SELECT time, tbl, data FROM frames WHERE session = ? AND time >= ? AND time < ? "
+                               "ORDER BY time", (session, t0, t1)).fetchall()
+
+    def channel(self, session, tbl, name, t0=float("-inf"), t1=float("inf")):
+        cid = self.channelids.get((tbl, name))
+        if cid is None:
+            return np.empty(0), np.empty(0)
+        rows = self.db.execute("SELECT time, value FROM samples WHERE session = ? AND channel = ? AND time >= ? "
+                               "AND time < ? ORDER BY time", (session, cid, t0, t1)).fetchall()
+        arr = np.array(rows, dtype=np.float64).reshape(-1, 2)
+        return arr[:, 0], arr[:, 1]
+
+    def seek(self, session, offset, span=60.0):
+        # offset seconds into the session; the (session, time) index makes this a range scan wherever it lands
+        started = self.db.execute("SELECT min(time) FROM frames WHERE session = ?", (session,)).fetchone()[0]
+        if started is None:
+            return []
+        return self.frames(session, started + offset, started + offset + span)
+
+    def import_framelog(self, path, adapter=None, chunk=1 << 16):
+        header = read_header(path)
+        frames = open_frames(path)
+        session = self.new_session(session_metadata(header["ecmid"], adapter),
+                                   float(frames["time"][0]) if len(frames) > 0 else header["created"])
+        for start in range(0, len(frames), chunk):
+            self.insert(session, np.asarray(frames[start:(start + chunk)]), header["ecmid"])
+        return session
+
+
+class SessionRecorder(Thread):
+
+    # stands in for FrameLogWriter in KlineWorker: write() only queues, this thread batches the inserts
+    def __init__(self, path, ecmid=b"", adapter=None):
+        self.path = path
+        self.ecmid = bytes(ecmid) if ecmid else None
+        self.adapter = adapter
+        # opened on the caller's thread, so a bad path fails here instead of killing the writer unseen
+        self.store = SessionStore(path)
+        try:
+            self.session = self.store.new_session(session_metadata(self.ecmid, self.adapter))
+        except sqlite3.Error:
+            self.store.close()
+            raise
+        self.queue = queue.Queue(maxsize=QUEUE_FRAMES)
+        self.count = 0
+        self.dropped = 0
+        self.error = None
+        Thread.__init__(self, daemon=True)
+        self.start()
+
+    def write(self, t, table, message):
+        if self.error is not None or not self.is_alive():
+            raise sqlite3.OperationalError("session store writer stopped: %s" % self.error)
+        try:
+            self.queue.put_nowait((t, table, bytes(message)))
+            self.count += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self.is_alive():
+            self.queue.put(None)
+        self.join()
+
+    def drain(self, first):
+        items = [first]
+        deadline = time.perf_counter() + FLUSH_INTERVAL
+        while len(items) < BATCH:
+            try:
+                item = self.queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            if item is None:
+                return items, True
+            items.append(item)
+        return items, False
+
+    def run(self):
+        # the K-line worker never waits on the database, only on a full queue being refused
+        try:
+            done = False
+            while not done:
+                first = self.queue.get()
+                if first is None:
+                    break
+                items, done = self.drain(first)
+                self.store.insert(self.session, pack_frames(items), self.ecmid)
+        except sqlite3.Error as e:
+            self.error = e
+        finally:
+            self.store.close()
@@ -0,0 +1,152 @@
+import os
+import re
+import time
+
+import numpy as np
+
+from .framelog import FRAME_DATA, FRAME_DTYPE, FRAMELOG_EXT, FrameLogWriter
+
+PRE_FRAMES = 4096
+PRE_SECONDS = 10.0
+POST_SECONDS = 20.0
+
+CONDITION = re.compile(r"^\s*(?:(dtc)|(.+?)\s*(>|<|~)\s*(-?[0-9.]+))\s*$", re.IGNORECASE)
+
+
+def parse_conditions(text):
+    # "Engine speed > 9000; TPS sensor ~ 30; ECT sensor > 105; dtc", where ~ is a jump between two samples
+    conditions = []
+    for part in text.split(";"):
+        if part.strip() == "":
+            continue
+        m = CONDITION.match(part)
+        if m is None:
+            raise ValueError("can't parse trigger condition '%s'" % part.strip())
+        if m.group(1):
+            conditions.append(["dtc", None, None])
+        else:
+            conditions.append([m.group(3), m.group(2), float(m.group(4))])
+    return conditions
+
+
+def format_conditions(conditions):
+    return "; ".join("dtc" if op == "dtc" else "%s %s %g" % (field, op, value) for op, field, value in conditions)
+
+
+class Trigger(object):
+
+    def __init__(self, op, field, value):
+        self.op = op
+        self.field = field
+        self.value = value
+        self.last = None
+        self.active = False
+
+    def update(self, x):
+        # only the edge into the condition fires, a value sitting above a threshold does not keep retriggering
+        if self.op == ">":
+            hit = x > self.value
+        elif self.op == "<":
+            hit = x < self.value
+        else:
+            hit = self.last is not None and abs(x - self.last) >= self.value
+        self.last = x
+        fired = hit and not self.active
+        self.active = hit
+        return fired
+
+    def describe(self):
+        return "dtc" if self.op == "dtc" else "%s %s %g" % (self.field, self.op, self.value)
+
+
+class TriggeredCapture(object):
+
+    def __init__(self, outdir, conditions, ecmid=b"", pre=PRE_SECONDS, post=POST_SECONDS, capacity=PRE_FRAMES):
+        self.outdir = outdir
+        self.triggers = [Trigger(*c) for c in conditions]
+        self.dtctrigger = any(t.op == "dtc" for t in self.triggers)
+        self.ecmid = ecmid
+        self.pre = pre
+        self.post = post
+        # the pre-trigger history is a fixed ring, so a day long session costs the same as a minute
+        self.ring = np.zeros(capacity, dtype=FRAME_DTYPE)
+        self.n = 0
+        self.routes = {}
+        self.dtcs = None
+        self.writer = None
+        self.until = None
+        self.reason = None
+
+    def route(self, decoder):
+        if decoder not in self.routes:
+            self.routes[decoder] = [(t, decoder.index[t.field]) for t in self.triggers
+                                    if t.op != "dtc" and t.field in decoder.index]
+        return self.routes[decoder]
+
+    def push(self, t, table, message):
+        message = bytes(message)[:FRAME_DATA]
+        rec = self.ring[self.n % len(self.ring)]
+        rec["time"] = t
+        rec["table"] = table
+        rec["length"] = len(message)
+        rec["data"][:len(message)] = np.frombuffer(message, dtype=np.uint8)
+        rec["data"][len(message):] = 0
+        self.n += 1
+
+    def history(self, since):
+        if self.n <= len(self.ring):
+            frames = self.ring[:self.n]
+        else:
+            head = self.n % len(self.ring)
+            frames = np.concatenate((self.ring[head:], self.ring[:head]))
+        return frames[frames["time"] >= since]
+
+    def sample(self, t, table, message, decoder=None, decoded=None):
+        # called from KlineWorker.do_update_tables for every table response; returns a finished capture path
+        fired = []
+        if decoder is not None and decoded is not None:
+            fired = [trig.describe() for trig, i in self.route(decoder)
+                     if i < len(decoded) and trig.update(float(decoded[i]))]
+        if self.writer is not None:
+            self.writer.write(t, table, message)
+        else:
+            self.push(t, table, message)
+        if len(fired) > 0:
+            self.fire(t, ", ".join(fired))
+        return self.check(t)
+
+    def dtc(self, t, errorcodes):
+        codes = set(c for codes in errorcodes.values() for c in codes)
+        new = codes - self.dtcs if self.dtcs is not None else set()
+        self.dtcs = codes
+        if self.dtctrigger and len(new) > 0:
+            self.fire(t, "new dtc %s" % ", ".join(sorted(new)))
+        return self.check(t)
+
+    def fire(self, t, reason):
+        if self.writer is None:
+            base = os.path.join(self.outdir, "capture-%s" % time.strftime("%Y%m%d-%H%M%S", time.localtime(t)))
+            path, i = base + FRAMELOG_EXT, 1
+            while os.path.exists(path):
+                path, i = "%s-%d%s" % (base, i, FRAMELOG_EXT), i + 1
+            self.writer = FrameLogWriter(path, self.ecmid)
+            self.writer.write_frames(self.history(t - self.pre))
+            self.n = 0
+            self.reason = reason
+        # a trigger during the post window extends it instead of starting a second file
+        self.until = t + self.post
+
+    def check(self, t):
+        if self.writer is None or t < self.until:
+            return None
+        return self.finish()
+
+    def finish(self):
+        if self.writer is None:
+            return None
+        self.writer.close()
+        capture = (self.writer.path, self.writer.count, self.reason)
+        self.writer = None
+        self.until = None
+        self.reason = None
+        return capture
@@ -0,0 +1,43 @@
+import time
+
+REFRESH_HZ = 25
+
+
+class DatalogView(object):
+
+    def __init__(self):
+        self.values = {}
+        self.dirty = set()
+        self.tables = set()
+        self.samples = 0
+        self.started = None
+
+    def update(self, table, labels):
+        # called for every sample on the GUI thread, so this only records and never touches a widget
+        if self.started is None:
+            self.started = time.perf_counter()
+        self.samples += 1
+        self.tables.add(table)
+        for name, text in labels.items():
+            key = (table, name)
+            if self.values.get(key) != text:
+                self.values[key] = text
+                self.dirty.add(key)
+
+    def flush(self):
+        changed = {k: self.values[k] for k in self.dirty}
+        self.dirty = set()
+        return changed
+
+    def rate(self):
+        if self.started is None:
+            return 0.0
+        elapsed = time.perf_counter() - self.started
+        return self.samples / elapsed if elapsed > 0 else 0.0
+
+    def clear(self):
+        self.values = {}
+        self.dirty = set()
+        self.tables = set()
+        self.samples = 0
+        self.started = None
@@ -0,0 +1,88 @@
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from collections import deque
+
+DEBUG_HZ = 10
+RING_SIZE = 1 << 14
+MAX_LINES = 5000
+# the control is only trimmed once it is this far past the limit, so a busy log is not cut on every flush
+TRIM_SLACK = 500
+DEBUGLOG_FILE = "hondaecu-debug.log"
+FILE_BYTES = 1 << 20
+FILE_BACKUPS = 5
+FILE_LEVELS = ["OFF", "DEBUG", "INFO", "WARNING", "ERROR"]
+
+
+class DebugRing(object):
+
+    # producers on any thread only hold the lock for an append and never touch wx; the count lets drain see overwrites
+    def __init__(self, size=RING_SIZE):
+        self.ring = deque(maxlen=size)
+        self.lock = threading.Lock()
+        self.pushed = 0
+        self.popped = 0
+
+    def push(self, t, level, msg):
+        with self.lock:
+            self.pushed += 1
+            self.ring.append((t, level, msg))
+
+    def drain(self):
+        with self.lock:
+            items = list(self.ring)
+            self.ring.clear()
+            pushed = self.pushed
+        # whatever the ring overwrote before the consumer caught up
+        dropped = pushed - self.popped - len(items)
+        self.popped = pushed
+        return items, dropped
+
+
+class DebugFile(object):
+
+    # rotating file output; the writes happen on the listener thread, the producer only enqueues a record
+    def __init__(self, path, level="OFF"):
+        self.path = path
+        self.logger = logging.getLogger("HondaECU.debug")
+        self.logger.propagate = False
+        self.listener = None
+        self.set_level(level)
+
+    def set_level(self, level):
+        level = level.upper()
+        self.close()
+        if level not in FILE_LEVELS or level == "OFF":
+            self.logger.setLevel(logging.CRITICAL + 1)
+            return
+        handler = logging.handlers.RotatingFileHandler(self.path, maxBytes=FILE_BYTES, backupCount=FILE_BACKUPS)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+        q = queue.SimpleQueue()
+        self.logger.addHandler(logging.handlers.QueueHandler(q))
+        self.logger.setLevel(getattr(logging, level))
+        self.listener = logging.handlers.QueueListener(q, handler)
+        self.listener.start()
+
+    def log(self, level, msg):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, msg)
+
+    def close(self):
+        for h in list(self.logger.handlers):
+            self.logger.removeHandler(h)
+        if self.listener is not None:
+            self.listener.stop()
+            for h in self.listener.handlers:
+                h.close()
+            self.listener = None
+
+
+def debuglog_path(prefsdir):
+    return os.path.join(prefsdir, DEBUGLOG_FILE)
+
+
+def format_lines(items, starttime):
+    return "".join("[%.4f] %s\n" % (t - starttime, msg) if level <= logging.INFO else
+                   "[%.4f] %s: %s\n" % (t - starttime, logging.getLevelName(level), msg) for t, level, msg in items)
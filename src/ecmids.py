@@ -188,3 +188,8 @@ ECM_IDs = {
     b"\x01\x02\xde\x05\x01":
         {"model": "CRF 110", "year": "2019", "pn": "38770-KYK-D12"},
 }
+
+# a part number can be flashed under more than one ECM id, so each maps to every id that names it
+ECM_PNs = {}
+for m, i in ECM_IDs.items():
+    ECM_PNs.setdefault(i["pn"], []).append(m)
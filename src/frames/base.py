@@ -1,3 +1,5 @@
+import os
+
 import wx
 
 from pydispatch import dispatcher
@@ -13,11 +15,15 @@ class HondaECUAppPanel(wx.Panel):
         self.appid = appid
         self.appinfo = appinfo
         self.enablestates = enablestates
+        self.validatejob = None
+        self.validated = False
+        self.validoffset = None
         self.Build()
         dispatcher.connect(self.KlineWorkerHandler, signal="KlineWorker", sender=dispatcher.Any)
         dispatcher.connect(self.DeviceHandler, signal="FTDIDevice", sender=dispatcher.Any)
         dispatcher.connect(self.USBErrorHandler, signal="usberror", sender=dispatcher.Any)
         dispatcher.connect(self.USBErrorHandler, signal="ftdierror", sender=dispatcher.Any)
+        dispatcher.connect(self.ValidationHandler, signal="ValidationWorker", sender=dispatcher.Any)
 
     def USBErrorHandler(self, errno, strerror):
         pass
@@ -28,5 +34,28 @@ class HondaECUAppPanel(wx.Panel):
     def DeviceHandler(self, action, device, config):
         pass
 
+    def ValidationHandler(self, key, job, result, error=None):
+        if key == self.appid and job == self.validatejob:
+            if error is not None:
+                wx.MessageDialog(None, "%s failed validation: %s" % (os.path.basename(job[1]), error), "",
+                                 wx.CENTRE | wx.STAY_ON_TOP).ShowModal()
+            self.validated = result is not None
+            if self.validated:
+                self.byts, self.validoffset = result
+            self.OnValidateMode(None)
+
+    def RequestValidation(self, job):
+        if job == self.validatejob:
+            return self.validated
+        self.validatejob = job
+        self.validated = False
+        self.validoffset = None
+        self.byts = None
+        dispatcher.send(signal="validate", sender=self, key=self.appid, job=job)
+        return False
+
+    def OnValidateMode(self, _event):
+        pass
+
     def Build(self):
         pass
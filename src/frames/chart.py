@@ -0,0 +1,80 @@
+import numpy as np
+import wx
+
+CHART_HZ = 20
+LABEL_WIDTH = 110
+SPANS = [["10 s", 10], ["1 min", 60], ["10 min", 600], ["1 h", 3600]]
+COLOURS = [(230, 80, 80), (240, 170, 60), (220, 220, 80), (100, 200, 100), (80, 190, 230), (140, 120, 240),
+           (230, 110, 200)]
+
+
+class StripChart(wx.Panel):
+
+    def __init__(self, parent, model, *args, **kwargs):
+        wx.Panel.__init__(self, parent, *args, **kwargs)
+        self.model = model
+        self.span = SPANS[1][1]
+        self.drawn = None
+        self.background = wx.Brush(wx.Colour(24, 24, 24))
+        self.grid = wx.Pen(wx.Colour(70, 70, 70))
+        self.pens = [wx.Pen(wx.Colour(*c)) for c in COLOURS]
+        self.SetBackgroundStyle(wx.BG_STYLE_PAINT)
+        self.SetMinSize((-1, 40 * len(model.channels)))
+        self.Bind(wx.EVT_PAINT, self.OnPaint)
+        self.Bind(wx.EVT_SIZE, self.OnSize)
+        # samples arrive far faster than anyone can watch, so repaints are driven by a capped timer instead
+        self.timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.OnTimer, self.timer)
+        self.timer.Start(1000 // CHART_HZ)
+
+    def SetSpan(self, span):
+        self.span = span
+        self.Refresh(False)
+
+    def OnTimer(self, event):
+        if self.drawn != self.model.version:
+            self.Refresh(False)
+
+    def OnSize(self, event):
+        self.Refresh(False)
+        event.Skip()
+
+    def OnPaint(self, event):
+        dc = wx.BufferedPaintDC(self)
+        self.drawn = self.model.version
+        w, h = self.GetClientSize()
+        dc.SetBackground(self.background)
+        dc.Clear()
+        n = len(self.model.channels)
+        if w <= LABEL_WIDTH or h < n * 8:
+            return
+        lane = h // n
+        plotw = w - LABEL_WIDTH
+        dc.SetFont(self.GetFont())
+        for c, (label, _, _) in enumerate(self.model.channels):
+            top = c * lane
+            dc.SetPen(self.grid)
+            dc.DrawLine(0, top + lane - 1, w, top + lane - 1)
+            buf = self.model.buffers[c]
+            dc.SetTextForeground(self.pens[c % len(self.pens)].GetColour())
+            dc.DrawText(label if buf.last is None else "%s %g" % (label, buf.last), 4, top + 2)
+            if self.model.latest is None:
+                continue
+            cols, lo, hi = buf.decimate(self.model.latest - self.span, self.model.latest, plotw)
+            if len(cols) == 0:
+                continue
+            vmin, vmax = float(lo.min()), float(hi.max())
+            if vmax - vmin < 1e-9:
+                vmin, vmax = vmin - 1, vmax + 1
+            scale = (lane - 6) / (vmax - vmin)
+            base = top + lane - 3
+            ylo = base - ((lo - vmin) * scale).astype(np.int64)
+            yhi = base - ((hi - vmin) * scale).astype(np.int64)
+            ymid = (ylo + yhi) // 2
+            x = cols + LABEL_WIDTH
+            # one min/max bar per pixel column, joined to the next so sparse stretches still read as a line
+            bars = np.column_stack((x, ylo, x, yhi))
+            joins = np.column_stack((x[:-1], ymid[:-1], x[1:], ymid[1:]))
+            dc.SetPen(self.pens[c % len(self.pens)])
+            dc.DrawLineList(np.vstack((bars, joins)).tolist())
+            dc.DrawText("%g" % vmax, w - 60, top + 2)
@@ -1,7 +1,15 @@
+import time
+
 import wx
 from eculib.honda import *
 
+from datalog.buffers import ChartModel
+from datalog.decoders import get_decoder
+from datalog.heatmap import LiveHeatmaps
+from datalog.view import REFRESH_HZ, DatalogView
 from .base import HondaECUAppPanel
+from .chart import SPANS, StripChart
+from .heatmap import HeatmapFrame
 
 
 def changeFontInChildren(win, font):
@@ -21,28 +29,12 @@ class HondaECUDatalogPanel(HondaECUAppPanel):
         self.appid = appid
         self.appinfo = appinfo
         self.enablestates = enablestates
+        self.ecmid = None
+        self.heatmaps = None
         self.Build()
         dispatcher.connect(self.KlineWorkerHandler, signal="KlineWorker", sender=dispatcher.Any)
         dispatcher.connect(self.DeviceHandler, signal="FTDIDevice", sender=dispatcher.Any)
-
-    @staticmethod
-    def prepare_data1(data, t):
-        if t in [0x13, 0x17]:
-            data = data[:9] + [0xff, 0xff] + data[9:]
-        data[1] = round(data[1] / 0xff * 5.0, 2)
-        data[2] = round(data[2] / 1.6, 2)
-        data[3] = round(data[3] / 0xff * 5.0, 2)
-        data[4] = -40 + data[4]
-        data[5] = round(data[5] / 0xff * 5.0, 2)
-        data[6] = -40 + data[6]
-        data[7] = round(data[7] / 0xff * 5.0, 2)
-        data[8] = 10 * data[8]
-        data[11] = round(data[11] / 10, 2)
-        data[13] = round(data[13] / 0xffff * 265.5, 2)
-        data[14] = round(-64 + data[14] / 0xff * 127.5, 2)
-        if t in [0x11]:
-            data[16] = round(data[16] / 0xffff * 8.0, 4)
-        return data
+        dispatcher.connect(self.ReplayHandler, signal="ReplayWorker", sender=dispatcher.Any)
 
     def clear_tables(self):
         for i, l in enumerate(self.sensors.keys()):
@@ -73,38 +65,40 @@ class HondaECUDatalogPanel(HondaECUAppPanel):
         self.d4psizer = wx.GridBagSizer()
 
         self.maintable = None
+        self.view = DatalogView()
+        self.rows = {}
         self.sensors = {
-            "Engine speed": [None, None, None, "rpm", 0, True, self.d1psizer, self.d1p],
-            "TPS sensor": [None, None, None, "%", 2, True, self.d1psizer, self.d1p],
-            "ECT sensor": [None, None, None, "°C", 4, True, self.d1psizer, self.d1p],
-            "IAT sensor": [None, None, None, "°C", 6, True, self.d1psizer, self.d1p],
-            "MAP sensor": [None, None, None, "mBar", 8, True, self.d1psizer, self.d1p],
-            "Battery voltage": [None, None, None, "V", 11, True, self.d1psizer, self.d1p],
-            "Vehicle speed": [None, None, None, "Km/h", 12, True, self.d1psizer, self.d1p],
-            "Injector duration": [None, None, None, "ms", 13, True, self.d1psizer, self.d1p],
-            "Ignition advance": [None, None, None, "°", 14, True, self.d1psizer, self.d1p],
-            "IACV pulse count": [None, None, None, "", 15, True, self.d1psizer, self.d1p],
-            "IACV command": [None, None, None, "", 16, True, self.d1psizer, self.d1p]
+            "Engine speed": [None, None, None, "rpm", "Engine speed", True, self.d1psizer, self.d1p],
+            "TPS sensor": [None, None, None, "%", "TPS sensor", True, self.d1psizer, self.d1p],
+            "ECT sensor": [None, None, None, "°C", "ECT sensor", True, self.d1psizer, self.d1p],
+            "IAT sensor": [None, None, None, "°C", "IAT sensor", True, self.d1psizer, self.d1p],
+            "MAP sensor": [None, None, None, "mBar", "MAP sensor", True, self.d1psizer, self.d1p],
+            "Battery voltage": [None, None, None, "V", "Battery voltage", True, self.d1psizer, self.d1p],
+            "Vehicle speed": [None, None, None, "Km/h", "Vehicle speed", True, self.d1psizer, self.d1p],
+            "Injector duration": [None, None, None, "ms", "Injector duration", True, self.d1psizer, self.d1p],
+            "Ignition advance": [None, None, None, "°", "Ignition advance", True, self.d1psizer, self.d1p],
+            "IACV pulse count": [None, None, None, "", "IACV pulse count", True, self.d1psizer, self.d1p],
+            "IACV command": [None, None, None, "", "IACV command", True, self.d1psizer, self.d1p]
         }
         self.o2sensor = {
             0x20: {
-                "O2 sensor #1": [None, None, None, "V", 0, True, self.d2psizer, self.d2p, self.d2pbox],
-                "O2 heater #1": [None, None, None, "V", 2, True, self.d2psizer, self.d2p, self.d2pbox],
-                "STFT #1": [None, None, None, "", 1, True, self.d2psizer, self.d2p, self.d2pbox]
+                "O2 sensor #1": [None, None, None, "V", "O2 sensor", True, self.d2psizer, self.d2p, self.d2pbox],
+                "O2 heater #1": [None, None, None, "V", "O2 heater", True, self.d2psizer, self.d2p, self.d2pbox],
+                "STFT #1": [None, None, None, "", "STFT", True, self.d2psizer, self.d2p, self.d2pbox]
             },
             0x21: {
-                "O2 sensor #2": [None, None, None, "V", 0, True, self.d3psizer, self.d3p, self.d3pbox],
-                "O2 heater #2": [None, None, None, "V", 2, True, self.d3psizer, self.d3p, self.d3pbox],
-                "STFT #2": [None, None, None, "", 1, True, self.d3psizer, self.d3p, self.d3pbox]
+                "O2 sensor #2": [None, None, None, "V", "O2 sensor", True, self.d3psizer, self.d3p, self.d3pbox],
+                "O2 heater #2": [None, None, None, "V", "O2 heater", True, self.d3psizer, self.d3p, self.d3pbox],
+                "STFT #2": [None, None, None, "", "STFT", True, self.d3psizer, self.d3p, self.d3pbox]
             },
         }
         self.sensors2 = {
-            "EGCV current": [None, None, None, "V", 5, True, self.d4psizer, self.d4p, self.d4pbox],
-            "EGCV target": [None, None, None, "V", 6, True, self.d4psizer, self.d4p, self.d4pbox],
-            "EGCV load": [None, None, None, "%", 7, True, self.d4psizer, self.d4p, self.d4pbox],
-            "HESD current": [None, None, None, "A", 8, True, self.d4psizer, self.d4p, self.d4pbox],
-            "HESD target": [None, None, None, "A", 9, True, self.d4psizer, self.d4p, self.d4pbox],
-            "HESD load": [None, None, None, "%", 10, True, self.d4psizer, self.d4p, self.d4pbox]
+            "EGCV current": [None, None, None, "V", "EGCV current", True, self.d4psizer, self.d4p, self.d4pbox],
+            "EGCV target": [None, None, None, "V", "EGCV target", True, self.d4psizer, self.d4p, self.d4pbox],
+            "EGCV load": [None, None, None, "%", "EGCV load", True, self.d4psizer, self.d4p, self.d4pbox],
+            "HESD current": [None, None, None, "A", "HESD current", True, self.d4psizer, self.d4p, self.d4pbox],
+            "HESD target": [None, None, None, "A", "HESD target", True, self.d4psizer, self.d4p, self.d4pbox],
+            "HESD load": [None, None, None, "%", "HESD load", True, self.d4psizer, self.d4p, self.d4pbox]
         }
         for i, l in enumerate(self.sensors.keys()):
             self.sensors[l][0] = wx.StaticText(self.sensors[l][7], label="%s:" % l)
@@ -176,8 +170,26 @@ class HondaECUDatalogPanel(HondaECUAppPanel):
 
         self.datap.SetSizer(self.datapsizer)
 
+        self.chartp = wx.Panel(self)
+        self.chart = StripChart(self.chartp, ChartModel())
+        self.spanl = wx.StaticText(self.chartp, label="History:")
+        self.span = wx.Choice(self.chartp, choices=[s[0] for s in SPANS])
+        self.span.SetSelection([s[1] for s in SPANS].index(self.chart.span))
+        self.span.Bind(wx.EVT_CHOICE, self.OnSpan)
+        self.spansizer = wx.BoxSizer(wx.HORIZONTAL)
+        self.spansizer.Add(self.spanl, 0, wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, border=5)
+        self.spansizer.Add(self.span, 0)
+        self.heatmapbutton = wx.Button(self.chartp, label="Cell heatmap")
+        self.heatmapbutton.Bind(wx.EVT_BUTTON, self.OnHeatmap)
+        self.spansizer.Add(self.heatmapbutton, 0, wx.LEFT, border=20)
+        self.chartpsizer = wx.BoxSizer(wx.VERTICAL)
+        self.chartpsizer.Add(self.spansizer, 0, wx.BOTTOM, border=5)
+        self.chartpsizer.Add(self.chart, 1, wx.EXPAND)
+        self.chartp.SetSizer(self.chartpsizer)
+
         self.mainsizer = wx.BoxSizer(wx.VERTICAL)
-        self.mainsizer.Add(self.datap, 1, wx.EXPAND)
+        self.mainsizer.Add(self.datap, 0, wx.EXPAND)
+        self.mainsizer.Add(self.chartp, 1, wx.EXPAND | wx.LEFT | wx.RIGHT | wx.BOTTOM, border=20)
 
         self.d2pbox.Disable()
         self.d3pbox.Disable()
@@ -216,6 +228,10 @@ class HondaECUDatalogPanel(HondaECUAppPanel):
         accel_tbl = wx.AcceleratorTable(at)
         self.SetAcceleratorTable(accel_tbl)
 
+        self.refresh = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.OnRefresh, self.refresh)
+        self.refresh.Start(1000 // REFRESH_HZ)
+
     def OnBig(self, event):
         f = self.fonts[event.GetId()]
         changeFontInChildren(self, f[0])
@@ -223,61 +239,92 @@ class HondaECUDatalogPanel(HondaECUAppPanel):
             s.SetHGap(f[1])
         self.Layout()
 
+    def OnSpan(self, event):
+        self.chart.SetSpan(SPANS[self.span.GetSelection()][1])
+
+    def OnHeatmap(self, event):
+        if self.heatmaps is None:
+            try:
+                self.heatmaps = LiveHeatmaps(self.parent.load_heatmaps(self.ecmid))
+            except (OSError, ValueError) as e:
+                wx.MessageDialog(None, "Heatmap unavailable: %s" % e, "", wx.CENTRE | wx.STAY_ON_TOP).ShowModal()
+                return
+        HeatmapFrame(self.parent, "Live cell heatmap", self.heatmaps.heatmaps, self.heatmaps).Show()
+
+    def fieldrow(self, t, name):
+        if t in [0x10, 0x11, 0x13, 0x17]:
+            rows = self.sensors.values()
+        elif t in self.o2sensor:
+            rows = self.o2sensor[t].values()
+        elif t == 0xd0:
+            rows = self.sensors2.values()
+        else:
+            return None
+        for row in rows:
+            if row[4] == name:
+                return row
+        return None
+
+    def OnRefresh(self, event):
+        changed = self.view.flush()
+        if len(changed) == 0:
+            return
+        relayout = False
+        for (t, name), text in changed.items():
+            if t in [0x10, 0x11, 0x13, 0x17] and self.maintable is None:
+                if t not in [0x11]:
+                    for s in ["IACV pulse count", "IACV command"]:
+                        self.sensors[s][0].Hide()
+                        self.sensors[s][1].Hide()
+                        self.sensors[s][2].Hide()
+                        self.sensors[s][5] = False
+                self.maintable = t
+                mt = "0x%x" % self.maintable
+                self.d1pboxsizer.GetStaticBox().SetLabel("Table " + mt)
+                relayout = True
+            key = (t, name)
+            if key not in self.rows:
+                self.rows[key] = self.fieldrow(t, name)
+            row = self.rows[key]
+            if row is None or not row[5]:
+                continue
+            # only a label that grew or shrank can move its neighbours
+            relayout |= len(row[1].GetLabel()) != len(text)
+            row[1].SetLabel(text)
+            if len(row) > 8 and not row[8].IsEnabled():
+                row[8].Enable()
+                relayout = True
+        if relayout:
+            self.Layout()
+
+    def set_ecmid(self, ecmid):
+        ecmid = ecmid if ecmid else None
+        if ecmid != self.ecmid:
+            self.heatmaps = None
+        self.ecmid = ecmid
+
+    def ReplayHandler(self, sender, info, value):
+        if info == "ecmid" and sender is self.parent.replayworker:
+            self.set_ecmid(value)
+        elif info in ["done", "error"] and self.parent.replayworker in [None, sender]:
+            # a stopped replay is already gone from the control panel when its last event arrives
+            self.set_ecmid(self.parent.ecuinfo.get("ecmid"))
+
     def KlineWorkerHandler(self, info, value):
-        if info == "data":
+        if info == "ecmid":
+            self.set_ecmid(value)
+        elif info == "data":
             t = value[0]
-            d = value[2][2:]
-            if t in [0x10, 0x11, 0x13, 0x17]:
-                u = ">H12B"
-                if t is not 0x13:
-                    u += "HB"
-                    if t == 0x11:
-                        u += "BH"
-                    elif t == 0x17:
-                        u += "BB"
-                data = HondaECUDatalogPanel.prepare_data1(list(struct.unpack(u, d)), t)
-                ld = len(data)
-                for s in self.sensors:
-                    if self.sensors[s][4] < ld:
-                        if self.sensors[s][5]:
-                            self.sensors[s][1].SetLabel(str(data[self.sensors[s][4]]))
-                if self.maintable is None:
-                    if t not in [0x11]:
-                        for s in ["IACV pulse count", "IACV command"]:
-                            self.sensors[s][0].Hide()
-                            self.sensors[s][1].Hide()
-                            self.sensors[s][2].Hide()
-                            self.sensors[s][5] = False
-                            self.Layout()
-                        # self.mainsizer.Fit(self)
-                    self.maintable = t
-                    mt = "0x%x" % self.maintable
-                    self.d1pboxsizer.GetStaticBox().SetLabel("Table " + mt)
-            if t in [0x20, 0x21]:
-                data = list(struct.unpack(">3B", d))
-                data[0] = round(data[0] / 0xff * 5, 2)
-                data[1] = round(data[1] / 0xff * 2, 4)
-                data[2] = round(data[2] / 0xff * 5, 2)
-                for s in self.o2sensor[t]:
-                    if self.o2sensor[t][s][5]:
-                        self.o2sensor[t][s][1].SetLabel(str(data[self.o2sensor[t][s][4]]))
-                        self.o2sensor[t][s][8].Enable()
-                        self.Layout()
-                    # self.mainsizer.Fit(self)
-            if t == 0xd0:
-                data = list(struct.unpack(">7Bb%dB" % (value[1] - 10), d))
-                data[5] = round(data[5] / 0xff * 5, 3)
-                data[6] = round(data[6] / 0xff * 5, 3)
-                # data[7] = round(data[7]/0xff*5, 2)
-                data[8] = round(data[8] / 0xff * 5, 3)
-                data[9] = round(data[9] / 0xff * 5, 3)
-                # data[10] = round(data[10]/0xff*5, 2)
-                for s in self.sensors2:
-                    if self.sensors2[s][5]:
-                        self.sensors2[s][1].SetLabel(str(data[self.sensors2[s][4]]))
-                        self.sensors2[s][8].Enable()
-                        self.Layout()
-                    # self.mainsizer.Fit(self)
+            decoder = get_decoder(t, self.ecmid)
+            if decoder is None or len(value[2]) - 2 < decoder.size:
+                return
+            decoded = decoder.decode(value[2][2:])
+            # samples only update the view and chart models, their timers repaint what changed at a fixed rate
+            self.view.update(t, decoder.format(decoded))
+            now = time.perf_counter()
+            self.chart.model.add(decoder, decoded, now)
+            if self.heatmaps is not None:
+                self.heatmaps.sample(decoder, decoded, now)
 
         elif info == "state":
             if value == ECUSTATE.OK:
@@ -285,6 +332,7 @@ class HondaECUDatalogPanel(HondaECUAppPanel):
             else:
                 wx.CallAfter(dispatcher.send, signal="DatalogPanel", sender=self, action="data.off")
                 self.clear_tables()
+                self.view.clear()
                 self.maintable = None
                 self.d1pboxsizer.GetStaticBox().SetLabel("Table 0x??")
             self.Layout()
@@ -295,6 +343,7 @@ class HondaECUDatalogPanel(HondaECUAppPanel):
             for s in self.sensors:
                 if self.sensors[s][5]:
                     self.sensors[s][1].SetLabel("---")
+            self.view.clear()
             self.d1pboxsizer.GetStaticBox().SetLabel("Table 0x??")
             self.Layout()
         # self.mainsizer.Fit(self)
@@ -1,7 +1,6 @@
-import os
-
 import wx
 from eculib.honda import *
+from threads.validation import file_job
 
 from .base import HondaECUAppPanel
 
@@ -98,20 +97,18 @@ class HondaECUEEPROMPanel(HondaECUAppPanel):
 
     def OnValidateMode(self, _event):
         enable = False
+        job = None
         if "state" in self.parent.ecuinfo:
             if self.parent.ecuinfo["state"] == ECUSTATE.SECURE:
                 if self.modebox.GetSelection() == 0:
                     enable = len(self.readfpicker.GetPath()) > 0
                 elif self.modebox.GetSelection() == 1:
                     if len(self.writefpicker.GetPath()) > 0:
-                        if os.path.isfile(self.writefpicker.GetPath()):
-                            fbin = open(self.writefpicker.GetPath(), "rb")
-                            nbyts = os.path.getsize(self.writefpicker.GetPath())
-                            if nbyts in [256, 512]:
-                                self.byts = bytearray(fbin.read(nbyts))
-                                enable = True
+                        job = file_job("eeprom", self.writefpicker.GetPath())
                 elif self.modebox.GetSelection() == 2:
                     enable = True
+        if self.RequestValidation(job):
+            enable = True
         if enable:
             self.gobutton.Enable()
         else:
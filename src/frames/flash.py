@@ -1,9 +1,8 @@
-import json
 import os
-import tarfile
 
 import wx
 from eculib.honda import *
+from threads.validation import file_job
 
 from .base import HondaECUAppPanel
 
@@ -32,7 +31,9 @@ class HondaECUFlashPanel(HondaECUAppPanel):
         self.offsetl = wx.StaticText(self.optsp, label="Start Offset")
         self.offset = wx.TextCtrl(self.optsp)
         self.offset.SetValue("0x0")
-        self.htfoffset = None
+        self.detect = wx.Button(self.optsp, label="Detect")
+        self.detect.SetToolTip(wx.ToolTip("Propose the checksum location and start offset for this image"))
+        self.layoutjob = None
 
         self.gobutton = wx.Button(self.mainp, label="Read")
         self.gobutton.Disable()
@@ -44,6 +45,7 @@ class HondaECUFlashPanel(HondaECUAppPanel):
         self.optsbox.Add(self.wchecksuml, 0, flag=wx.ALIGN_RIGHT | wx.ALIGN_CENTER_VERTICAL | wx.LEFT, border=10)
         self.optsbox.Add(self.checksum, 0, flag=wx.LEFT, border=5)
         self.optsbox.Add(self.fixchecksum, 0, flag=wx.ALIGN_LEFT | wx.ALIGN_CENTER_VERTICAL | wx.LEFT, border=10)
+        self.optsbox.Add(self.detect, 0, flag=wx.ALIGN_CENTER_VERTICAL | wx.LEFT, border=10)
         self.optsp.SetSizer(self.optsbox)
 
         self.fpickerbox = wx.BoxSizer(wx.HORIZONTAL)
@@ -98,11 +100,11 @@ class HondaECUFlashPanel(HondaECUAppPanel):
         self.readfpicker.Bind(wx.EVT_FILEPICKER_CHANGED, self.OnReadPicker)
         self.writefpicker.Bind(wx.EVT_FILEPICKER_CHANGED, self.OnWritePicker)
         self.fixchecksum.Bind(wx.EVT_CHECKBOX, self.OnFix)
+        self.detect.Bind(wx.EVT_BUTTON, self.OnDetect)
         self.gobutton.Bind(wx.EVT_BUTTON, self.OnGo)
         self.modebox.Bind(wx.EVT_RADIOBOX, self.OnModeChange)
 
     def OnWriteFileSelected(self, _event):
-        self.htfoffset = None
         self.doHTF = False
         if len(self.writefpicker.GetPath()) > 0:
             if os.path.splitext(self.writefpicker.GetPath())[-1] == ".htf":
@@ -111,12 +113,14 @@ class HondaECUFlashPanel(HondaECUAppPanel):
             self.checksum.Hide()
             self.wchecksuml.Hide()
             self.fixchecksum.Hide()
+            self.detect.Hide()
             self.offsetl.Hide()
             self.offset.Hide()
         else:
             self.checksum.Show()
             self.wchecksuml.Show()
             self.fixchecksum.Show()
+            self.detect.Show()
             self.offsetl.Show()
             self.offset.Show()
         self.Layout()
@@ -141,6 +145,42 @@ class HondaECUFlashPanel(HondaECUAppPanel):
             self.checksum.Disable()
         self.OnValidateMode(None)
 
+    def OnDetect(self, _event):
+        if len(self.writefpicker.GetPath()) == 0:
+            return
+        # the library layouts and the image scan run on the validation worker
+        self.layoutjob = file_job("layout", self.writefpicker.GetPath())
+        if self.layoutjob is not None:
+            self.detect.Disable()
+            dispatcher.send(signal="validate", sender=self, key="layout", job=self.layoutjob)
+
+    def ValidationHandler(self, key, job, result, error=None):
+        if key != "layout":
+            HondaECUAppPanel.ValidationHandler(self, key, job, result, error)
+            return
+        if job != self.layoutjob:
+            return
+        self.layoutjob = None
+        self.detect.Enable()
+        if error is not None:
+            wx.MessageDialog(None, "Detect failed: %s" % error, "", wx.CENTRE | wx.STAY_ON_TOP).ShowModal()
+        if result is not None:
+            self.ShowLayout(result)
+
+    def ShowLayout(self, layout):
+        if len(layout["offset"]) > 0:
+            best = layout["offset"][0]
+            self.offset.SetValue("0x%x" % best["offset"])
+            self.offset.SetToolTip(wx.ToolTip("\n".join("0x%x: %.0f%% (%s)" % (
+                c["offset"], c["confidence"] * 100, ", ".join(c["reasons"])) for c in layout["offset"])))
+        if len(layout["checksum"]) > 0:
+            best = layout["checksum"][0]
+            self.fixchecksum.SetValue(best["address"] > 0)
+            self.OnFix(None)
+            self.checksum.SetValue("0x%x" % best["address"])
+            self.checksum.SetToolTip(wx.ToolTip("\n".join("0x%x: %.0f%% (%s)" % (
+                c["address"], c["confidence"] * 100, ", ".join(c["reasons"])) for c in layout["checksum"])))
+
     def OnModeChange(self, _event):
         if self.modebox.GetSelection() == 0:
             self.gobutton.SetLabel("Read")
@@ -149,6 +189,7 @@ class HondaECUFlashPanel(HondaECUAppPanel):
             self.checksum.Hide()
             self.wchecksuml.Hide()
             self.fixchecksum.Hide()
+            self.detect.Hide()
             self.offsetl.Show()
             self.offset.Show()
             # self.passboxp.Show()
@@ -214,15 +255,16 @@ class HondaECUFlashPanel(HondaECUAppPanel):
             self.Layout()
             dispatcher.send(signal="ReadPanel", sender=self, data=data, offset=offset)
         else:
-            if self.htfoffset is not None:
-                offset = int(self.htfoffset, 16)
+            if self.doHTF and self.validoffset is not None:
+                offset = int(self.validoffset, 16)
             else:
                 offset = int(self.offset.GetValue(), 16)
             self.gobutton.Disable()
             dispatcher.send(signal="WritePanel", sender=self, data=self.byts, offset=offset)
 
-    def OnValidateMode(self, event):
+    def OnValidateMode(self, _event):
         enable = False
+        job = None
         if "state" in self.parent.ecuinfo:
             if self.modebox.GetSelection() == 0:
                 if self.parent.ecuinfo["state"] in [ECUSTATE.SECURE]:
@@ -238,53 +280,23 @@ class HondaECUFlashPanel(HondaECUAppPanel):
                 if self.parent.ecuinfo["state"] in [ECUSTATE.OK, ECUSTATE.RECOVER_NEW, ECUSTATE.RECOVER_OLD,
                                                     ECUSTATE.FLASH]:
                     if self.doHTF:
-                        enable = self.OnValidateModeHTF(event)
+                        job = self.ValidateJobHTF()
                     else:
-                        enable = self.OnValidateModeBin(event)
+                        job = self.ValidateJobBin()
+        if self.RequestValidation(job):
+            enable = True
         if enable:
             self.gobutton.Enable()
         else:
             self.gobutton.Disable()
         self.Layout()
 
-    def OnValidateModeHTF(self, _event):
+    def ValidateJobHTF(self):
         if len(self.writefpicker.GetPath()) > 0:
-            if os.path.isfile(self.writefpicker.GetPath()):
-                tar = tarfile.open(self.writefpicker.GetPath(), "r:xz")
-                binmod = None
-                metainfo = None
-                for f in tar.getnames():
-                    if f == "metainfo.json":
-                        metainfo = json.load(tar.extractfile(f))
-                    else:
-                        b, e = os.path.splitext(f)
-                        if e == ".bin":
-                            x, y = os.path.splitext(b)
-                            if y == ".mod":
-                                binmod = bytearray(tar.extractfile(f).read())
-                if binmod is not None and metainfo is not None:
-                    ea = int(metainfo["ecmidaddr"], 16)
-                    ka = int(metainfo["keihinaddr"], 16)
-                    if "offset" in metainfo:
-                        self.htfoffset = metainfo["offset"]
-                    if "rid" in metainfo and metainfo["rid"] is not None:
-                        for i in range(5):
-                            binmod[ea + i] ^= 0xFF
-                        for i in range(7):
-                            binmod[ka + i] = ord(metainfo["rid"][i])
-                    ret, status, self.byts = do_validation(binmod, len(binmod), int(metainfo["checksum"], 16))
-                    if status != "bad":
-                        return True
-        return False
-
-    def OnValidateModeBin(self, _event):
-        _offset = None
-        try:
-            _offset = int(self.offset.GetValue(), 16)
-        except TypeError:
-            pass
-        except ValueError:
-            pass
+            return file_job("htf", self.writefpicker.GetPath())
+        return None
+
+    def ValidateJobBin(self):
         checksum = -1
         if self.fixchecksum.IsChecked():
             try:
@@ -294,14 +306,5 @@ class HondaECUFlashPanel(HondaECUAppPanel):
             except ValueError:
                 pass
         if len(self.writefpicker.GetPath()) > 0:
-            if os.path.isfile(self.writefpicker.GetPath()):
-                fbin = open(self.writefpicker.GetPath(), "rb")
-                nbyts = os.path.getsize(self.writefpicker.GetPath())
-                byts = bytearray(fbin.read(nbyts))
-                fbin.close()
-                if checksum >= nbyts:
-                    return False
-                ret, status, self.byts = do_validation(byts, nbyts, checksum)
-                if status != "bad":
-                    return True
-        return False
+            return file_job("bin", self.writefpicker.GetPath(), checksum)
+        return None
@@ -0,0 +1,125 @@
+import numpy as np
+import wx
+
+HEATMAP_HZ = 5
+METRICS = [["Hits", "hits"], ["Dwell (s)", "dwell"], ["Mean O2 (V)", "o2"], ["Mean STFT", "stft"]]
+
+
+def metric_values(heatmap, metric):
+    if metric == "hits":
+        return heatmap.hits.astype(np.float64)
+    elif metric == "dwell":
+        return heatmap.dwell
+    elif metric == "o2":
+        return heatmap.mean_o2()
+    return heatmap.mean_stft()
+
+
+class HeatmapGrid(wx.Panel):
+
+    def __init__(self, parent, *args, **kwargs):
+        wx.Panel.__init__(self, parent, *args, **kwargs)
+        self.heatmap = None
+        self.metric = METRICS[0][1]
+        self.SetBackgroundStyle(wx.BG_STYLE_PAINT)
+        self.Bind(wx.EVT_PAINT, self.OnPaint)
+        self.Bind(wx.EVT_SIZE, lambda e: (self.Refresh(False), e.Skip()))
+
+    def OnPaint(self, event):
+        dc = wx.BufferedPaintDC(self)
+        dc.SetBackground(wx.Brush(self.GetBackgroundColour()))
+        dc.Clear()
+        if self.heatmap is None:
+            return
+        h = self.heatmap
+        rows, cols = h.shape
+        w, ht = self.GetClientSize()
+        left, top = 60, 24
+        cw = max((w - left) // cols, 1)
+        ch = max((ht - top) // rows, 1)
+        values = metric_values(h, self.metric)
+        finite = np.isfinite(values) & (h.hits > 0)
+        lo = float(values[finite].min()) if finite.any() else 0.0
+        hi = float(values[finite].max()) if finite.any() else 1.0
+        scale = np.zeros(values.shape)
+        if hi > lo:
+            scale[finite] = (values[finite] - lo) / (hi - lo)
+        elif finite.any():
+            scale[finite] = 1.0
+        dc.SetFont(self.GetFont().Smaller())
+        dc.SetPen(wx.Pen(wx.Colour(200, 200, 200)))
+        for c in range(cols):
+            dc.DrawText("%g" % h.xbreaks[c], left + c * cw + 2, 4)
+        for r in range(rows):
+            dc.DrawText("%g" % h.ybreaks[r], 4, top + r * ch + 2)
+            for c in range(cols):
+                if finite[r, c]:
+                    s = scale[r, c]
+                    # cold cells blue, busy cells red
+                    dc.SetBrush(wx.Brush(wx.Colour(int(255 * s), int(80 + 80 * (1 - abs(2 * s - 1))),
+                                                   int(255 * (1 - s)))))
+                else:
+                    dc.SetBrush(wx.Brush(wx.Colour(245, 245, 245)))
+                dc.DrawRectangle(left + c * cw, top + r * ch, cw, ch)
+
+
+class HeatmapFrame(wx.Frame):
+
+    def __init__(self, parent, title, heatmaps, live=None):
+        wx.Frame.__init__(self, parent, title="HondaECU :: %s" % title, size=(900, 700))
+        self.heatmaps = heatmaps
+        self.live = live
+        self.drawn = None
+        p = wx.Panel(self)
+        self.tablechoice = wx.Choice(p, choices=[h.title for h in heatmaps])
+        self.metricchoice = wx.Choice(p, choices=[m[0] for m in METRICS])
+        self.cell = wx.StaticText(p, label="")
+        self.grid = HeatmapGrid(p)
+        self.tablechoice.Bind(wx.EVT_CHOICE, self.OnChoice)
+        self.metricchoice.Bind(wx.EVT_CHOICE, self.OnChoice)
+        self.grid.Bind(wx.EVT_MOTION, self.OnMotion)
+        topsizer = wx.BoxSizer(wx.HORIZONTAL)
+        topsizer.Add(self.tablechoice, 0, wx.RIGHT, border=10)
+        topsizer.Add(self.metricchoice, 0, wx.RIGHT, border=10)
+        topsizer.Add(self.cell, 1, wx.ALIGN_CENTER_VERTICAL)
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(topsizer, 0, wx.EXPAND | wx.ALL, border=10)
+        sizer.Add(self.grid, 1, wx.EXPAND | wx.LEFT | wx.RIGHT | wx.BOTTOM, border=10)
+        p.SetSizer(sizer)
+        self.tablechoice.SetSelection(0)
+        self.metricchoice.SetSelection(0)
+        self.OnChoice(None)
+        if self.live is not None:
+            self.timer = wx.Timer(self)
+            self.Bind(wx.EVT_TIMER, self.OnTimer, self.timer)
+            self.timer.Start(1000 // HEATMAP_HZ)
+        self.Bind(wx.EVT_CLOSE, self.OnClose)
+        self.Center()
+
+    def OnChoice(self, event):
+        self.grid.heatmap = self.heatmaps[self.tablechoice.GetSelection()]
+        self.grid.metric = METRICS[self.metricchoice.GetSelection()][1]
+        self.grid.Refresh(False)
+
+    def OnTimer(self, event):
+        if self.drawn != self.live.version:
+            self.drawn = self.live.version
+            self.grid.Refresh(False)
+
+    def OnMotion(self, event):
+        h = self.grid.heatmap
+        w, ht = self.grid.GetClientSize()
+        cw = max((w - 60) // h.shape[1], 1)
+        ch = max((ht - 24) // h.shape[0], 1)
+        c = (event.GetX() - 60) // cw
+        r = (event.GetY() - 24) // ch
+        if 0 <= r < h.shape[0] and 0 <= c < h.shape[1]:
+            self.cell.SetLabel("%s %g, %s %g: %d hits, %.1f s, O2 %.2f V, STFT %.3f" % (
+                h.xfield, h.xbreaks[c], h.yfield, h.ybreaks[r], h.hits[r, c], h.dwell[r, c], h.mean_o2()[r, c],
+                h.mean_stft()[r, c]))
+        event.Skip()
+
+    def OnClose(self, event):
+        if self.live is not None:
+            self.timer.Stop()
+        self.Destroy()
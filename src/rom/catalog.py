@@ -0,0 +1,186 @@
+import glob
+import hashlib
+import json
+import os
+import string
+
+from ecmids import ECM_IDs, ECM_PNs
+
+from .pack import PACK_FILE, PackStore
+
+CATALOG_FILE = "catalog.json"
+
+MAPID_SIZE = 7
+
+
+def pn_from_path(path):
+    return os.path.splitext(os.path.basename(path))[0].replace("_", "-").upper()
+
+
+def sha256_file(path, blocksize=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as fbin:
+        for block in iter(lambda: fbin.read(blocksize), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def decode_mapid(raw):
+    try:
+        mapid = raw.decode("ascii")
+    except UnicodeDecodeError:
+        return None
+    if len(mapid) != MAPID_SIZE or not all(c in string.printable for c in mapid):
+        return None
+    return mapid
+
+
+def read_mapid(path, keihinaddr):
+    with open(path, "rb") as fbin:
+        fbin.seek(int(keihinaddr, 16))
+        return decode_mapid(fbin.read(MAPID_SIZE))
+
+
+def pn_ecmid(pn, byts=None):
+    # when several ECM ids share a part number, the one the image stores at its ecmidaddr is the one it is
+    ecmids = ECM_PNs.get(pn, [])
+    if len(ecmids) > 1 and byts is not None:
+        for ecmid in ecmids:
+            info = ECM_IDs[ecmid]
+            if "ecmidaddr" in info:
+                ea = int(info["ecmidaddr"], 16)
+                if bytes(byts[ea:(ea + 5)]) == ecmid:
+                    return ecmid
+    return ecmids[0] if len(ecmids) == 1 else None
+
+
+def describe_image(path, relpath):
+    with open(path, "rb") as fbin:
+        byts = fbin.read()
+    pn = pn_from_path(path)
+    ecmid = pn_ecmid(pn, byts)
+    info = ECM_IDs[ecmid] if ecmid is not None else {}
+    mapid = None
+    if "keihinaddr" in info:
+        ka = int(info["keihinaddr"], 16)
+        mapid = decode_mapid(byts[ka:(ka + MAPID_SIZE)])
+    return {
+        "file": relpath.replace(os.sep, "/"),
+        "pn": pn,
+        "ecmid": ecmid.hex() if ecmid is not None else None,
+        "model": info.get("model"),
+        "size": len(byts),
+        "sha256": hashlib.sha256(byts).hexdigest(),
+        "checksum": info.get("checksum"),
+        "checksum_valid": sum(byts) & 0xFF == 0,
+        "keihinaddr": info.get("keihinaddr"),
+        "mapid": mapid,
+        "offset": info.get("offset"),
+    }
+
+
+def build_catalog(binsdir):
+    images = []
+    for path in sorted(glob.glob(os.path.join(binsdir, "*", "*"))):
+        if os.path.splitext(path)[-1].lower() in [".bin", ".fsd"]:
+            images.append(describe_image(path, os.path.relpath(path, binsdir)))
+    return {"version": 1, "images": images}
+
+
+class BinCatalog(object):
+
+    def __init__(self, catalog=None, basedir=None, pack=None):
+        self.basedir = basedir
+        self.pack = pack
+        self.images = catalog["images"] if catalog else []
+        self.by_hash = {}
+        self.by_pn = {}
+        self.by_ecmid = {}
+        self.by_mapid = {}
+        # map id addresses seen for each image size, so an unnamed dump only needs a few 7 byte reads
+        self.mapid_addrs = {}
+        for entry in self.images:
+            self.by_hash.setdefault(entry["sha256"], entry)
+            self.by_pn.setdefault(entry["pn"], []).append(entry)
+            if entry["ecmid"] is not None:
+                self.by_ecmid.setdefault(bytes.fromhex(entry["ecmid"]), entry)
+            if entry["mapid"] is not None:
+                self.by_mapid.setdefault(entry["mapid"], entry)
+                addrs = self.mapid_addrs.setdefault(entry["size"], [])
+                if entry["keihinaddr"] not in addrs:
+                    addrs.append(entry["keihinaddr"])
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.isfile(path):
+            return cls()
+        basedir = os.path.dirname(path)
+        # release builds ship the images as a pack, a checkout has the raw files as well
+        packpath = os.path.join(basedir, PACK_FILE)
+        pack = PackStore(packpath) if os.path.isfile(packpath) else None
+        with open(path, "r") as fcat:
+            return cls(json.load(fcat), basedir, pack)
+
+    def close(self):
+        if self.pack is not None:
+            self.pack.close()
+            self.pack = None
+
+    def save(self, path):
+        with open(path, "w") as fcat:
+            json.dump({"version": 1, "images": self.images}, fcat, indent=1)
+
+    def __len__(self):
+        return len(self.images)
+
+    def path(self, entry):
+        return os.path.join(self.basedir, *entry["file"].split("/"))
+
+    def available(self, entry):
+        return os.path.isfile(self.path(entry)) or (self.pack is not None and entry["file"] in self.pack)
+
+    def read(self, entry):
+        path = self.path(entry)
+        if os.path.isfile(path):
+            with open(path, "rb") as fbin:
+                return fbin.read()
+        if self.pack is not None and entry["file"] in self.pack:
+            return self.pack.read_image(entry["file"])
+        raise OSError("%s is not in the bin library" % entry["file"])
+
+    def lookup_pn(self, pn, size=None):
+        # a part number can be catalogued more than once, the size picks the dump that matches
+        entries = self.by_pn.get(pn.replace("_", "-").upper(), [])
+        for entry in entries:
+            if size is None or entry["size"] == size:
+                return entry
+        return None
+
+    def lookup_ecmid(self, ecmid):
+        return self.by_ecmid.get(bytes(ecmid))
+
+    def lookup_hash(self, sha256):
+        return self.by_hash.get(sha256)
+
+    def identify(self, path, verify=False):
+        # by name and size, the content hash is only computed when asked to
+        if verify:
+            return self.lookup_hash(sha256_file(path))
+        return self.lookup_pn(pn_from_path(path), os.path.getsize(path))
+
+    def map_id(self, path):
+        addrs = [ECM_IDs[ecmid]["keihinaddr"] for ecmid in ECM_PNs.get(pn_from_path(path), [])
+                 if "keihinaddr" in ECM_IDs[ecmid]]
+        if len(addrs) == 1:
+            return read_mapid(path, addrs[0])
+        for addr in addrs + self.mapid_addrs.get(os.path.getsize(path), []):
+            mapid = read_mapid(path, addr)
+            if mapid in self.by_mapid:
+                return mapid
+        return None
+
+    def validate(self, path):
+        entry = self.identify(path)
+        if entry is not None:
+            return entry["checksum_valid"]
+        return None
@@ -0,0 +1,96 @@
+import numpy as np
+
+# below this size the builtin sum over a memoryview beats the numpy call overhead
+SMALL_BUFFER = 2048
+
+
+def as_array(byts):
+    if isinstance(byts, np.ndarray):
+        return byts.view(np.uint8).reshape(-1)
+    return np.frombuffer(byts, dtype=np.uint8)
+
+
+def byte_sum(byts, start=0, end=None):
+    if end is None:
+        end = len(byts)
+    if isinstance(byts, (list, tuple)):
+        return sum(byts[start:end])
+    if end - start < SMALL_BUFFER and not isinstance(byts, np.ndarray):
+        return sum(memoryview(byts)[start:end])
+    return int(as_array(byts)[start:end].sum(dtype=np.uint64))
+
+
+def checksum8bitHonda(byts):
+    return -byte_sum(byts) & 0xFF
+
+
+def checksum8bit(byts):
+    return 0xff - ((byte_sum(byts) - 1) >> 8)
+
+
+def validate_checksums(byts, nbyts, cksum):
+    fixed = False
+    total = byte_sum(byts, 0, nbyts)
+    if 0 < cksum < nbyts:
+        total -= byts[cksum]
+        byts[cksum] = -total & 0xFF
+        total += byts[cksum]
+        fixed = True
+    return total & 0xFF == 0, fixed, byts
+
+
+def do_validation(byts, nbyts, cksum=0):
+    status = "good"
+    ret, fixed, byts = validate_checksums(byts, nbyts, cksum)
+    if not ret:
+        status = "bad"
+    elif fixed:
+        status = "fixed"
+    return ret, status, byts
+
+
+class PrefixSums(object):
+
+    def __init__(self, byts):
+        self.sums = np.zeros(len(byts) + 1, dtype=np.uint64)
+        np.cumsum(as_array(byts), dtype=np.uint64, out=self.sums[1:])
+
+    def __len__(self):
+        return len(self.sums) - 1
+
+    def range_sum(self, start, end):
+        return int(self.sums[end] - self.sums[start])
+
+    def range_sums(self, starts, ends):
+        return self.sums[ends] - self.sums[starts]
+
+    def checksum(self, start=0, end=None, exclude=None):
+        if end is None:
+            end = len(self)
+        s = self.range_sum(start, end)
+        if exclude is not None and start <= exclude < end:
+            s -= self.range_sum(exclude, exclude + 1)
+        return -s & 0xFF
+
+
+class RunningChecksum(object):
+
+    def __init__(self, byts, cksum=None):
+        self.byts = byts
+        self.cksum = cksum
+        self.total = byte_sum(byts)
+
+    def patch(self, addr, data):
+        end = addr + len(data)
+        self.total += byte_sum(data) - byte_sum(self.byts, addr, end)
+        self.byts[addr:end] = data
+
+    def fix(self):
+        if self.cksum is not None:
+            old = self.byts[self.cksum]
+            self.byts[self.cksum] = (old - self.total) & 0xFF
+            self.total += self.byts[self.cksum] - old
+        return self.valid()
+
+    def valid(self):
+        return self.total & 0xFF == 0
@@ -0,0 +1,111 @@
+import numpy as np
+
+from .checksum import as_array
+
+
+def diff_ranges(a, b, merge_gap=0):
+    a = as_array(a)
+    b = as_array(b)
+    n = min(len(a), len(b))
+    changed = np.empty(n + 2, dtype=np.int8)
+    changed[0] = changed[-1] = 0
+    np.not_equal(a[:n], b[:n], out=changed[1:-1].view(np.bool_))
+    edges = np.flatnonzero(np.diff(changed))
+    starts = edges[0::2]
+    ends = edges[1::2]
+    if merge_gap > 0 and len(starts) > 1:
+        keep = (starts[1:] - ends[:-1]) > merge_gap
+        starts = starts[np.concatenate(([True], keep))]
+        ends = ends[np.concatenate((keep, [True]))]
+    if len(a) != len(b):
+        starts = np.append(starts, n)
+        ends = np.append(ends, max(len(a), len(b)))
+    return starts, ends
+
+
+def xdf_regions(xdfdef, tables):
+    regions = []
+    for t in xdfdef.tables:
+        z = t["axes"].get("z")
+        if z is not None and z["data"] is not None and z["data"]["address"] is not None:
+            start, end = tables.span(t["id"])
+            regions.append((start, end, t["title"]))
+    for f in xdfdef.flags:
+        if f["data"] is not None and f["data"]["address"] is not None:
+            start = f["data"]["address"] + xdfdef.baseoffset
+            regions.append((start, start + f["data"]["elementsize"] // 8, f["title"]))
+    return regions
+
+
+def ecm_regions(info):
+    regions = []
+    if "checksum" in info and int(info["checksum"], 16) > 0:
+        regions.append((int(info["checksum"], 16), int(info["checksum"], 16) + 1, "Checksum"))
+    if "ecmidaddr" in info:
+        regions.append((int(info["ecmidaddr"], 16), int(info["ecmidaddr"], 16) + 5, "ECM ID"))
+    if "keihinaddr" in info:
+        regions.append((int(info["keihinaddr"], 16), int(info["keihinaddr"], 16) + 7, "Map ID"))
+    return regions
+
+
+class RegionIndex(object):
+
+    def __init__(self, regions):
+        regions = sorted(regions)
+        self.titles = [r[2] for r in regions]
+        self.starts = np.array([r[0] for r in regions], dtype=np.int64)
+        self.ends = np.array([r[1] for r in regions], dtype=np.int64)
+        # running maximum of the end addresses lets a lookup stop scanning as soon as nothing earlier can overlap
+        self.maxends = np.maximum.accumulate(self.ends) if len(regions) > 0 else self.ends
+
+    def overlaps(self, starts, ends):
+        if len(self.starts) == 0:
+            return np.zeros(len(starts), dtype=np.bool_)
+        i = np.searchsorted(self.starts, ends, side="left") - 1
+        return (i >= 0) & (self.maxends[np.maximum(i, 0)] > starts)
+
+    def covering(self, start, end):
+        found = []
+        i = int(np.searchsorted(self.starts, end, side="left")) - 1
+        while i >= 0 and self.maxends[i] > start:
+            if self.ends[i] > start:
+                found.append(self.titles[i])
+            i -= 1
+        return found[::-1]
+
+
+class ROMDiff(object):
+
+    def __init__(self, a, b, regions=None, merge_gap=0):
+        self.size = (len(a), len(b))
+        self.starts, self.ends = diff_ranges(a, b, merge_gap)
+        self.index = RegionIndex(regions or [])
+
+    def __len__(self):
+        return len(self.starts)
+
+    def ranges(self):
+        for start, end in zip(self.starts.tolist(), self.ends.tolist()):
+            yield start, end, self.index.covering(start, end)
+
+    def changed_bytes(self):
+        return int((self.ends - self.starts).sum())
+
+    def summary(self, detail=False):
+        sizes = self.ends - self.starts
+        mapped = np.flatnonzero(self.index.overlaps(self.starts, self.ends))
+        regions = {}
+        for i in mapped.tolist():
+            for t in self.index.covering(int(self.starts[i]), int(self.ends[i])):
+                regions[t] = regions.get(t, 0) + int(sizes[i])
+        summary = {
+            "size": list(self.size),
+            "ranges": len(self),
+            "changed": int(sizes.sum()),
+            "unmapped": int(sizes.sum() - sizes[mapped].sum()),
+            "regions": regions,
+        }
+        if detail:
+            summary["diff"] = [{"start": "0x%x" % start, "end": "0x%x" % end, "size": end - start, "regions": titles}
+                               for start, end, titles in self.ranges()]
+        return summary
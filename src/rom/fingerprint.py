@@ -0,0 +1,85 @@
+import numpy as np
+
+from .checksum import as_array
+
+BLOCK_SIZE = 4096
+NUM_HASHES = 64
+CANDIDATES = 16
+
+# fixed seeds keep signatures comparable between runs
+rng = np.random.RandomState(0x4844)
+BLOCK_WEIGHTS = rng.randint(1, 1 << 62, size=BLOCK_SIZE // 8, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+MINHASH_A = rng.randint(1, 1 << 62, size=(NUM_HASHES, 1), dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+MINHASH_B = rng.randint(0, 1 << 62, size=(NUM_HASHES, 1), dtype=np.uint64)
+
+
+def mix64(x):
+    x = x ^ (x >> np.uint64(33))
+    x = x * np.uint64(0xff51afd7ed558ccd)
+    x = x ^ (x >> np.uint64(33))
+    x = x * np.uint64(0xc4ceb9fe1a85ec53)
+    return x ^ (x >> np.uint64(33))
+
+
+def block_hashes(byts):
+    byts = as_array(byts)
+    nblocks = -(-len(byts) // BLOCK_SIZE)
+    blocks = np.full(nblocks * BLOCK_SIZE, 0xff, dtype=np.uint8)
+    blocks[:len(byts)] = byts
+    blocks = blocks.reshape(nblocks, BLOCK_SIZE)
+    # erased and filler blocks are shared by every image and say nothing about which ROM this is
+    blocks = blocks[~(blocks == blocks[:, :1]).all(axis=1)]
+    with np.errstate(over="ignore"):
+        words = blocks.view("<u8")
+        hashes = mix64((words * BLOCK_WEIGHTS).sum(axis=1, dtype=np.uint64))
+    return np.unique(hashes)
+
+
+def minhash(hashes):
+    if len(hashes) == 0:
+        return np.full(NUM_HASHES, np.iinfo(np.uint64).max, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        return mix64(MINHASH_A * hashes[np.newaxis, :] + MINHASH_B).min(axis=1)
+
+
+def jaccard(a, b):
+    union = len(np.union1d(a, b))
+    if union == 0:
+        return 0.0
+    return len(np.intersect1d(a, b, assume_unique=True)) / union
+
+
+class FingerprintIndex(object):
+
+    def __init__(self):
+        self.keys = []
+        self.hashes = []
+        self.signatures = np.empty((0, NUM_HASHES), dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key, byts):
+        hashes = block_hashes(byts)
+        self.keys.append(key)
+        self.hashes.append(hashes)
+        self.signatures = np.vstack((self.signatures, minhash(hashes)))
+
+    @classmethod
+    def build(cls, catalog):
+        index = cls()
+        for entry in catalog.images:
+            if catalog.available(entry):
+                index.add(entry, catalog.read(entry))
+        return index
+
+    def nearest(self, byts, n=5):
+        if len(self.keys) == 0:
+            return []
+        hashes = block_hashes(byts)
+        # estimate against every image from the signatures, then score the best candidates exactly
+        estimate = (self.signatures == minhash(hashes)).mean(axis=1)
+        candidates = np.argsort(-estimate, kind="stable")[:max(n, CANDIDATES)]
+        scores = [(self.keys[i], jaccard(hashes, self.hashes[i])) for i in candidates.tolist()]
+        scores.sort(key=lambda s: -s[1])
+        return [s for s in scores[:n] if s[1] > 0]
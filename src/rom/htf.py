@@ -0,0 +1,121 @@
+import hashlib
+import io
+import json
+import struct
+import tarfile
+
+from .diff import diff_ranges
+
+METAINFO_FILE = "metainfo.json"
+DELTA_EXT = ".delta"
+MOD_EXT = ".mod.bin"
+
+DELTA_MAGIC = b"HDLT"
+DELTA_HEADER = struct.Struct("<4sI")
+DELTA_EDIT = struct.Struct("<II")
+
+
+def encode_delta(base, mod, merge_gap=8):
+    if len(base) != len(mod):
+        raise ValueError("base image is %d bytes, tune is %d bytes" % (len(base), len(mod)))
+    starts, ends = diff_ranges(base, mod, merge_gap)
+    out = bytearray(DELTA_HEADER.pack(DELTA_MAGIC, len(starts)))
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        out += DELTA_EDIT.pack(start, end - start)
+        out += mod[start:end]
+    return bytes(out)
+
+
+def read_exact(f, n):
+    data = f.read(n)
+    if len(data) != n:
+        raise ValueError("truncated delta")
+    return data
+
+
+def stream_patch(byts, fdelta, cancelled=None):
+    # edits are applied as they are read so memory use and time follow the size of the delta
+    magic, count = DELTA_HEADER.unpack(read_exact(fdelta, DELTA_HEADER.size))
+    if magic != DELTA_MAGIC:
+        raise ValueError("not a delta")
+    view = memoryview(byts)
+    for _ in range(count):
+        if cancelled is not None and cancelled():
+            return None
+        addr, n = DELTA_EDIT.unpack(read_exact(fdelta, DELTA_EDIT.size))
+        if addr + n > len(byts):
+            raise ValueError("delta edit at 0x%x is outside the base image" % addr)
+        if fdelta.readinto(view[addr:(addr + n)]) != n:
+            raise ValueError("truncated delta")
+    return byts
+
+
+def add_member(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def write_htf(path, name, mod, metainfo, base=None, base_entry=None, full=False):
+    metainfo = dict(metainfo)
+    metainfo["sha256"] = hashlib.sha256(mod).hexdigest()
+    if base is not None:
+        metainfo["base"] = {"pn": base_entry["pn"], "sha256": base_entry["sha256"], "size": base_entry["size"]}
+    with tarfile.open(path, "w:xz") as tar:
+        # metainfo goes first so a reader knows the base before the delta arrives
+        add_member(tar, METAINFO_FILE, json.dumps(metainfo, indent=1).encode("ascii"))
+        if base is not None:
+            add_member(tar, name + DELTA_EXT, encode_delta(base, mod))
+        if base is None or full:
+            add_member(tar, name + MOD_EXT, bytes(mod))
+
+
+def load_base(catalog, base):
+    if catalog is None:
+        return None
+    entry = catalog.lookup_hash(base["sha256"])
+    if entry is None or entry["size"] != base["size"]:
+        return None
+    if not catalog.available(entry):
+        return None
+    byts = bytearray(catalog.read(entry))
+    if hashlib.sha256(byts).hexdigest() != base["sha256"]:
+        return None
+    return byts
+
+
+def read_htf(path, catalog=None, cancelled=None):
+    metainfo = None
+    binmod = None
+    delta = None
+    havebase = False
+    with tarfile.open(path, "r:xz") as tar:
+        for member in tar:
+            if cancelled is not None and cancelled():
+                return None
+            if member.name == METAINFO_FILE:
+                metainfo = json.load(tar.extractfile(member))
+            elif member.name.endswith(DELTA_EXT):
+                if metainfo is not None and "base" in metainfo:
+                    byts = load_base(catalog, metainfo["base"])
+                    havebase = byts is not None
+                    if havebase:
+                        try:
+                            delta = stream_patch(byts, tar.extractfile(member), cancelled)
+                        except ValueError:
+                            delta = None
+            elif member.name.endswith(MOD_EXT):
+                binmod = bytearray(tar.extractfile(member).read())
+    if metainfo is None:
+        return None
+    if delta is not None and hashlib.sha256(delta).hexdigest() == metainfo.get("sha256"):
+        return delta, metainfo
+    # fall back to the full image when the base is missing or the rebuilt image does not match
+    if binmod is not None:
+        return binmod, metainfo
+    if "base" in metainfo:
+        base = metainfo["base"]
+        raise ValueError("this tune only stores changes against %s (sha256 %s), %s; use a full-image HTF instead" % (
+            base["pn"], base["sha256"][:12], "which did not rebuild to the tune's hash" if havebase else
+            "which is not in this build's bin library"))
+    return None
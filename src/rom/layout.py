@@ -0,0 +1,131 @@
+from collections import Counter
+
+import numpy as np
+
+from .checksum import PrefixSums, as_array
+
+PAGE_SIZE = 0x1000
+PAGE_TAIL = 16
+FILLER = np.isin(np.arange(256), [0x00, 0xaa, 0xff])
+ALNUM = np.isin(np.arange(256), list(b"0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+PARTID_SIZE = 8
+VECTOR_TABLE = 36
+OFFSETS = [0x0, 0x4000, 0x8000]
+# the flash write protocol addresses 16 byte blocks with 16 bits
+ADDRESS_SPACE = 0x100000
+
+
+def library_layouts(catalog):
+    layouts = {}
+    for entry in catalog.images:
+        layout = layouts.setdefault(entry["size"], {"count": 0, "checksums": 0, "checksum": Counter(),
+                                                    "offset": Counter()})
+        layout["count"] += 1
+        if entry["checksum"] is not None:
+            layout["checksums"] += 1
+            layout["checksum"][int(entry["checksum"], 16)] += 1
+        layout["offset"][int(entry["offset"], 16) if entry["offset"] is not None else 0] += 1
+    return layouts
+
+
+def count_where(mask):
+    # prefix sums over a boolean mask answer "how many in [start, end)" for every candidate at once
+    return PrefixSums(mask.view(np.uint8))
+
+
+def checksum_candidates(byts, layouts=None, top=5):
+    byts = as_array(byts)
+    n = len(byts)
+    if n == 0:
+        return []
+    sums = PrefixSums(byts)
+    total = sums.range_sum(0, n)
+    addr = np.arange(n, dtype=np.int64)
+    # a filler value between two different bytes is data, e.g. a checksum that happens to be 0x00 in erased flash
+    isolated = np.zeros(n, dtype=np.bool_)
+    isolated[1:-1] = (byts[1:-1] != byts[:-2]) & (byts[1:-1] != byts[2:])
+    data = ~FILLER[byts] | isolated
+    datacount = count_where(data)
+    # a checksum closing a page: the last data byte of the page, near its end, with only filler after it
+    pageend = np.minimum((addr // PAGE_SIZE + 1) * PAGE_SIZE, n)
+    tail = ((pageend - addr) <= PAGE_TAIL) & (datacount.range_sums(addr + 1, pageend) == 0) & data
+    pages = -(-n // PAGE_SIZE)
+    erased = np.ones(pages + 1, dtype=np.bool_)
+    erased[:n // PAGE_SIZE] = (byts[:n // PAGE_SIZE * PAGE_SIZE].reshape(-1, PAGE_SIZE) == 0xff).all(axis=1)
+    closing = tail & ((pageend == n) | erased[np.minimum(pageend // PAGE_SIZE, pages)])
+    # a checksum in front of an ASCII part ID such as "KYJA203 "
+    alnum = count_where(ALNUM[byts])
+    idend = np.minimum(addr + PARTID_SIZE, n - 1)
+    partid = (addr + PARTID_SIZE < n) & (alnum.range_sums(addr + 1, idend) == PARTID_SIZE - 1) \
+        & (byts[idend] == 0x20)
+    # on its own the part id only breaks ties, the byte in front of it is data as often as it is a checksum;
+    # a part id that closes the page takes over the page end evidence from its last byte
+    idtail = partid & tail[idend]
+    score = 0.3 * tail + 0.1 * closing + 0.05 * partid + 0.4 * idtail
+    prior = {}
+    if layouts is not None and n in layouts and layouts[n]["checksums"] > 0:
+        prior = {a: c / layouts[n]["checksums"] for a, c in layouts[n]["checksum"].items() if a < n}
+    for a, p in prior.items():
+        score[a] += 0.5 * p
+    candidates = []
+    for a in np.argsort(-score, kind="stable")[:top].tolist():
+        if score[a] <= 0:
+            break
+        reasons = []
+        if a in prior:
+            reasons.append("library")
+        if tail[a]:
+            reasons.append("page end")
+        if partid[a]:
+            reasons.append("part id")
+        candidates.append({
+            "address": a,
+            "value": (-(total - int(byts[a]))) & 0xff,
+            "confidence": min(float(score[a]), 1.0),
+            "reasons": reasons,
+        })
+    return candidates
+
+
+def offset_candidates(byts, layouts=None):
+    byts = as_array(byts)
+    n = len(byts)
+    end = n // 4 * 4
+    vectors = byts[max(0, end - VECTOR_TABLE):end].reshape(-1, 4).astype(np.int64)
+    vectors = vectors[(vectors[:, :3] != 0xff).any(axis=1)]
+    targets = vectors[:, 0] | (vectors[:, 1] << 8) | (vectors[:, 2] << 16)
+    partid = n > PARTID_SIZE and ALNUM[byts[1:PARTID_SIZE]].all() and byts[PARTID_SIZE] == 0x20
+    candidates = []
+    for offset in OFFSETS:
+        if offset + n > ADDRESS_SPACE:
+            continue
+        score = 0.0
+        reasons = []
+        if layouts is not None and n in layouts and layouts[n]["count"] > 0:
+            p = layouts[n]["offset"].get(offset, 0) / layouts[n]["count"]
+            if p > 0:
+                score += 0.5 * p
+                reasons.append("library")
+        if len(targets) > 0:
+            # interrupt vectors at the end of the image have to point back into it
+            inside = float(((targets >= offset) & (targets < offset + n)).mean())
+            if inside > 0:
+                score += 0.4 * inside
+                reasons.append("vectors")
+        if partid and offset == 0x8000:
+            score += 0.4
+            reasons.append("part id header")
+        if offset == 0 and n >= 0x40000:
+            score += 0.4
+            reasons.append("full flash image")
+        candidates.append({"offset": offset, "confidence": min(score, 1.0), "reasons": reasons})
+    candidates.sort(key=lambda c: -c["confidence"])
+    return candidates
+
+
+def analyse(byts, layouts=None):
+    return {
+        "valid": -PrefixSums(byts).range_sum(0, len(byts)) & 0xff == 0,
+        "checksum": checksum_candidates(byts, layouts),
+        "offset": offset_candidates(byts, layouts),
+    }
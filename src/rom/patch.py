@@ -0,0 +1,70 @@
+import numpy as np
+
+from .checksum import RunningChecksum, as_array
+
+
+class TunePatch(object):
+
+    def __init__(self, byts, cksum=None):
+        if cksum is not None and not 0 < cksum < len(byts):
+            cksum = None
+        self.byts = byts
+        self.cksum = cksum
+        self.running = RunningChecksum(byts, cksum)
+        self.original = {}
+
+    def remember(self, addr, old):
+        for i, b in enumerate(old):
+            self.original.setdefault(addr + i, b)
+
+    def apply(self, addr, data):
+        data = bytes(data)
+        self.remember(addr, bytes(self.byts[addr:(addr + len(data))]))
+        self.running.patch(addr, data)
+
+    def apply_table(self, tables, key, values, units=False):
+        start, end = tables.span(key)
+        old = np.array(as_array(self.byts)[start:end])
+        if units:
+            tables.write_values(key, values)
+        else:
+            tables.write(key, values)
+        new = as_array(self.byts)[start:end]
+        changed = np.flatnonzero(new != old)
+        for i in changed:
+            self.original.setdefault(start + int(i), int(old[i]))
+        self.running.total += int(new[changed].sum(dtype=np.int64)) - int(old[changed].sum(dtype=np.int64))
+
+    def fix(self):
+        if self.cksum is not None:
+            self.remember(self.cksum, [self.byts[self.cksum]])
+        return self.running.fix()
+
+    def valid(self):
+        return self.running.valid()
+
+    def edits(self):
+        # merge the changed bytes into (address, bytes) runs
+        runs = []
+        for addr in sorted(a for a, b in self.original.items() if self.byts[a] != b):
+            if runs and runs[-1][0] + len(runs[-1][1]) == addr:
+                runs[-1][1].append(self.byts[addr])
+            else:
+                runs.append([addr, bytearray([self.byts[addr]])])
+        return [(addr, bytes(data)) for addr, data in runs]
+
+    def record(self):
+        return {
+            "size": len(self.byts),
+            "checksum": "0x%x" % self.cksum if self.cksum is not None else None,
+            "edits": [["0x%x" % addr, data.hex()] for addr, data in self.edits()],
+        }
+
+
+def apply_record(byts, record):
+    if len(byts) != record["size"]:
+        raise ValueError("patch is for a %d byte image, got %d bytes" % (record["size"], len(byts)))
+    patch = TunePatch(byts, int(record["checksum"], 16) if record["checksum"] is not None else None)
+    for addr, data in record["edits"]:
+        patch.apply(int(addr, 16), bytes.fromhex(data))
+    return patch
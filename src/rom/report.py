@@ -0,0 +1,99 @@
+import csv
+import hashlib
+import json
+import mmap
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from ecmids import ECM_IDs
+from .catalog import MAPID_SIZE, decode_mapid, pn_ecmid, pn_from_path
+
+REPORT_FIELDS = ["file", "pn", "model", "size", "sha256", "checksum", "checksum_valid", "checksum_fix", "size_ok",
+                 "ecmid", "ecmid_match", "mapid", "duplicates", "error"]
+
+
+def find_images(dirs, exts=(".bin",)):
+    paths = []
+    for d in dirs:
+        for root, _, files in os.walk(d):
+            paths += [os.path.join(root, f) for f in files if os.path.splitext(f)[-1].lower() in exts]
+    return sorted(paths)
+
+
+def summarise(buf, info, ecmid):
+    byts = np.frombuffer(buf, dtype=np.uint8)
+    size = len(byts)
+    total = int(byts.sum(dtype=np.uint64))
+    result = {"size": size, "sha256": hashlib.sha256(buf).hexdigest(), "checksum_valid": total & 0xFF == 0}
+    if len(info) > 0:
+        result["size_ok"] = all(int(info[k], 16) < size for k in ["checksum", "ecmidaddr", "keihinaddr"] if k in info)
+    if "checksum" in info and 0 < int(info["checksum"], 16) < size:
+        cksum = int(info["checksum"], 16)
+        result["checksum"] = "0x%x" % cksum
+        result["checksum_fix"] = "0x%02x" % (-(total - int(byts[cksum])) & 0xFF)
+    if "ecmidaddr" in info and int(info["ecmidaddr"], 16) + 5 <= size:
+        ea = int(info["ecmidaddr"], 16)
+        result["ecmid_match"] = bytes(byts[ea:(ea + 5)]) == ecmid
+    if "keihinaddr" in info and int(info["keihinaddr"], 16) + MAPID_SIZE <= size:
+        ka = int(info["keihinaddr"], 16)
+        result["mapid"] = decode_mapid(bytes(byts[ka:(ka + MAPID_SIZE)]))
+    return result
+
+
+def inspect_image(path):
+    pn = pn_from_path(path)
+    result = dict.fromkeys(REPORT_FIELDS)
+    result.update({"file": path, "pn": pn})
+
+    def inspect(buf):
+        ecmid = pn_ecmid(pn, buf)
+        info = ECM_IDs[ecmid] if ecmid is not None else {}
+        result.update({"model": info.get("model"), "ecmid": ecmid.hex() if ecmid else None})
+        result.update(summarise(buf, info, ecmid))
+
+    try:
+        with open(path, "rb") as fbin:
+            if os.fstat(fbin.fileno()).st_size == 0:
+                inspect(b"")
+            else:
+                with mmap.mmap(fbin.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    inspect(buf)
+    except (OSError, ValueError) as e:
+        result["error"] = str(e)
+    return result
+
+
+def validate_library(paths, workers=None):
+    # hashing and summing are CPU bound, so the files are spread over processes rather than threads; spawned, not
+    # forked, because the caller may be a worker thread of the GUI
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            report = list(pool.map(inspect_image, paths, chunksize=4))
+    except BrokenProcessPool:
+        # a worker process died (out of memory, killed), the scan finishes in this process instead
+        report = [inspect_image(p) for p in paths]
+    by_hash = {}
+    for r in report:
+        if r["sha256"] is not None:
+            by_hash.setdefault(r["sha256"], []).append(r["file"])
+    for r in report:
+        if r["sha256"] is not None and len(by_hash[r["sha256"]]) > 1:
+            r["duplicates"] = [f for f in by_hash[r["sha256"]] if f != r["file"]]
+    return report
+
+
+def write_json(report, path):
+    with open(path, "w") as fjson:
+        json.dump(report, fjson, indent=1)
+
+
+def write_csv(report, path):
+    with open(path, "w", newline="") as fcsv:
+        writer = csv.DictWriter(fcsv, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        for r in report:
+            writer.writerow(dict(r, duplicates=";".join(r["duplicates"] or [])))
@@ -0,0 +1,54 @@
+import numpy as np
+
+from .checksum import as_array
+
+
+class WritePlan(object):
+
+    # frame layout: 0x01 0x06 | start address (>H) | payload | next address (>H) | checksum8bit | checksum8bitHonda
+    def __init__(self, byts, offset=0, writesize=128):
+        self.writesize = writesize
+        self.offset = offset
+        self.size = len(byts)
+        self.count = self.size // writesize
+        self.framesize = writesize + 8
+        if self.count == 0:
+            raise ValueError("image is smaller than one %d byte write block" % writesize)
+        step = writesize // 16
+        self.addresses = offset // 16 + step * np.arange(self.count + 1, dtype=np.int64)
+        # the address after the last block is only used for the ack check, the last frame sends 0 in its place
+        if self.addresses[:-1].max() > 0xffff:
+            raise ValueError("image does not fit the 16 bit block address space at offset 0x%x" % offset)
+        start = self.addresses[:-1]
+        end = self.addresses[1:].copy()
+        end[-1:] = 0
+        frames = np.empty((self.count, self.framesize), dtype=np.uint8)
+        frames[:, 0] = 0x01
+        frames[:, 1] = 0x06
+        frames[:, 2] = start >> 8
+        frames[:, 3] = start & 0xff
+        frames[:, 4:writesize + 4] = as_array(byts)[:self.count * writesize].reshape(self.count, writesize)
+        frames[:, writesize + 4] = end >> 8
+        frames[:, writesize + 5] = end & 0xff
+        s = frames[:, 2:writesize + 6].sum(axis=1, dtype=np.int64)
+        frames[:, writesize + 6] = (0xff - ((s - 1) >> 8)) & 0xff
+        frames[:, writesize + 7] = -s & 0xff
+        self.buffer = frames.tobytes()
+        self.view = memoryview(self.buffer)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def frames(self):
+        return np.frombuffer(self.buffer, dtype=np.uint8).reshape(self.count, self.framesize)
+
+    def frame(self, i):
+        return self.view[(i * self.framesize):((i + 1) * self.framesize)]
+
+    def address(self, i):
+        return int(self.addresses[i])
+
+    def expected(self, i):
+        # the ECU acknowledges a block with the address of the block that follows it
+        return int(self.addresses[i + 1])
@@ -1,12 +1,22 @@
+import logging
 import os
+import sqlite3
 from threading import Thread
 
 import numpy as np
 from pyftdi.ftdi import FtdiError
 from usb.core import USBError
+import usb.util
 import wx
 from eculib import KlineAdapter
 from eculib.honda import *
+from calibration import Calibration, settings_section
+from datalog.decoders import get_decoder
+from datalog.framelog import FrameLogWriter
+from datalog.store import STORE_EXT, SessionRecorder
+from datalog.trigger import TriggeredCapture
+from rom.checksum import do_validation
+from rom.writeplan import WritePlan
 
 
 class KlineWorker(Thread):
@@ -23,9 +33,21 @@ class KlineWorker(Thread):
         dispatcher.connect(self.SettingsHandler, signal="settings", sender=dispatcher.Any)
         dispatcher.connect(self.PasswordHandler, signal="sendpassword", sender=dispatcher.Any)
         dispatcher.connect(self.EEPROMHandler, signal="eeprom", sender=dispatcher.Any)
+        dispatcher.connect(self.RecordHandler, signal="record", sender=dispatcher.Any)
+        dispatcher.connect(self.CaptureHandler, signal="capture", sender=dispatcher.Any)
+        dispatcher.connect(self.CalibrateHandler, signal="calibrate", sender=dispatcher.Any)
+        self.recordinfo = None
+        self.framelog = None
+        self.device = None
+        self.serial = None
+        self.captureinfo = None
+        self.capture = None
+        self.calibrateinfo = None
         Thread.__init__(self)
 
     def __cleanup(self):
+        self.stop_recording()
+        self.stop_capture()
         if self.ecu:
             try:
                 self.ecu.dev.close()
@@ -64,15 +86,17 @@ class KlineWorker(Thread):
         wx.CallAfter(dispatcher.send, signal="KlineWorker", sender=self, info="state", value=self.state)
 
     def SettingsHandler(self, config):
-        self.ecu.dev.timeout = float(config["DEFAULT"]["timeout"])
-        self.ecu.dev.retries = int(config["DEFAULT"]["retries"])
-        if config["DEFAULT"]["klinemethod"] == "poll_modem_status":
+        # a calibrated adapter uses its own section of the config
+        settings = config[settings_section(config, self.serial)]
+        self.ecu.dev.timeout = float(settings["timeout"])
+        self.ecu.dev.retries = int(settings["retries"])
+        if settings["klinemethod"] == "poll_modem_status":
             self.ecu.dev.kline = self.ecu.dev.kline_poll_modem_status
         else:
             self.ecu.dev.kline = self.ecu.dev.kline_loopback_ping
-        self.ecu.dev.kline_timeout = float(config["DEFAULT"]["kline_timeout"])
-        self.ecu.dev.kline_wait = float(config["DEFAULT"]["kline_wait"])
-        self.ecu.dev.kline_testbytes = int(config["DEFAULT"]["kline_testbytes"])
+        self.ecu.dev.kline_timeout = float(settings["kline_timeout"])
+        self.ecu.dev.kline_wait = float(settings["kline_wait"])
+        self.ecu.dev.kline_testbytes = int(settings["kline_testbytes"])
 
     def HRCSettingsPanelHandler(self, mode, data):
         self.hrcmode = (mode, data)
@@ -97,6 +121,16 @@ class KlineWorker(Thread):
         elif action == "data.off":
             self.update_tables = False
 
+    def RecordHandler(self, path):
+        # None stops the recording; the file itself is only touched from the worker thread
+        self.recordinfo = [path]
+
+    def CaptureHandler(self, outdir, conditions):
+        self.captureinfo = [outdir, conditions]
+
+    def CalibrateHandler(self, burst):
+        self.calibrateinfo = [burst]
+
     def ErrorPanelHandler(self, action):
         if action == "dtc.clear":
             self.clear_codes = True
@@ -113,8 +147,15 @@ class KlineWorker(Thread):
                 self.__cleanup()
         elif action == "activate":
             self.__clear_data()
-            self.ecu = HondaECU(KlineAdapter(config, retries=int(self.parent.config["DEFAULT"]["retries"]),
-                                             timeout=float(self.parent.config["DEFAULT"]["timeout"])))
+            self.device = device
+            try:
+                self.serial = usb.util.get_string(config, config.iSerialNumber)
+            except (ValueError, NotImplementedError, USBError):
+                self.serial = None
+            settings = self.parent.config[settings_section(self.parent.config, self.serial)]
+            self.ecu = HondaECU(KlineAdapter(config, retries=int(settings["retries"]),
+                                             timeout=float(settings["timeout"])))
+            self.SettingsHandler(self.parent.config)
             self.ready = True
 
     def read_eeprom(self):
@@ -203,34 +244,21 @@ class KlineWorker(Thread):
                 return 1
         return 0
 
-    def write_flash(self, byts, offset=0):
-        ossize = len(byts)
-        offseti = int(offset / 16)
-        writesize = 128
-        z = int(writesize / 16)
-        maxi = int(ossize / writesize)
+    def write_flash(self, plans, offset=0):
+        plan = plans[128]
+        ossize = plan.size
         i = 0
-        w = (i * writesize)
+        w = 0
         t = time.time()
         rate = 0
         size = 0
-        while self.writeinfo is not None and i < maxi:
-            bytstart = [s for s in struct.pack(">H", offseti + (z * i))]
-            if i + 1 == maxi:
-                bytend = [s for s in struct.pack(">H", 0)]
-            else:
-                bytend = [s for s in struct.pack(">H", offseti + (z * (i + 1)))]
-            d = list(byts[((i + 0) * writesize):((i + 1) * writesize)])
-            x = bytstart + d + bytend
-            c1 = checksum8bit(x)
-            c2 = checksum8bitHonda(x)
-            x = [0x01, 0x06] + x + [c1, c2]
-            info = self.ecu.send_command([0x7e], x)
+        while self.writeinfo is not None and i < len(plan):
+            info = self.ecu.send_command([0x7e], plan.frame(i).tolist())
             if info is not None:
                 ilen = ord(info[1])
                 if ilen != 5:
                     if ilen == 7:
-                        if struct.unpack(">H",info[2][2:4])[0] != offseti + (z * (i+1)):
+                        if struct.unpack(">H",info[2][2:4])[0] != plan.expected(i):
                             wx.CallAfter(dispatcher.send, signal="KlineWorker", sender=self, info="write.progress",
                                          value=(0, "unexpected return"))
                             return 1
@@ -239,10 +267,8 @@ class KlineWorker(Thread):
                             dispatcher.send(signal="ecu.stats", sender=self, data=self.ecu.dev.stats)
             else:
                 if i == 0:
-                    if writesize == 128:
-                        writesize = 64
-                        z = int(writesize / 16)
-                        maxi = int(ossize / writesize)
+                    if plan.writesize == 128:
+                        plan = plans[64]
                         continue
                     else:
                         wx.CallAfter(dispatcher.send, signal="KlineWorker", sender=self, info="write.progress",
@@ -254,7 +280,7 @@ class KlineWorker(Thread):
                     return 3
             n = time.time()
             wx.CallAfter(dispatcher.send, signal="KlineWorker", sender=self, info="write.progress", value=(
-                i / maxi * 100,
+                i / len(plan) * 100,
                 "%.02fKB of %.02fKB @ %s" % (w / 1024.0, ossize / 1024.0, "%.02fB/s" % rate if rate > 0 else "---")))
             if n - t > 1:
                 rate = (w - size) / (n - t)
@@ -262,12 +288,13 @@ class KlineWorker(Thread):
                 size = w
             i += 1
             if i % 2 == 0:
-                if writesize == 64:
+                if plan.writesize == 64:
                     self.ecu.send_command([0x7e], [0x01, 0x07])
                     time.sleep(.200)
-            w = (i * writesize)
+            w = (i * plan.writesize)
         r = rate if rate > 0 else "---"
-        v = (i / maxi * 100, "%.02fKB of %.02fKB @ %s" % ((w - offset) / 1024.0, ossize / 1024.0, "%.02fB/s" % r))
+        v = (i / len(plan) * 100,
+             "%.02fKB of %.02fKB @ %s" % ((w - offset) / 1024.0, ossize / 1024.0, "%.02fB/s" % r))
         wx.CallAfter(dispatcher.send, signal="KlineWorker", sender=self, info="progress", value=v)
         return 0
 
@@ -323,11 +350,11 @@ class KlineWorker(Thread):
         self.do_update_state()
         return ret
 
-    def do_write(self):
+    def do_write(self, plans):
         self.do_update_state()
         ret = 1
         wx.CallAfter(dispatcher.send, signal="KlineWorker", sender=self, info="write", value=None)
-        if self.write_flash(self.writeinfo[0], offset=self.writeinfo[1]) == 0:
+        if self.write_flash(plans, offset=self.writeinfo[1]) == 0:
             self.writeinfo[2] = "good" if self.ecu.do_post_write() else "bad"
             wx.CallAfter(dispatcher.send, signal="KlineWorker", sender=self, info="write.result",
                          value=self.writeinfo[2])
@@ -442,6 +469,8 @@ class KlineWorker(Thread):
         if self.dtccount != dtccount:
             self.dtccount = dtccount
             wx.CallAfter(dispatcher.send, signal="KlineWorker", sender=self, info="dtccount", value=self.dtccount)
+        if self.capture is not None:
+            self.capture_done(self.capture.dtc(time.time(), errorcodes))
         if self.errorcodes != errorcodes:
             self.errorcodes = errorcodes
             wx.CallAfter(dispatcher.send, signal="KlineWorker", sender=self, info="dtc", value=self.errorcodes)
@@ -457,12 +486,79 @@ class KlineWorker(Thread):
         else:
             return 1
 
+    def stop_recording(self):
+        if self.framelog is not None:
+            try:
+                self.framelog.close()
+            except (OSError, sqlite3.Error):
+                pass
+            wx.CallAfter(dispatcher.send, signal="KlineWorker", sender=self, info="record",
+                         value=(None, self.framelog.count))
+            self.framelog = None
+
+    def do_record(self):
+        path = self.recordinfo[0]
+        self.recordinfo = None
+        self.stop_recording()
+        if path is not None:
+            try:
+                if path.lower().endswith(STORE_EXT):
+                    self.framelog = SessionRecorder(path, self.ecmid, self.device)
+                else:
+                    self.framelog = FrameLogWriter(path, self.ecmid)
+            except (OSError, sqlite3.Error) as e:
+                dispatcher.send(signal="ecu.debug", sender=self, msg="record: can't open %s: %s" % (path, e),
+                                level=logging.ERROR)
+                self.framelog = None
+            wx.CallAfter(dispatcher.send, signal="KlineWorker", sender=self, info="record",
+                         value=(path if self.framelog is not None else None, 0))
+
+    def do_write_frame(self, t, info):
+        try:
+            self.framelog.write(time.time(), t, info[2])
+        except (OSError, sqlite3.Error) as e:
+            # a failed recording ends the recording, not the K-line session
+            dispatcher.send(signal="ecu.debug", sender=self, msg="record: stopped after a write error: %s" % e,
+                            level=logging.ERROR)
+            self.stop_recording()
+
+    def capture_done(self, capture):
+        if capture is not None:
+            dispatcher.send(signal="ecu.debug", sender=self, msg="capture: %d frames written to %s (%s)" % (
+                capture[1], capture[0], capture[2]), level=logging.INFO)
+
+    def stop_capture(self):
+        if self.capture is not None:
+            self.capture_done(self.capture.finish())
+            self.capture = None
+            wx.CallAfter(dispatcher.send, signal="KlineWorker", sender=self, info="capture", value=None)
+
+    def do_capture(self):
+        outdir, conditions = self.captureinfo
+        self.captureinfo = None
+        self.stop_capture()
+        if outdir is not None:
+            self.capture = TriggeredCapture(outdir, conditions, self.ecmid)
+            wx.CallAfter(dispatcher.send, signal="KlineWorker", sender=self, info="capture", value=outdir)
+
+    def do_sample(self, t, info):
+        # triggers see every sample as it arrives, so nothing has to be kept beyond the capture's own ring
+        decoder = get_decoder(t, bytes(self.ecmid) or None)
+        decoded = None
+        if decoder is not None and len(info[2]) - 2 >= decoder.size:
+            decoded = decoder.decode(info[2][2:])
+        self.capture_done(self.capture.sample(time.time(), t, info[2], decoder, decoded))
+
     def do_update_tables(self):
         for t in self.tables:
             info = self.ecu.send_command([0x72], [0x71, t])
             if info:
                 if info[3] > 2:
                     self.tables[t] = [info[3], info[2]]
+                    if self.framelog is not None:
+                        self.do_write_frame(t, info)
+                    if self.capture is not None:
+                        self.do_sample(t, info)
                     wx.CallAfter(dispatcher.send, signal="KlineWorker", sender=self, info="data",
                                  value=(t, info[3], info[2]))
                 else:
@@ -471,6 +567,19 @@ class KlineWorker(Thread):
                 return 1
         return 0
 
+    def do_calibrate(self):
+        burst = self.calibrateinfo[0]
+        self.calibrateinfo = None
+        calibration = Calibration(self.ecu.dev, lambda: self.ecu.send_command([0x72], [0x71, 0x00]), burst,
+                                  progress=lambda step, fraction: wx.CallAfter(
+                                      dispatcher.send, signal="KlineWorker", sender=self, info="calibrate.progress",
+                                      value=(step, fraction)),
+                                  running=lambda: self.parent.run)
+        result = calibration.run()
+        result["serial"] = self.serial
+        wx.CallAfter(dispatcher.send, signal="KlineWorker", sender=self, info="calibrate.result", value=result)
+        return 0 if result["ok"] else 1
+
     def do_basic_tasks(self):
         ret = 0
         if not self.ecmid:
@@ -483,7 +592,7 @@ class KlineWorker(Thread):
             ret += self.do_get_flashcount()
         if self.clear_codes:
             ret += self.do_clear_codes()
-        if self.update_errors or self.dtccount < 0:
+        if self.update_errors or self.dtccount < 0 or (self.capture is not None and self.capture.dtctrigger):
             ret += self.do_get_dtcs()
         if not self.tables:
             ret += self.do_probe_tables()
@@ -508,11 +617,18 @@ class KlineWorker(Thread):
 
     def write_helper(self, init=False, recover=False):
         ret = 1
+        try:
+            plans = {writesize: WritePlan(self.writeinfo[0], self.writeinfo[1], writesize) for writesize in [128, 64]}
+        except ValueError:
+            wx.CallAfter(dispatcher.send, signal="KlineWorker", sender=self, info="write.progress",
+                         value=(0, "invalid image"))
+            self.writeinfo = None
+            return ret
         if init:
             self.do_init_write(recover=recover)
             time.sleep(.100)
         if self.do_erase() == 0:
-            self.do_write()
+            self.do_write(plans)
             ret = 0
         self.writeinfo = None
         return ret
@@ -560,6 +676,11 @@ class KlineWorker(Thread):
 
     def run(self):
         while self.parent.run:
+            # record and capture requests are handled whatever the ECU is doing, so a stop always closes the file
+            if self.recordinfo is not None:
+                self.do_record()
+            if self.captureinfo is not None:
+                self.do_capture()
             if not self.ready:
                 time.sleep(.002)
             else:
@@ -576,6 +697,9 @@ class KlineWorker(Thread):
                         if self.writeinfo is not None:
                             self.write_helper(init=True)
                             self.do_update_state()
+                        elif self.calibrateinfo is not None:
+                            self.do_calibrate()
+                            self.do_update_state()
                         else:
                             if self.do_idle_tasks() > 0:
                                 self.do_update_state()
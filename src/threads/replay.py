@@ -0,0 +1,78 @@
+import time
+from threading import Thread
+
+import wx
+from pydispatch import dispatcher
+from datalog.framelog import open_frames, read_header
+
+# samples handed to the GUI but not yet handled; the replay waits for the GUI instead of flooding its queue
+IN_FLIGHT = 32
+PROGRESS_INTERVAL = 1.0
+
+
+class ReplayWorker(Thread):
+
+    def __init__(self, parent, path, speed):
+        self.parent = parent
+        self.path = path
+        # 0 replays as fast as the GUI can take it
+        self.speed = speed
+        self.stopped = False
+        self.sent = 0
+        self.delivered = 0
+        dispatcher.connect(self.ReplayHandler, signal="replay", sender=dispatcher.Any)
+        Thread.__init__(self)
+
+    def ReplayHandler(self, action):
+        if action == "stop":
+            self.stopped = True
+
+    def running(self):
+        return self.parent.run and not self.stopped
+
+    def deliver(self, value):
+        # runs on the GUI thread, so the count only moves once the panels have handled the sample
+        self.delivered += 1
+        dispatcher.send(signal="KlineWorker", sender=self, info="data", value=value)
+
+    def rate(self, start):
+        elapsed = time.perf_counter() - start
+        return self.delivered / elapsed if elapsed > 0 else 0.0
+
+    def run(self):
+        try:
+            header = read_header(self.path)
+            frames = open_frames(self.path)
+        except (OSError, ValueError) as e:
+            wx.CallAfter(dispatcher.send, signal="ReplayWorker", sender=self, info="error", value=str(e))
+            return
+        if header["ecmid"] is not None:
+            # only the datalog panel decodes with the log's ECM id, the live ECU's info stays as it is
+            wx.CallAfter(dispatcher.send, signal="ReplayWorker", sender=self, info="ecmid", value=header["ecmid"])
+        total = len(frames)
+        times = frames["time"]
+        start = time.perf_counter()
+        lastprogress = start
+        for i in range(total):
+            if not self.running():
+                break
+            if self.speed > 0:
+                due = start + (times[i] - times[0]) / self.speed
+                # slept in short steps so a stop request is not held up by a long gap in the log
+                while self.running() and due > time.perf_counter():
+                    time.sleep(max(0.0, min(due - time.perf_counter(), .05)))
+            while self.sent - self.delivered >= IN_FLIGHT and self.running():
+                time.sleep(.001)
+            f = frames[i]
+            length = int(f["length"])
+            self.sent += 1
+            wx.CallAfter(self.deliver, (int(f["table"]), length, bytes(f["data"][:length])))
+            now = time.perf_counter()
+            if now - lastprogress >= PROGRESS_INTERVAL:
+                lastprogress = now
+                wx.CallAfter(dispatcher.send, signal="ReplayWorker", sender=self, info="progress",
+                             value=(i + 1, total, self.rate(start)))
+        while self.delivered < self.sent and self.running():
+            time.sleep(.001)
+        wx.CallAfter(dispatcher.send, signal="ReplayWorker", sender=self, info="done",
+                     value=(self.delivered, time.perf_counter() - start, self.rate(start)))
@@ -0,0 +1,184 @@
+import logging
+import os
+import queue
+from threading import Thread, Lock
+
+import wx
+from pydispatch import dispatcher
+from rom.checksum import do_validation
+from rom.htf import read_htf
+from rom.layout import analyse, library_layouts
+from rom.patch import TunePatch
+from rom.report import find_images, inspect_image, validate_library, write_csv, write_json
+
+REPORT_FILE = "validation-report"
+
+
+def file_job(kind, path, *args):
+    # jobs carry the file size and mtime so an edited file is revalidated even when the path is unchanged
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (kind, path, st.st_size, st.st_mtime) + args
+
+
+def validate_bin(path, nbyts, checksum, cancelled):
+    if checksum >= nbyts:
+        return None
+    with open(path, "rb") as fbin:
+        byts = bytearray(fbin.read(nbyts))
+    if cancelled():
+        return None
+    ret, status, byts = do_validation(byts, nbyts, checksum)
+    if status != "bad":
+        return byts, None
+    return None
+
+
+def validate_htf(path, cancelled, catalog=None):
+    htf = read_htf(path, catalog, cancelled)
+    if htf is None:
+        return None
+    binmod, metainfo = htf
+    ea = int(metainfo["ecmidaddr"], 16)
+    ka = int(metainfo["keihinaddr"], 16)
+    patch = TunePatch(binmod, int(metainfo["checksum"], 16))
+    if "rid" in metainfo and metainfo["rid"] is not None:
+        patch.apply(ea, bytes(b ^ 0xFF for b in binmod[ea:(ea + 5)]))
+        patch.apply(ka, bytes(ord(c) for c in metainfo["rid"][:7]))
+    if cancelled():
+        return None
+    if patch.fix():
+        return binmod, metainfo.get("offset")
+    return None
+
+
+def validate_folder(path, cancelled):
+    paths = find_images([path])
+    if cancelled():
+        return None
+    report = validate_library(paths)
+    base = os.path.join(path, REPORT_FILE)
+    write_json(report, base + ".json")
+    write_csv(report, base + ".csv")
+    return report, base
+
+
+def detect_layout(path, nbyts, layouts, cancelled):
+    with open(path, "rb") as fbin:
+        byts = fbin.read(nbyts)
+    if cancelled():
+        return None
+    return analyse(byts, layouts)
+
+
+def validate_eeprom(path, nbyts, cancelled):
+    if nbyts not in [256, 512]:
+        return None
+    with open(path, "rb") as fbin:
+        return bytearray(fbin.read(nbyts)), None
+
+
+class ValidationWorker(Thread):
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.jobs = queue.Queue()
+        self.lock = Lock()
+        self.latest = {}
+        self.jobid = 0
+        self.layouts = None
+        dispatcher.connect(self.ValidateHandler, signal="validate", sender=dispatcher.Any)
+        Thread.__init__(self)
+
+    def ValidateHandler(self, key, job):
+        with self.lock:
+            self.jobid += 1
+            self.latest[key] = self.jobid
+            self.jobs.put((key, self.jobid, job))
+
+    def is_stale(self, key, jobid):
+        with self.lock:
+            return self.latest.get(key) != jobid or not self.parent.run
+
+    def do_validate(self, job, cancelled):
+        kind, path, nbyts = job[:3]
+        if kind == "bin":
+            return validate_bin(path, nbyts, job[4], cancelled)
+        elif kind == "htf":
+            return validate_htf(path, cancelled, self.parent.catalog)
+        elif kind == "eeprom":
+            return validate_eeprom(path, nbyts, cancelled)
+        elif kind == "layout":
+            if self.layouts is None:
+                self.layouts = library_layouts(self.parent.catalog)
+            return detect_layout(path, nbyts, self.layouts, cancelled)
+        return None
+
+    def run(self):
+        while self.parent.run:
+            try:
+                key, jobid, job = self.jobs.get(timeout=.1)
+            except queue.Empty:
+                continue
+            if job is None or self.is_stale(key, jobid):
+                continue
+            error = None
+            try:
+                result = self.do_validate(job, lambda: self.is_stale(key, jobid))
+            except Exception as e:
+                # any failure is a failed validation of this file, the worker has to stay up for the next one
+                dispatcher.send(signal="ecu.debug", sender=self, msg="validation of %s failed: %r" % (job[1], e),
+                                level=logging.ERROR)
+                result = None
+                error = str(e)
+            if not self.is_stale(key, jobid):
+                wx.CallAfter(dispatcher.send, signal="ValidationWorker", sender=self, key=key, job=job, result=result,
+                             error=error)
+
+
+class ReportWorker(Thread):
+
+    # a one-off folder scan or image report, kept off the GUI thread and out of the panels' validation queue
+    def __init__(self, key, job, func, *args):
+        self.key = key
+        self.job = job
+        self.func = func
+        self.args = args
+        Thread.__init__(self, daemon=True)
+
+    def run(self):
+        error = None
+        try:
+            result = self.func(*self.args)
+        except Exception as e:
+            dispatcher.send(signal="ecu.debug", sender=self, msg="%s of %s failed: %r" % (self.key, self.job[1], e),
+                            level=logging.ERROR)
+            result = None
+            error = str(e)
+        wx.CallAfter(dispatcher.send, signal="ValidationWorker", sender=self, key=self.key, job=self.job,
+                     result=result, error=error)
+
+
+def folder_report(parent, path):
+    return ReportWorker("folder", ("folder", path, 0), validate_folder, path, lambda: not parent.run)
+
+
+def image_report(path):
+    return ReportWorker("image", ("image", path, 0), inspect_image, path)
+
+
+def heatmap_report(parent, path):
+    return ReportWorker("heatmap", ("heatmap", path, 0), parent.log_heatmaps, path, lambda: not parent.run)
+
+
+def nearest_roms(fingerprints, path, n=5):
+    # fingerprints returns the library index, building it on first use
+    with open(path, "rb") as fbin:
+        byts = fbin.read()
+    return fingerprints().nearest(byts, n)
+
+
+def nearest_report(fingerprints, path):
+    return ReportWorker("nearest", ("nearest", path, 0), nearest_roms, fingerprints, path)
@@ -0,0 +1,169 @@
+import functools
+
+import numpy as np
+from pyparsing import CaselessLiteral, Literal, ParseException, Regex, infixNotation, oneOf, opAssoc
+
+OPERATORS = {
+    "+": np.add,
+    "-": np.subtract,
+    "*": np.multiply,
+    "/": np.true_divide,
+    "^": np.power,
+}
+
+# solve y = a <op> c for a, and y = c <op> b for b
+INVERSE_LEFT = {
+    "+": lambda y, c: y - c,
+    "-": lambda y, c: y + c,
+    "*": lambda y, c: y / c,
+    "/": lambda y, c: y * c,
+    "^": lambda y, c: np.power(y, 1.0 / c),
+}
+INVERSE_RIGHT = {
+    "+": lambda y, c: y - c,
+    "-": lambda y, c: c - y,
+    "*": lambda y, c: y / c,
+    "/": lambda y, c: c / y,
+    "^": lambda y, c: np.log(y) / np.log(c),
+}
+
+number = Regex(r"(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?")
+variable = CaselessLiteral("X")
+grammar = infixNotation(number | variable, [
+    (Literal("^"), 2, opAssoc.RIGHT),
+    (oneOf("+ -"), 1, opAssoc.RIGHT),
+    (oneOf("* /"), 2, opAssoc.LEFT),
+    (oneOf("+ -"), 2, opAssoc.LEFT),
+])
+
+
+class EquationError(ValueError):
+    pass
+
+
+def build_tree(tokens):
+    if isinstance(tokens, str):
+        if tokens.upper() == "X":
+            return ("x",)
+        return ("const", float(tokens))
+    tokens = list(tokens)
+    if len(tokens) == 1:
+        return build_tree(tokens[0])
+    if len(tokens) == 2:
+        node = build_tree(tokens[1])
+        if tokens[0] != "-":
+            return node
+        return ("const", -node[1]) if node[0] == "const" else ("neg", node)
+    if tokens[1] == "^":
+        node = build_tree(tokens[-1])
+        for i in range(len(tokens) - 3, -1, -2):
+            node = fold("^", build_tree(tokens[i]), node)
+        return node
+    node = build_tree(tokens[0])
+    for i in range(1, len(tokens), 2):
+        node = fold(tokens[i], node, build_tree(tokens[i + 1]))
+    return node
+
+
+def fold(op, a, b):
+    if a[0] == "const" and b[0] == "const":
+        return ("const", float(OPERATORS[op](a[1], b[1])))
+    return (op, a, b)
+
+
+def has_x(node):
+    if node[0] == "x":
+        return True
+    if node[0] == "const":
+        return False
+    return any(has_x(n) for n in node[1:])
+
+
+def compile_forward(node):
+    if node[0] == "x":
+        return lambda x: x
+    if node[0] == "const":
+        c = node[1]
+        return lambda x: np.full(np.shape(x), c)
+    if node[0] == "neg":
+        f = compile_forward(node[1])
+        return lambda x: np.negative(f(x))
+    op = OPERATORS[node[0]]
+    a = compile_forward(node[1])
+    b = compile_forward(node[2])
+    if node[2][0] == "const":
+        c = node[2][1]
+        return lambda x: op(a(x), c)
+    if node[1][0] == "const":
+        c = node[1][1]
+        return lambda x: op(c, b(x))
+    return lambda x: op(a(x), b(x))
+
+
+def inverse_step(f, c):
+    return lambda y: f(y, c)
+
+
+def compile_inverse(node):
+    # only expressions where X appears once can be unwound step by step
+    steps = []
+    while node[0] != "x":
+        if node[0] == "const":
+            return None
+        if node[0] == "neg":
+            steps.append(np.negative)
+            node = node[1]
+            continue
+        op, a, b = node
+        if has_x(a) and not has_x(b):
+            c = b[1]
+            if c == 0 and op in ["*", "/", "^"]:
+                return None
+            steps.append(inverse_step(INVERSE_LEFT[op], c))
+            node = a
+        elif has_x(b) and not has_x(a):
+            c = a[1]
+            if c == 0 and op in ["*", "^"]:
+                return None
+            steps.append(inverse_step(INVERSE_RIGHT[op], c))
+            node = b
+        else:
+            return None
+
+    def inverse(y):
+        y = np.asarray(y, dtype=np.float64)
+        for step in steps:
+            y = step(y)
+        return y
+    return inverse
+
+
+class Equation(object):
+
+    def __init__(self, equation):
+        self.equation = equation
+        try:
+            result = grammar.parseString(equation, parseAll=True)
+        except ParseException as e:
+            raise EquationError("unsupported XDF equation '%s': %s" % (equation, e))
+        self.tree = build_tree(result[0])
+        self.forward = compile_forward(self.tree)
+        self.backward = compile_inverse(self.tree)
+        self.identity = self.tree == ("x",)
+
+    @property
+    def invertible(self):
+        return self.backward is not None
+
+    def __call__(self, raw):
+        return self.forward(np.asarray(raw, dtype=np.float64))
+
+    def inverse(self, values):
+        if self.backward is None:
+            raise EquationError("XDF equation '%s' has no inverse" % self.equation)
+        return self.backward(values)
+
+
+@functools.lru_cache(maxsize=None)
+def compile_equation(equation):
+    return Equation(equation.strip() or "X")
@@ -0,0 +1,166 @@
+import hashlib
+import io
+import json
+import os
+
+from lxml import etree
+
+XDF_CACHE_VERSION = 1
+
+TYPE_SIGNED = 0x01
+TYPE_LSBFIRST = 0x02
+TYPE_COLMAJOR = 0x04
+
+
+def xdf_int(value, default=0):
+    if value is None or value == "":
+        return default
+    return int(value, 0)
+
+
+def xdf_float(value, default=None):
+    if value is None or value == "":
+        return default
+    return float(value)
+
+
+def compile_embedded(elem):
+    if elem is None:
+        return None
+    flags = xdf_int(elem.get("mmedtypeflags"))
+    address = elem.get("mmedaddress")
+    return {
+        "address": xdf_int(address) if address is not None else None,
+        "elementsize": xdf_int(elem.get("mmedelementsizebits"), 8),
+        "rows": xdf_int(elem.get("mmedrowcount"), 1),
+        "cols": xdf_int(elem.get("mmedcolcount"), 1),
+        "majorstride": xdf_int(elem.get("mmedmajorstridebits")),
+        "minorstride": xdf_int(elem.get("mmedminorstridebits")),
+        "signed": bool(flags & TYPE_SIGNED),
+        "lsbfirst": bool(flags & TYPE_LSBFIRST),
+        "colmajor": bool(flags & TYPE_COLMAJOR),
+    }
+
+
+def compile_math(elem):
+    if elem is None:
+        return "X"
+    return elem.get("equation", "X").strip()
+
+
+def compile_axis(elem):
+    axis = {
+        "id": elem.get("id"),
+        "data": compile_embedded(elem.find("EMBEDDEDDATA")),
+        "count": xdf_int(elem.findtext("indexcount"), 0),
+        "decimalpl": xdf_int(elem.findtext("decimalpl"), 0),
+        "min": xdf_float(elem.findtext("min")),
+        "max": xdf_float(elem.findtext("max")),
+        "units": elem.findtext("units"),
+        "equation": compile_math(elem.find("MATH")),
+        "labels": [l.get("value") for l in sorted(elem.findall("LABEL"), key=lambda l: xdf_int(l.get("index")))],
+        "link": None,
+    }
+    embedinfo = elem.find("embedinfo")
+    if embedinfo is not None and embedinfo.get("linkobjid") is not None:
+        axis["link"] = xdf_int(embedinfo.get("linkobjid"))
+    return axis
+
+
+def compile_table(elem):
+    return {
+        "id": xdf_int(elem.get("uniqueid")),
+        "title": (elem.findtext("title") or "").strip(),
+        "categories": [xdf_int(c.get("category")) for c in elem.findall("CATEGORYMEM")],
+        "axes": {a.get("id"): compile_axis(a) for a in elem.findall("XDFAXIS")},
+    }
+
+
+def compile_flag(elem):
+    return {
+        "id": xdf_int(elem.get("uniqueid")),
+        "title": (elem.findtext("title") or "").strip(),
+        "categories": [xdf_int(c.get("category")) for c in elem.findall("CATEGORYMEM")],
+        "data": compile_embedded(elem.find("EMBEDDEDDATA")),
+        "mask": xdf_int(elem.findtext("mask"), 0xff),
+    }
+
+
+def compile_header(elem):
+    baseoffset = elem.find("BASEOFFSET")
+    offset = 0
+    if baseoffset is not None:
+        offset = xdf_int(baseoffset.get("offset"))
+        if xdf_int(baseoffset.get("subtract")):
+            offset = -offset
+    return {
+        "description": elem.findtext("description") or "",
+        "baseoffset": offset,
+        "categories": [[xdf_int(c.get("index")), c.get("name")] for c in elem.findall("CATEGORY")],
+    }
+
+
+def compile_xdf(source):
+    xdf = {"version": XDF_CACHE_VERSION, "header": None, "tables": [], "flags": []}
+    # stream the file one top level object at a time and drop each subtree once compiled
+    for _, elem in etree.iterparse(source, events=("end",), tag=("XDFHEADER", "XDFTABLE", "XDFFLAG")):
+        if elem.tag == "XDFHEADER":
+            xdf["header"] = compile_header(elem)
+        elif elem.tag == "XDFTABLE":
+            xdf["tables"].append(compile_table(elem))
+        else:
+            xdf["flags"].append(compile_flag(elem))
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+    return xdf
+
+
+class XDFDefinition(object):
+
+    def __init__(self, xdf, sha256=None, path=None):
+        self.sha256 = sha256
+        self.path = path
+        self.header = xdf["header"] or {"description": "", "baseoffset": 0, "categories": []}
+        self.baseoffset = self.header["baseoffset"]
+        self.categories = dict(self.header["categories"])
+        self.tables = xdf["tables"]
+        self.flags = xdf["flags"]
+        self.by_id = {t["id"]: t for t in self.tables}
+        self.by_title = {t["title"]: t for t in self.tables}
+
+    def table(self, key):
+        if isinstance(key, int):
+            return self.by_id[key]
+        return self.by_title[key]
+
+    def category(self, table):
+        # CATEGORYMEM numbers categories from 1
+        return [self.categories.get(c - 1) for c in table["categories"]]
+
+    def to_json(self):
+        return {"version": XDF_CACHE_VERSION, "header": self.header, "tables": self.tables, "flags": self.flags}
+
+
+def load_xdf(path, cachedir=None):
+    with open(path, "rb") as fxdf:
+        raw = fxdf.read()
+    sha256 = hashlib.sha256(raw).hexdigest()
+    cachefile = None
+    if cachedir is not None:
+        cachefile = os.path.join(cachedir, "%s.xdfc" % sha256)
+        if os.path.isfile(cachefile):
+            try:
+                with open(cachefile, "r") as fcache:
+                    xdf = json.load(fcache)
+                if xdf.get("version") == XDF_CACHE_VERSION:
+                    return XDFDefinition(xdf, sha256, path)
+            except ValueError:
+                pass
+    xdfdef = XDFDefinition(compile_xdf(io.BytesIO(raw)), sha256, path)
+    if cachefile is not None:
+        if not os.path.exists(cachedir):
+            os.makedirs(cachedir)
+        with open(cachefile, "w") as fcache:
+            json.dump(xdfdef.to_json(), fcache, separators=(",", ":"))
+    return xdfdef
@@ -0,0 +1,158 @@
+import numpy as np
+from lxml import etree
+
+from rom.checksum import as_array
+from .tables import element_span
+
+GRAM = 8
+CONTEXT = 32
+ANCHOR_STEP = 4
+NEIGHBOURHOOD = [256, 1024, 4096, 16384, 65536]
+MAX_HITS = 4
+MIN_VOTES = 4
+MIN_SCORE = 0.6
+# share of all anchor weight that must sit at shift 0 before a build counts as a same-layout sibling
+SAME_LAYOUT = 0.5
+
+
+def data_objects(xdfdef):
+    # every addressed EMBEDDEDDATA, keyed the way it appears in the XDF: (kind, id, axis)
+    objects = []
+    for t in xdfdef.tables:
+        for axisid, axis in t["axes"].items():
+            data = axis["data"]
+            if data is None or data["address"] is None:
+                continue
+            shape = None if axisid == "z" else (axis["count"], 1)
+            objects.append((("table", t["id"], axisid), element_span(data, xdfdef.baseoffset, shape)))
+    for f in xdfdef.flags:
+        if f["data"] is not None and f["data"]["address"] is not None:
+            objects.append((("flag", f["id"], None), element_span(f["data"], xdfdef.baseoffset, (1, 1))))
+    return objects
+
+
+def gram_keys(byts):
+    byts = as_array(byts)
+    if len(byts) < GRAM:
+        return np.empty(0, dtype=np.uint64)
+    # every overlapping 8 byte window read as one integer, without copying the image 8 times
+    return np.ndarray(shape=(len(byts) - GRAM + 1,), dtype="<u8", buffer=np.ascontiguousarray(byts), strides=(1,))
+
+
+class GramIndex(object):
+
+    def __init__(self, byts):
+        self.byts = as_array(byts)
+        keys = gram_keys(self.byts)
+        self.order = np.argsort(keys, kind="stable")
+        self.keys = keys[self.order]
+
+    def anchors(self, source, step=ANCHOR_STEP):
+        # every (source position, shift) pair that maps a source gram onto the same gram in the target;
+        # a gram found in several places splits its vote between them
+        source = as_array(source)
+        allkeys = np.sort(gram_keys(source))
+        keys = gram_keys(source)
+        positions = np.arange(0, len(keys), step)
+        keys = keys[positions]
+        # grams repeated within the source itself, such as duplicated map sets, cannot tell the copies apart
+        copies = np.searchsorted(allkeys, keys, side="right") - np.searchsorted(allkeys, keys, side="left")
+        grams = source[positions[:, np.newaxis] + np.arange(GRAM)]
+        # flat runs such as erased flash match everywhere and carry no position information
+        varied = (grams != grams[:, :1]).any(axis=1)
+        lo = np.searchsorted(self.keys, keys, side="left")
+        hits = np.searchsorted(self.keys, keys, side="right") - lo
+        keep = varied & (copies == 1) & (hits > 0) & (hits <= MAX_HITS)
+        positions, lo, hits = positions[keep], lo[keep], hits[keep]
+        first = np.repeat(np.cumsum(hits) - hits, hits)
+        targets = self.order[np.repeat(lo, hits) + np.arange(hits.sum()) - first]
+        positions = np.repeat(positions, hits)
+        shifts = targets - positions
+        weights = np.repeat(1.0 / hits, hits)
+        # a real match continues into the next anchor with the same shift, chance hits inside retuned data do not
+        codes = (shifts + (1 << 24)) * (1 << 24) + positions
+        order = np.sort(codes)
+        run = np.isin(codes + step, order, assume_unique=False) | np.isin(codes - step, order, assume_unique=False)
+        return positions[run], shifts[run], weights[run]
+
+
+class Alignment(object):
+
+    def __init__(self, source, target, index=None):
+        self.source = as_array(source)
+        self.index = index if index is not None else GramIndex(target)
+        self.target = self.index.byts
+        self.positions, self.shifts, self.weights = self.index.anchors(self.source)
+        total = self.weights.sum()
+        self.unmoved = float(self.weights[self.shifts == 0].sum() / total) if total > 0 else 0.0
+
+    def locate(self, start, end):
+        # relocation is piecewise, so the anchors around an object vote for where it moved to
+        for radius in NEIGHBOURHOOD:
+            lo, hi = np.searchsorted(self.positions, [start - radius, end + radius])
+            if self.weights[lo:hi].sum() >= MIN_VOTES:
+                break
+        else:
+            return None, 0.0
+        shifts, inverse = np.unique(self.shifts[lo:hi], return_inverse=True)
+        votes = np.bincount(inverse, weights=self.weights[lo:hi])
+        wstart = max(0, start - CONTEXT)
+        wend = min(len(self.source), end + CONTEXT)
+        ranked = np.argsort(-votes, kind="stable")[:4].tolist()
+        runnerup = votes[ranked[1]] if len(ranked) > 1 else 0.0
+        candidates = []
+        for i in ranked:
+            shift = int(shifts[i])
+            if wstart + shift < 0 or wend + shift > len(self.target):
+                continue
+            match = float((self.target[(wstart + shift):(wend + shift)] == self.source[wstart:wend]).mean())
+            # retuned tables differ in content but not in place, so how clearly the anchors agree counts the most
+            lead = votes[i] / (votes[i] + (runnerup if i == ranked[0] else votes[ranked[0]]))
+            score = 0.5 * lead + 0.5 * match
+            if shift == 0 and runnerup == 0 and self.unmoved >= SAME_LAYOUT:
+                # a sibling build whose anchors all stayed put around this object only had the values retuned
+                score = max(score, lead)
+            candidates.append((round(score, 3), -abs(shift), shift))
+        if len(candidates) == 0:
+            return None, 0.0
+        # duplicated map sets score the same, the copy that moved least is the one meant
+        score, _, shift = max(candidates)
+        return start + shift, score
+
+
+def port_xdf(xdfdef, source, target, index=None):
+    alignment = Alignment(source, target, index)
+    found = {}
+    objects = data_objects(xdfdef)
+    for key, (start, end) in objects:
+        address, score = alignment.locate(start, end)
+        if address is not None and score >= MIN_SCORE:
+            found[key] = (address - xdfdef.baseoffset, float(score))
+    return found, len(objects)
+
+
+def write_draft(xdfpath, outpath, found, title):
+    tree = etree.parse(xdfpath)
+    root = tree.getroot()
+    for elem in root.findall("XDFTABLE") + root.findall("XDFFLAG"):
+        uid = int(elem.get("uniqueid"), 0)
+        if elem.tag == "XDFTABLE":
+            datas = [(("table", uid, a.get("id")), a.find("EMBEDDEDDATA")) for a in elem.findall("XDFAXIS")]
+        else:
+            datas = [(("flag", uid, None), elem.find("EMBEDDEDDATA"))]
+        datas = [(k, d) for k, d in datas if d is not None and d.get("mmedaddress") is not None]
+        if len(datas) == 0:
+            continue
+        # a table is only carried over when all of its data was found again
+        if any(k not in found for k, _ in datas):
+            root.remove(elem)
+            continue
+        for k, d in datas:
+            d.set("mmedaddress", "0x%X" % found[k][0])
+    header = root.find("XDFHEADER")
+    if header is not None:
+        description = header.find("description")
+        if description is None:
+            description = etree.SubElement(header, "description")
+        description.text = "Draft for %s ported from %s" % (title, xdfpath.replace("\\", "/").split("/")[-1])
+    tree.write(outpath, xml_declaration=False, encoding="utf-8")
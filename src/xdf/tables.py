@@ -0,0 +1,108 @@
+import mmap
+
+import numpy as np
+
+from .equations import compile_equation
+
+
+def element_dtype(data):
+    return np.dtype("%s%s%d" % ("<" if data["lsbfirst"] else ">", "i" if data["signed"] else "u",
+                                data["elementsize"] // 8))
+
+
+def element_strides(data, shape=None):
+    itemsize = data["elementsize"] // 8
+    rows, cols = shape if shape is not None else (data["rows"], data["cols"])
+    # strides are given in bits, zero means the elements are packed
+    inner = data["minorstride"] // 8 if data["minorstride"] > 0 else itemsize
+    if data["colmajor"]:
+        outer = data["majorstride"] // 8 if data["majorstride"] > 0 else rows * inner
+        return (rows, cols), (inner, outer)
+    outer = data["majorstride"] // 8 if data["majorstride"] > 0 else cols * inner
+    return (rows, cols), (outer, inner)
+
+
+def element_view(buf, data, baseoffset=0, shape=None):
+    shape, strides = element_strides(data, shape)
+    return np.ndarray(shape=shape, dtype=element_dtype(data), buffer=buf, offset=data["address"] + baseoffset,
+                      strides=strides)
+
+
+def element_span(data, baseoffset=0, shape=None):
+    shape, strides = element_strides(data, shape)
+    start = data["address"] + baseoffset
+    return start, start + sum((n - 1) * st for n, st in zip(shape, strides)) + data["elementsize"] // 8
+
+
+def open_rom(path, write=False):
+    with open(path, "r+b" if write else "rb") as fbin:
+        return mmap.mmap(fbin.fileno(), 0, access=mmap.ACCESS_WRITE if write else mmap.ACCESS_COPY)
+
+
+class ROMTables(object):
+
+    def __init__(self, xdfdef, buf):
+        self.xdf = xdfdef
+        self.buf = buf
+        self.views = {}
+
+    def data(self, key):
+        table = self.xdf.table(key)
+        z = table["axes"].get("z")
+        if z is None or z["data"] is None or z["data"]["address"] is None:
+            # e.g. the MKE DataSettings entries, which only describe values the ECU reports
+            raise ValueError("table %s has no address" % table["title"])
+        return z["data"]
+
+    def view(self, key):
+        table = self.xdf.table(key)
+        if table["id"] not in self.views:
+            self.views[table["id"]] = element_view(self.buf, self.data(key), self.xdf.baseoffset)
+        return self.views[table["id"]]
+
+    def span(self, key):
+        return element_span(self.data(key), self.xdf.baseoffset)
+
+    def axis(self, key, axisid):
+        axis = self.xdf.table(key)["axes"][axisid]
+        if axis["link"] is not None and axis["link"] in self.xdf.by_id:
+            return self.view(axis["link"]).reshape(-1)
+        data = axis["data"]
+        if data is not None and data["address"] is not None:
+            return element_view(self.buf, data, self.xdf.baseoffset, (axis["count"], 1)).reshape(-1)
+        if len(axis["labels"]) > 0:
+            try:
+                return np.array([float(l) for l in axis["labels"]])
+            except (TypeError, ValueError):
+                # text labels ("On", "Off", "Close", ...) only name the cells, they have no value to scale
+                pass
+        return np.arange(axis["count"] or len(axis["labels"]))
+
+    def equation(self, key, axisid="z"):
+        return compile_equation(self.xdf.table(key)["axes"][axisid]["equation"])
+
+    def values(self, key):
+        return self.equation(key)(self.view(key))
+
+    def axis_values(self, key, axisid):
+        axis = self.xdf.table(key)["axes"][axisid]
+        raw = self.axis(key, axisid)
+        if axis["link"] is not None and axis["link"] in self.xdf.by_id:
+            raw = self.values(axis["link"]).reshape(-1)
+        return compile_equation(axis["equation"])(raw)
+
+    def tables(self):
+        return {t["title"]: self.view(t["id"]) for t in self.xdf.tables
+                if t["axes"].get("z") is not None and t["axes"]["z"]["data"]["address"] is not None}
+
+    def write(self, key, values):
+        view = self.view(key)
+        values = np.asarray(values).reshape(view.shape)
+        if values.dtype.kind == "f":
+            info = np.iinfo(view.dtype)
+            values = np.clip(np.rint(values), info.min, info.max)
+        view[...] = values
+        return view
+
+    def write_values(self, key, values):
+        return self.write(key, self.equation(key).inverse(np.asarray(values, dtype=np.float64)))
@@ -0,0 +1,101 @@
+import types
+
+import pytest
+
+import calibration
+from calibration import VERIFY_ROUNDS, Calibration, choose_retries, format_report
+
+
+class FakeDevice(object):
+
+    # answers in a fixed time on a fake clock, K-line checks need a long enough wait; a quiet device answers nothing
+    def __init__(self, clock, latency=0.01, timeout=0.5, min_wait=0.001):
+        self.clock = clock
+        self.latency = latency
+        self.min_wait = min_wait
+        self.quiet = False
+        self.timeout = timeout
+        self.retries = 3
+        self.kline_wait = 0.005
+        self.kline_timeout = 0.2
+        self.requests = 0
+        self.quiettimeouts = []
+
+    def kline(self):
+        self.clock.t += self.kline_wait
+        return self.kline_wait >= self.min_wait
+
+    def request(self):
+        self.requests += 1
+        if self.quiet:
+            self.quiettimeouts.append(self.timeout)
+        if self.quiet or self.latency >= self.timeout:
+            self.clock.t += self.timeout * (self.retries + 1)
+            return False
+        self.clock.t += self.latency
+        return True
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(t=0.0)
+    monkeypatch.setattr(calibration, "time", types.SimpleNamespace(perf_counter=lambda: clock.t))
+    return clock
+
+
+def test_calibrates(clock):
+    dev = FakeDevice(clock)
+    result = Calibration(dev, dev.request).run()
+    assert result["ok"], result["reason"]
+    assert result["settings"] == {"timeout": 0.02, "retries": 2, "kline_wait": 0.002, "kline_timeout": 0.05}
+    assert (dev.timeout, dev.retries, dev.kline_wait, dev.kline_timeout) == (0.02, 2, 0.002, 0.05)
+    assert result["after"]["errors"] == 0
+    assert "Timeout: 0.500s -> 0.020s" in format_report(result)
+
+
+@pytest.mark.parametrize("latency,timeout", [(0.01, 0.5), (0.5, 0.5), (0.5, 2.0)])
+def test_verify_is_bounded(clock, latency, timeout):
+    # the ECU stops answering once the latency probe is done, so no verify burst can pass
+    dev = FakeDevice(clock, latency, timeout)
+
+    def progress(step, fraction):
+        dev.quiet = dev.quiet or step == "kline"
+
+    result = Calibration(dev, dev.request, progress=progress).run()
+    assert not result["ok"]
+    assert "still failed" in result["reason"]
+    # every verify burst gives up after MAX_FAILURES requests in a row
+    bursts = len(dev.quiettimeouts) // calibration.MAX_FAILURES
+    ceiling = max(calibration.PROBE_TIMEOUT, timeout)
+    assert max(dev.quiettimeouts) <= ceiling
+    if latency < 0.1:
+        # loosening from a tight timeout runs out of rounds first
+        assert bursts == VERIFY_ROUNDS
+    else:
+        assert max(dev.quiettimeouts) == ceiling
+        assert bursts < VERIFY_ROUNDS
+    assert (dev.timeout, dev.retries, dev.kline_wait, dev.kline_timeout) == (timeout, 3, 0.005, 0.2)
+
+
+def test_cancelled(clock):
+    dev = FakeDevice(clock)
+    result = Calibration(dev, dev.request, running=lambda: dev.requests < 50).run()
+    assert not result["ok"]
+    assert result["reason"] == "cancelled"
+    assert dev.requests == 50
+    assert dev.timeout == 0.5
+
+
+def test_no_kline(clock):
+    dev = FakeDevice(clock, min_wait=1.0)
+    result = Calibration(dev, dev.request).run()
+    assert not result["ok"]
+    assert dev.requests == 0
+    assert "Settings left unchanged" in format_report(result)
+
+
+def test_choose_retries():
+    assert choose_retries(0) == 1
+    assert choose_retries(0.5) == calibration.MAX_RETRIES
+    assert choose_retries(1) == calibration.MAX_RETRIES
+    assert choose_retries(0.01) == 2
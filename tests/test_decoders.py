@@ -0,0 +1,141 @@
+import random
+import struct
+
+import numpy as np
+import pytest
+
+from datalog.decoders import get_decoder
+
+# where the datalog panel used to find each sensor in its prepared list
+MAIN_INDEX = {
+    "Engine speed": 0, "TPS voltage": 1, "TPS sensor": 2, "ECT voltage": 3, "ECT sensor": 4, "IAT voltage": 5,
+    "IAT sensor": 6, "MAP voltage": 7, "MAP sensor": 8, "Battery voltage": 11, "Vehicle speed": 12,
+    "Injector duration": 13, "Ignition advance": 14,
+}
+# the panel hid these for every table but 0x11
+IACV_INDEX = {"IACV pulse count": 15, "IACV command": 16}
+O2_INDEX = {"O2 sensor": 0, "STFT": 1, "O2 heater": 2}
+EGCV_INDEX = {"EGCV current": 5, "EGCV target": 6, "EGCV load": 7, "HESD current": 8, "HESD target": 9,
+              "HESD load": 10}
+
+
+def main_baseline(d, t):
+    # the struct formats and scaling the datalog panel applied before the tables were declarative
+    u = ">H12B"
+    if t != 0x13:
+        u += "HB"
+        if t == 0x11:
+            u += "BH"
+        elif t == 0x17:
+            u += "BB"
+    data = list(struct.unpack(u, d))
+    if t in [0x13, 0x17]:
+        data = data[:9] + [0xff, 0xff] + data[9:]
+    data[1] = round(data[1] / 0xff * 5.0, 2)
+    data[2] = round(data[2] / 1.6, 2)
+    data[3] = round(data[3] / 0xff * 5.0, 2)
+    data[4] = -40 + data[4]
+    data[5] = round(data[5] / 0xff * 5.0, 2)
+    data[6] = -40 + data[6]
+    data[7] = round(data[7] / 0xff * 5.0, 2)
+    data[8] = 10 * data[8]
+    data[11] = round(data[11] / 10, 2)
+    data[13] = round(data[13] / 0xffff * 265.5, 2)
+    data[14] = round(-64 + data[14] / 0xff * 127.5, 2)
+    if t in [0x11]:
+        data[16] = round(data[16] / 0xffff * 8.0, 4)
+    return data
+
+
+def o2_baseline(d):
+    data = list(struct.unpack(">3B", d))
+    data[0] = round(data[0] / 0xff * 5, 2)
+    data[1] = round(data[1] / 0xff * 2, 4)
+    data[2] = round(data[2] / 0xff * 5, 2)
+    return data
+
+
+def egcv_baseline(d):
+    data = list(struct.unpack(">7Bb%dB" % (len(d) - 8), d))
+    for i in [5, 6, 8, 9]:
+        if i < len(data):
+            data[i] = round(data[i] / 0xff * 5, 3)
+    return data
+
+
+def payloads(n, size, seed):
+    rand = random.Random(seed)
+    return [bytes(rand.randrange(256) for _ in range(size)) for _ in range(n)]
+
+
+def assert_labels(labels, baseline, index):
+    for name, i in index.items():
+        if i < len(baseline):
+            assert labels[name] == str(baseline[i]), name
+
+
+@pytest.mark.parametrize("table,size", [(0x10, 17), (0x11, 20), (0x13, 14), (0x17, 19)])
+def test_main_tables(table, size):
+    decoder = get_decoder(table)
+    assert decoder.size == size
+    index = dict(MAIN_INDEX, **IACV_INDEX) if table == 0x11 else MAIN_INDEX
+    for d in payloads(2000, size, table):
+        assert_labels(decoder.labels(d), main_baseline(d, table), index)
+
+
+@pytest.mark.parametrize("table", [0x20, 0x21])
+def test_o2_tables(table):
+    decoder = get_decoder(table)
+    for d in payloads(2000, 3, table):
+        assert_labels(decoder.labels(d), o2_baseline(d), O2_INDEX)
+
+
+@pytest.mark.parametrize("size", range(8, 14))
+def test_egcv_table(size):
+    decoder = get_decoder(0xd0)
+    for d in payloads(500, size, size):
+        labels = decoder.labels(d)
+        assert_labels(labels, egcv_baseline(d), EGCV_INDEX)
+        # the HESD fields an ECU did not send are left out rather than made up
+        assert len(labels) == min(size, len(decoder.names))
+
+
+@pytest.mark.parametrize("size", range(0, 8))
+def test_egcv_too_short(size):
+    with pytest.raises(struct.error):
+        get_decoder(0xd0).decode(bytes(size))
+
+
+def test_trailing_bytes_ignored():
+    decoder = get_decoder(0x10)
+    d = payloads(1, 17, 0)[0]
+    assert decoder.decode(d + b"\x01\x02") == decoder.decode(d)
+
+
+@pytest.mark.parametrize("table,size", [(0x10, 17), (0x11, 20), (0x13, 14), (0x17, 19), (0x20, 3), (0xd0, 13)])
+def test_decode_many(table, size):
+    decoder = get_decoder(table)
+    rows = payloads(200, size, table + 1)
+    columns = decoder.decode_many(np.frombuffer(b"".join(rows), dtype=np.uint8).reshape(len(rows), size))
+    for r, d in enumerate(rows):
+        values = decoder.values(d)
+        for name in decoder.names:
+            assert columns[name][r] == pytest.approx(values[name], abs=1e-9), name
+
+
+def test_decode_many_short_payloads():
+    decoder = get_decoder(0xd0)
+    rows = payloads(4, 13, 50)
+    lengths = np.array([8, 10, 11, 13])
+    columns = decoder.decode_many(np.frombuffer(b"".join(rows), dtype=np.uint8).reshape(4, 13), lengths)
+    for r, (d, n) in enumerate(zip(rows, lengths.tolist())):
+        values = decoder.values(d[:n])
+        for name in decoder.names:
+            if name in values:
+                assert columns[name][r] == pytest.approx(values[name], abs=1e-9), name
+            else:
+                assert np.isnan(columns[name][r]), name
+
+
+def test_unknown_table():
+    assert get_decoder(0x99) is None
@@ -0,0 +1,89 @@
+import glob
+import os
+import re
+
+import numpy as np
+import pytest
+
+from xdf.equations import EquationError, compile_equation
+
+XDFS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "xdfs")
+
+RAW = np.arange(1, 256, dtype=np.float64)
+
+INVERTIBLE = [
+    "X",
+    "X*0.045",
+    "X/1024*5",
+    "X * 0.3572 - 15.72",
+    "-40+X",
+    "100-X",
+    "-X",
+    "(X+3)*2/7",
+    "2*(X-1)^2",
+    "X^0.5",
+    "1000/X",
+    "2^X/1e3",
+    "-X^2",
+    "3*-X",
+    "1.5e1 + X",
+    ".5*x",
+]
+NOT_INVERTIBLE = ["X*X", "X+X", "5", "X*0", "0*X", "X^0", "(X-X)+1"]
+
+
+def python_value(equation, x):
+    return eval(equation.replace("^", "**").replace("x", "X"), {}, {"X": x})
+
+
+def xdf_equations():
+    equations = set()
+    for path in glob.glob(os.path.join(XDFS, "*", "*.xdf")):
+        with open(path, "r", encoding="utf-8", errors="replace") as fxdf:
+            equations.update(re.findall(r'equation="([^"]*)"', fxdf.read(), re.IGNORECASE))
+    return sorted(equations)
+
+
+@pytest.mark.parametrize("equation", INVERTIBLE + NOT_INVERTIBLE)
+def test_forward(equation):
+    eq = compile_equation(equation)
+    expected = [python_value(equation, x) for x in RAW.tolist()]
+    np.testing.assert_allclose(eq(RAW), expected, rtol=1e-12)
+    assert np.shape(eq(RAW)) == RAW.shape
+
+
+@pytest.mark.parametrize("equation", INVERTIBLE)
+def test_inverse(equation):
+    eq = compile_equation(equation)
+    assert eq.invertible
+    raw = RAW[:16] if "^X" in equation else RAW
+    np.testing.assert_allclose(eq.inverse(eq(raw)), raw, rtol=1e-9)
+
+
+@pytest.mark.parametrize("equation", NOT_INVERTIBLE)
+def test_not_invertible(equation):
+    eq = compile_equation(equation)
+    assert not eq.invertible
+    with pytest.raises(EquationError):
+        eq.inverse(RAW)
+
+
+def test_shipped_equations():
+    equations = xdf_equations()
+    assert len(equations) > 0
+    for equation in equations:
+        eq = compile_equation(equation)
+        assert eq.invertible, equation
+        np.testing.assert_allclose(eq.inverse(eq(RAW)), RAW, rtol=1e-9)
+
+
+def test_identity():
+    assert compile_equation("X").identity
+    assert compile_equation("  ").identity
+    assert not compile_equation("X*1").identity
+
+
+@pytest.mark.parametrize("equation", ["X+", "X**2", "sin(X)", "X Y"])
+def test_unsupported(equation):
+    with pytest.raises(EquationError):
+        compile_equation(equation)
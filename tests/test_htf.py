@@ -0,0 +1,98 @@
+import hashlib
+import io
+import tarfile
+
+import numpy as np
+import pytest
+
+from rom.catalog import BinCatalog
+from rom.htf import DELTA_EXT, MOD_EXT, encode_delta, read_htf, stream_patch, write_htf
+
+METAINFO = {"pn": "38770-AAA-001"}
+
+
+def tune(base):
+    mod = bytearray(base)
+    mod[0x100:0x140] = b"\x42" * 0x40
+    mod[0x1000] ^= 0xff
+    mod[-1] = 0x00
+    return mod
+
+
+@pytest.fixture
+def library(tmp_path):
+    base = np.random.RandomState(36).randint(0, 256, 0x4000).astype(np.uint8).tobytes()
+    (tmp_path / "A").mkdir()
+    (tmp_path / "A" / "38770-AAA-001.bin").write_bytes(base)
+    entry = {"file": "A/38770-AAA-001.bin", "pn": "38770-AAA-001", "size": len(base),
+             "sha256": hashlib.sha256(base).hexdigest(), "ecmid": None, "mapid": None}
+    return base, entry, BinCatalog({"images": [entry]}, str(tmp_path))
+
+
+def members(path):
+    with tarfile.open(path, "r:xz") as tar:
+        return [member.name for member in tar]
+
+
+def test_delta_round_trip():
+    base = bytes(range(256)) * 32
+    mod = tune(base)
+    assert stream_patch(bytearray(base), io.BytesIO(encode_delta(base, mod))) == mod
+    assert stream_patch(bytearray(base), io.BytesIO(encode_delta(base, base))) == bytearray(base)
+
+
+def test_delta_errors():
+    base = bytes(0x2000)
+    with pytest.raises(ValueError):
+        encode_delta(base, base[:-1])
+    delta = encode_delta(base, tune(base))
+    with pytest.raises(ValueError):
+        stream_patch(bytearray(base), io.BytesIO(delta[:-1]))
+    with pytest.raises(ValueError):
+        stream_patch(bytearray(base[:128]), io.BytesIO(delta))
+    with pytest.raises(ValueError):
+        stream_patch(bytearray(base), io.BytesIO(b"XXXX" + delta[4:]))
+
+
+def test_htf_delta_only(tmp_path, library):
+    base, entry, catalog = library
+    mod = tune(base)
+    path = str(tmp_path / "tune.htf")
+    write_htf(path, "tune", mod, METAINFO, base, entry)
+    assert members(path) == ["metainfo.json", "tune" + DELTA_EXT]
+    byts, metainfo = read_htf(path, catalog)
+    assert byts == mod
+    assert metainfo["base"]["sha256"] == entry["sha256"]
+    assert metainfo["sha256"] == hashlib.sha256(mod).hexdigest()
+
+
+def test_htf_without_base(tmp_path, library):
+    base, entry, catalog = library
+    path = str(tmp_path / "tune.htf")
+    write_htf(path, "tune", tune(base), METAINFO, base, entry)
+    with pytest.raises(ValueError, match="not in this build's bin library"):
+        read_htf(path, None)
+    # a base that no longer hashes to what the tune was made against is as good as missing
+    (tmp_path / "A" / "38770-AAA-001.bin").write_bytes(tune(base))
+    with pytest.raises(ValueError, match="not in this build's bin library"):
+        read_htf(path, catalog)
+
+
+def test_htf_full_fallback(tmp_path, library):
+    base, entry, catalog = library
+    mod = tune(base)
+    path = str(tmp_path / "tune.htf")
+    write_htf(path, "tune", mod, METAINFO, base, entry, full=True)
+    assert members(path) == ["metainfo.json", "tune" + DELTA_EXT, "tune" + MOD_EXT]
+    assert read_htf(path, None)[0] == mod
+    assert read_htf(path, catalog)[0] == mod
+
+
+def test_htf_plain(tmp_path):
+    mod = bytearray(b"\x01\x02\x03" * 100)
+    path = str(tmp_path / "tune.htf")
+    write_htf(path, "tune", mod, METAINFO)
+    assert members(path) == ["metainfo.json", "tune" + MOD_EXT]
+    byts, metainfo = read_htf(path)
+    assert byts == mod
+    assert "base" not in metainfo
@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pytest
+
+from rom.catalog import BinCatalog
+from rom.pack import CHUNK_RAW, CHUNK_ZLIB, PackStore, build_pack
+
+CHUNK = 1024
+
+
+@pytest.fixture
+def bins(tmp_path):
+    rand = np.random.RandomState(30)
+    dense = rand.randint(0, 256, 6 * CHUNK + 100).astype(np.uint8).tobytes()
+    sparse = bytes(bytearray(i % 8 for i in range(5 * CHUNK)))
+    images = {
+        "A/38770-AAA-001.bin": dense,
+        # shares every chunk but the last with the first image
+        "A/38770-AAA-002.bin": dense[:-100] + b"\x55" * 100,
+        "B/38770-BBB-001.bin": sparse,
+        "B/38770-BBB-002.bin": b"",
+    }
+    for name, byts in images.items():
+        path = tmp_path / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(byts)
+    (tmp_path / "B" / "notes.txt").write_bytes(b"not an image")
+    packpath = str(tmp_path / "bins.pack")
+    nimages, nchunks = build_pack(str(tmp_path), packpath, chunksize=CHUNK)
+    assert nimages == 4
+    assert nchunks == 7 + 1 + 1
+    with PackStore(packpath) as pack:
+        yield pack, images
+
+
+def test_images_read_back(bins):
+    pack, images = bins
+    assert pack.names() == sorted(images)
+    for name, byts in images.items():
+        assert pack.size(name) == len(byts)
+        assert pack.read_image(name) == byts
+
+
+def test_ranges_read_back(bins):
+    pack, images = bins
+    byts = images["A/38770-AAA-001.bin"]
+    for start, end in [(0, 10), (CHUNK - 3, CHUNK + 3), (100, 4 * CHUNK + 7), (len(byts) - 50, len(byts) + 50),
+                       (20, 20)]:
+        assert pack.read("A/38770-AAA-001.bin", start, end) == byts[start:end]
+        assert bytes(pack.view("A/38770-AAA-001.bin", start, end)) == byts[start:end]
+
+
+def test_chunk_codecs(bins):
+    pack, images = bins
+    codecs = [pack.chunks[cid][3] for cid in pack.images["A/38770-AAA-001.bin"]["chunks"]]
+    assert all(codec == CHUNK_RAW for codec in codecs[:-1])
+    assert set(pack.chunks[cid][3] for cid in pack.images["B/38770-BBB-001.bin"]["chunks"]) == {CHUNK_ZLIB}
+    # raw chunks are handed out of the map without a copy
+    assert isinstance(pack.view("A/38770-AAA-001.bin", 10, 20).obj, type(pack.mm))
+
+
+def test_cache_eviction(bins):
+    pack, images = bins
+    pack.cachesize = 1
+    for _ in range(2):
+        for name, byts in images.items():
+            assert pack.read_image(name) == byts
+    assert len(pack.cache) <= 1
+
+
+def test_catalog_falls_back_to_pack(tmp_path, bins):
+    pack, images = bins
+    name = "A/38770-AAA-002.bin"
+    entry = {"file": name, "pn": "38770-AAA-002", "size": len(images[name]), "sha256": "", "ecmid": None,
+             "mapid": None}
+    catalog = BinCatalog({"images": [entry]}, str(tmp_path), pack)
+    assert catalog.read(entry) == images[name]
+    os.remove(catalog.path(entry))
+    assert catalog.available(entry)
+    assert catalog.read(entry) == images[name]
+    catalog.pack = None
+    assert not catalog.available(entry)
+    with pytest.raises(OSError):
+        catalog.read(entry)
+
+
+def test_not_a_pack(tmp_path):
+    path = tmp_path / "bins.pack"
+    path.write_bytes(b"\x00" * 64)
+    with pytest.raises(ValueError):
+        PackStore(str(path))
@@ -0,0 +1,54 @@
+import struct
+
+import numpy as np
+import pytest
+
+from rom.checksum import checksum8bit, checksum8bitHonda
+from rom.writeplan import WritePlan
+
+
+def kline_frames(byts, offset=0, writesize=128):
+    # the frames write_flash used to build one at a time before they were planned up front
+    offseti = int(offset / 16)
+    z = int(writesize / 16)
+    maxi = int(len(byts) / writesize)
+    frames = []
+    for i in range(maxi):
+        bytstart = [s for s in struct.pack(">H", offseti + (z * i))]
+        if i + 1 == maxi:
+            bytend = [s for s in struct.pack(">H", 0)]
+        else:
+            bytend = [s for s in struct.pack(">H", offseti + (z * (i + 1)))]
+        d = list(byts[(i * writesize):((i + 1) * writesize)])
+        x = bytstart + d + bytend
+        frames.append([0x01, 0x06] + x + [checksum8bit(x), checksum8bitHonda(x)])
+    return frames
+
+
+@pytest.mark.parametrize("writesize", [128, 64])
+@pytest.mark.parametrize("offset", [0, 0x8000])
+def test_frames_match_kline_layout(writesize, offset):
+    byts = np.random.RandomState(writesize + offset).randint(0, 256, 4096 + 40).astype(np.uint8).tobytes()
+    plan = WritePlan(byts, offset, writesize)
+    expected = kline_frames(byts, offset, writesize)
+    assert len(plan) == len(expected)
+    for i, frame in enumerate(expected):
+        assert plan.frame(i).tolist() == frame
+        assert plan.address(i) == offset // 16 + i * writesize // 16
+        assert plan.expected(i) == offset // 16 + (i + 1) * writesize // 16
+
+
+def test_flat_image():
+    byts = b"\xff" * 1024
+    plan = WritePlan(byts, 0, 128)
+    assert [plan.frame(i).tolist() for i in range(len(plan))] == kline_frames(byts)
+
+
+def test_image_smaller_than_a_block():
+    with pytest.raises(ValueError):
+        WritePlan(b"\x00" * 64, 0, 128)
+
+
+def test_image_past_address_space():
+    with pytest.raises(ValueError):
+        WritePlan(b"\x00" * 256, 0x10000 * 16, 128)